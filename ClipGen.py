@@ -3,24 +3,24 @@ import os
 import json
 import logging
 import time
-from multiprocessing import Queue
-from multiprocessing.queues import Empty
 import threading
-import pyperclip
-from PIL import ImageGrab
+import multiprocessing
 from dotenv import load_dotenv
-import google.generativeai as genai
-from google.generativeai import GenerationConfig
-from mistralai import Mistral
-from groq import Groq
-import win32api
-import win32con
 from pynput import keyboard as pkb
 from PyQt5.QtCore import QTimer, Qt, pyqtSignal, QPoint
 from PyQt5.QtWidgets import QApplication
 import ctypes
 from ctypes import windll, c_int, byref
 from libs.ClipGen_view import ClipGenView
+from libs.ClipGen_hotkeys import MODIFIER_KEYS, normalize_key
+from libs.ClipGen_worker import WORKER_POOL_DEFAULTS, WorkerPool
+from libs.ClipGen_events import EventDispatcher
+from libs.ClipGen_clipboard import CLIPBOARD_DEFAULTS, copy_selection, create_clipboard_backend, paste_text
+from libs.ClipGen_streaming import LogSink, PasteSink, StreamCancelled, TypingSink
+from libs.ClipGen_jobs import CANCEL_DEFAULTS, CANCELLED, JobTracker
+from libs.ClipGen_core import ClipGenCore
+from libs.ClipGen_ipc import IPC_DEFAULTS, IpcClient, IpcError, IpcServer
+from libs.ClipGen_routing import PROVIDERS
 
 # Load .env variables
 load_dotenv()
@@ -46,83 +46,68 @@ DEFAULT_CONFIG = {
             "prompt": "Пожалуйста, исправь следующий текст...",
             "api_provider": "Gemini",
             "model": "gemini-2.0-flash-exp",
-            "type": "text"
+            "type": "text",
+            "output_budget": "correction"
         }
     ]
 }
 
-class ClipGen(ClipGenView):
+class ClipGen(ClipGenView, ClipGenCore):
     def __init__(self):
         self.load_settings()
         super().__init__()
         
-        # Initialize API clients
-        self.init_api_clients()
+        self.clipboard = create_clipboard_backend()
         
-        self.queue = Queue()
+        self.queue = EventDispatcher(self.dispatch_event)
         self.stop_event = threading.Event()
+        self.configure_worker_pool()
+        # API-Clients, Cache, Routing, Absicherung, Wiederholungen, Ratenlimits, Hotkey-Registry
+        self.init_core()
+        self.jobs = JobTracker()
+        self.cancel_settings = {**CANCEL_DEFAULTS, **self.config.get("cancel", {})}
         
         # Hotkey tracking
-        self.key_states = {key["combination"].lower(): False for key in self.config["hotkeys"]}
-        self.key_states["ctrl"] = False
-        self.key_states["alt"] = False
-        self.key_states["shift"] = False
+        self.modifier_mask = 0
         
         self.listener_thread = threading.Thread(target=self.hotkey_listener, args=(self.queue,), daemon=True)
         self.listener_thread.start()
-        self.check_queue()
+        self.queue.start()
         
         gui_handler = self.create_log_handler()
         gui_handler.setLevel(logging.INFO)
         gui_handler.setFormatter(logging.Formatter('%(message)s'))
         logger.addHandler(gui_handler)
         
+        self.stats_signal.connect(self.stats_label.setText)
         self.log_signal.emit("ClipGen запущен", "#FFFFFF")
         self.quit_signal.connect(self.real_closeEvent)
-
-    def init_api_clients(self):
-        """Initialize API clients for all providers"""
-        # Gemini
-        if self.config.get("gemini_api_key"):
-            genai.configure(api_key=self.config["gemini_api_key"])
-        
-        # Mistral
-        self.mistral_client = None
-        if self.config.get("mistral_api_key"):
-            self.mistral_client = Mistral(api_key=self.config["mistral_api_key"])
+        self.show_signal.connect(self.bring_to_front)
         
-        # Groq
-        self.groq_client = None
-        if self.config.get("groq_api_key"):
-            self.groq_client = Groq(api_key=self.config["groq_api_key"])
+        # Kommandozeile und zweiter Start leiten ihre Anfragen an diese Instanz weiter
+        self.ipc_server = IpcServer(self)
+        if {**IPC_DEFAULTS, **self.config.get("ipc", {})}["enabled"]:
+            self.ipc_server.start()
 
     def fetch_models_for_provider(self, provider):
         """Fetch available models from the provider's API"""
         try:
             models = []
+            if provider not in PROVIDERS:
+                raise Exception(f"{provider} hat keine eigenen Modelle, die Kandidaten werden im Hotkey festgelegt")
+            self.init_api_clients()
+            if not self.providers.has_client(provider):
+                raise Exception(f"{provider} API-Schlüssel fehlt")
             if provider == "Gemini":
-                if not self.config.get("gemini_api_key"):
-                    raise Exception("Gemini API-Schlüssel fehlt")
-                genai.configure(api_key=self.config["gemini_api_key"])
-                all_models = genai.list_models()
+                all_models = self.providers.client("Gemini").list_models()
                 models = [m.name for m in all_models if 'generateContent' in m.supported_generation_methods]
             
             elif provider == "Mistral":
-                if not self.mistral_client:
-                    if self.config.get("mistral_api_key"):
-                        self.mistral_client = Mistral(api_key=self.config["mistral_api_key"])
-                    else:
-                        raise Exception("Mistral API-Schlüssel fehlt")
-                response = self.mistral_client.models.list()
+                response = self.providers.mistral.models.list()
                 models = [m.id for m in response.data]
             
             elif provider == "Groq":
-                if not self.groq_client:
-                    if self.config.get("groq_api_key"):
-                        self.groq_client = Groq(api_key=self.config["groq_api_key"])
-                    else:
-                        raise Exception("Groq API-Schlüssel fehlt")
-                response = self.groq_client.models.list()
+                response = self.providers.groq.models.list()
                 models = [m.id for m in response.data]
 
             if not models:
@@ -161,179 +146,162 @@ class ClipGen(ClipGenView):
     def save_settings(self):
         with open("settings.json", "w", encoding="utf-8") as f:
             json.dump(self.config, f, ensure_ascii=False, indent=4)
+        if hasattr(self, "worker_pool"):
+            self.configure_worker_pool()
+        if hasattr(self, "rate_limiter"):
+            self.configure_core()
+        else:
+            self.rebuild_hotkeys()
+        if hasattr(self, "jobs"):
+            self.cancel_settings = {**CANCEL_DEFAULTS, **self.config.get("cancel", {})}
 
-    def process_text_with_provider(self, text, action, prompt, is_image=False, provider=None, model=None):
-        """Process text with selected provider"""
-        try:
-            hotkey = next((h for h in self.config["hotkeys"] if h["name"] == action), None)
-            combo = hotkey["combination"] if hotkey else ""
-            
-            provider = provider or hotkey.get("api_provider", "Gemini")
-            model = model or hotkey.get("model", "gemini-2.0-flash-exp")
-            
-            if provider == "Gemini":
-                return self._process_with_gemini(text, action, prompt, is_image, model)
-            elif provider == "Mistral":
-                return self._process_with_mistral(text, action, prompt, model)
-            elif provider == "Groq":
-                return self._process_with_groq(text, action, prompt, model)
-            else:
-                logger.error(f"[{combo}: {action}] Ungültiger Provider: {provider}")
-                return ""
-        except Exception as e:
-            logger.error(f"[{combo}: {action}] Fehler: {e}")
-            return ""
+    def configure_worker_pool(self):
+        """Erstellt den Worker-Pool bzw. übernimmt geänderte Limits aus der Konfiguration"""
+        settings = {**WORKER_POOL_DEFAULTS, **self.config.get("worker_pool", {})}
+        if hasattr(self, "worker_pool"):
+            self.worker_pool.configure(**settings)
+        else:
+            self.worker_pool = WorkerPool(**settings, on_stats=self.publish_stats)
 
-    def _process_with_gemini(self, text, action, prompt, is_image, model):
-        """Process with Google Gemini"""
-        hotkey = next((h for h in self.config["hotkeys"] if h["name"] == action), None)
-        combo = hotkey["combination"] if hotkey else ""
-        
-        try:
-            if is_image:
-                image = ImageGrab.grabclipboard()
-                if not image:
-                    logger.warning(f"[{combo}: {action}] Буфер обмена пуст")
-                    return ""
-                response = genai.GenerativeModel(model).generate_content(
-                    contents=[prompt, image],
-                    generation_config=GenerationConfig(temperature=0.7, max_output_tokens=2048)
-                )
-            else:
-                full_prompt = prompt + text
-                response = genai.GenerativeModel(model).generate_content(
-                    full_prompt,
-                    generation_config=GenerationConfig(temperature=0.7, max_output_tokens=2048)
-                )
-            
-            result = response.text.strip() if response and response.text else ""
-            logger.info(f"[{combo}: {action}] Processed: {result}")
-            return result
-        except Exception as e:
-            logger.error(f"[{combo}: {action}] Gemini Error: {e}")
-            return ""
+    def publish_stats(self):
+        """Aktualisiert die Statuszeile unter den Logs"""
+        stats = self.worker_pool.stats()
+        parts = [
+            f"Очередь: {stats['pending']} (макс. {stats['max_depth']})",
+            f"Выполняется: {stats['running']}",
+            f"Ожидание: Ø {stats['wait_avg_ms']:.0f} мс, макс. {stats['wait_max_ms']:.0f} мс",
+            f"Отброшено: {stats['dropped'] + stats['rejected'] + stats['coalesced']}",
+        ]
+        if hasattr(self, "jobs"):
+            cancelled = self.jobs.stats()["cancelled"] + stats["cancelled"]
+            if cancelled:
+                parts.append(f"Отменено: {cancelled}")
+        if hasattr(self, "response_cache") and self.response_cache.enabled:
+            cache = self.response_cache.stats()
+            parts.append(f"Кэш: {cache['hits']} попаданий / {cache['misses']} промахов")
+            if cache["image_hits"] + cache["image_misses"]:
+                parts.append(f"Кэш изображений: {cache['image_hits']}/{cache['image_hits'] + cache['image_misses']}")
+        if getattr(self, "batch_progress", None):
+            parts.extend(f"Пакет: {done}/{total}" for done, total in list(self.batch_progress.values()))
+        if hasattr(self, "hedge_stats") and self.hedge_stats.requests:
+            hedge = self.hedge_stats.stats()
+            parts.append(f"Хедж: {hedge['hedge_rate']:.0%}, запасной быстрее: {hedge['secondary_wins']}")
+        if hasattr(self, "single_flight"):
+            saved = self.single_flight.stats()["saved"]
+            if saved:
+                parts.append(f"Дубли: {saved} вызовов сэкономлено")
+        if hasattr(self, "rate_limiter"):
+            quotas = []
+            for provider, quota in self.rate_limiter.remaining().items():
+                if quota["per_day"] is not None and quota["today"]:
+                    quotas.append(f"{provider} {quota['per_day'] - quota['today']}/{quota['per_day']}")
+                if quota["waiting"]:
+                    quotas.append(f"{provider} ждут: {quota['waiting']}")
+            if quotas:
+                parts.append(f"Квота: {', '.join(quotas)}")
+        self.stats_signal.emit(" | ".join(parts))
 
-    def _process_with_mistral(self, text, action, prompt, model):
-        """Process with Mistral"""
-        if not self.mistral_client:
-            logger.error("Mistral client not initialized")
-            return ""
-        
-        hotkey = next((h for h in self.config["hotkeys"] if h["name"] == action), None)
-        combo = hotkey["combination"] if hotkey else ""
-        
-        try:
-            full_prompt = prompt + text
-            response = self.mistral_client.chat.complete(
-                model=model,
-                messages=[{"role": "user", "content": full_prompt}],
-                temperature=0.7,
-                max_tokens=2048
-            )
-            result = response.choices[0].message.content.strip() if response else ""
-            logger.info(f"[{combo}: {action}] Processed: {result}")
-            return result
-        except Exception as e:
-            logger.error(f"[{combo}: {action}] Mistral Error: {e}")
-            return ""
+    def continue_stream_below(self, hotkey, sink):
+        """Neue Zeile für die live im Log angezeigte Antwort unter einer Statusmeldung"""
+        if sink is not None and sink.logs_output:
+            self.log_signal.emit("", hotkey.log_color)
 
-    def _process_with_groq(self, text, action, prompt, model):
-        """Process with Groq"""
-        if not self.groq_client:
-            logger.error("Groq client not initialized")
-            return ""
-        
-        hotkey = next((h for h in self.config["hotkeys"] if h["name"] == action), None)
-        combo = hotkey["combination"] if hotkey else ""
-        
-        try:
-            full_prompt = prompt + text
-            response = self.groq_client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": full_prompt}],
-                temperature=0.7,
-                max_tokens=2048
-            )
-            result = response.choices[0].message.content.strip() if response else ""
-            logger.info(f"[{combo}: {action}] Processed: {result}")
-            return result
-        except Exception as e:
-            logger.error(f"[{combo}: {action}] Groq Error: {e}")
-            return ""
+    def create_stream_sink(self, hotkey):
+        """Liefert die Streaming-Senke für den Hotkey oder None (kein Streaming)"""
+        mode = hotkey.stream
+        if mode == "log":
+            color = hotkey.log_color
+            # Leere Zeile mit Einzug, in die die Fragmente geschrieben werden
+            self.log_signal.emit("", color)
+            return LogSink(lambda chunk: self.stream_signal.emit(chunk, color))
+        if mode == "type":
+            return TypingSink(pkb.Controller().type)
+        if mode == "paste":
+            return PasteSink()
+        return None
 
     def handle_text_operation(self, action, prompt, provider, model):
         """Handle text operation with specified provider"""
-        hotkey = next((h for h in self.config["hotkeys"] if h["name"] == action), None)
-        combo = hotkey["combination"] if hotkey else ""
+        hotkey = self.hotkey_registry.get(action)
+        combo = hotkey.combination if hotkey else ""
+        job = self.jobs.start(action, combo)
         
         try:
-            logger.info(f"[{combo}: {action}] Activated")
+            logger.info(f"[{combo}: {action}] Activated", extra={"action": action})
             
-            # Copy text from clipboard
-            win32api.keybd_event(win32con.VK_CONTROL, 0, 0, 0)
-            win32api.keybd_event(ord('C'), 0, 0, 0)
-            time.sleep(0.1)
-            win32api.keybd_event(ord('C'), 0, win32con.KEYEVENTF_KEYUP, 0)
-            win32api.keybd_event(win32con.VK_CONTROL, 0, win32con.KEYEVENTF_KEYUP, 0)
-            time.sleep(0.1)
+            # Copy text from clipboard: warten, bis die Anwendung die Zwischenablage aktualisiert hat
+            clipboard_settings = {**CLIPBOARD_DEFAULTS, **self.config.get("clipboard", {})}
+            is_image = hotkey.is_image
+            timeout = clipboard_settings["image_copy_timeout" if is_image else "copy_timeout"]
+            text, _ = copy_selection(self.clipboard, timeout)
+            if job.cancelled:
+                return
             
-            is_image = hotkey.get("type") == "image"
             if is_image:
-                processed_text = self.process_text_with_provider("", action, prompt, is_image=True, provider=provider, model=model)
-            else:
-                text = pyperclip.paste()
-                if not text.strip():
-                    logger.warning(f"[{combo}: {action}] Буфер обмена пуст")
-                    return
-                processed_text = self.process_text_with_provider(text, action, prompt, provider=provider, model=model)
+                text = ""
+            elif not text.strip():
+                logger.warning(f"[{combo}: {action}] Буфер обмена пуст")
+                return
+            sink = self.create_stream_sink(hotkey)
+            if sink is not None:
+                sink.cancel_event = job.cancel_event
+            processed_text = self.process_text_with_provider(text, action, prompt, is_image=is_image, provider=provider,
+                                                             model=model, sink=sink, cancel_event=job.cancel_event)
             
-            if processed_text:
-                pyperclip.copy(processed_text)
-                time.sleep(0.3)
-                win32api.keybd_event(win32con.VK_CONTROL, 0, 0, 0)
-                win32api.keybd_event(ord('V'), 0, 0, 0)
-                time.sleep(0.2)
-                win32api.keybd_event(ord('V'), 0, win32con.KEYEVENTF_KEYUP, 0)
-                win32api.keybd_event(win32con.VK_CONTROL, 0, win32con.KEYEVENTF_KEYUP, 0)
+            # Nach einem Abbruch nichts über die Auswahl des Benutzers einfügen
+            if processed_text and not job.cancelled and (sink is None or sink.pastes_result):
+                paste_text(self.clipboard, processed_text,
+                           clipboard_settings["copy_timeout"], clipboard_settings["paste_settle"])
+        except StreamCancelled:
+            pass
         except Exception as e:
             logger.error(f"[{combo}: {action}] Ошибка: {e}")
+        finally:
+            if self.jobs.finish(job) == CANCELLED:
+                logger.warning(f"[{combo}: {action}] Отменено через {job.elapsed:.2f} секунд",
+                               extra={"job": job.id, "job_state": CANCELLED})
+                self.publish_stats()
 
-    def check_queue(self):
-        def queue_worker():
-            while not self.stop_event.is_set():
-                try:
-                    event = self.queue.get(timeout=0.5)
-                    for hotkey in self.config["hotkeys"]:
-                        if hotkey["name"] == event:
-                            threading.Thread(
-                                target=self.handle_text_operation,
-                                args=(
-                                    hotkey["name"],
-                                    hotkey["prompt"],
-                                    hotkey.get("api_provider", "Gemini"),
-                                    hotkey.get("model", "gemini-2.0-flash-exp")
-                                ),
-                                daemon=True
-                            ).start()
-                            break
-                except Empty:
-                    continue
-                except Exception as e:
-                    logger.error(f"Error processing queue: {e}")
-        
-        threading.Thread(target=queue_worker, daemon=True).start()
+    def has_jobs(self):
+        """Laufen oder warten Aktivierungen, die sich abbrechen ließen?"""
+        return bool(self.jobs.running()) or self.worker_pool.stats()["pending"] > 0
+
+    def cancel_jobs(self, action=None):
+        """Bricht laufende und wartende Aktivierungen ab (action=None: alle); liefert deren Anzahl"""
+        jobs = self.jobs.cancel(action)
+        pending = self.worker_pool.cancel(action)
+        if jobs or pending:
+            labels = [f"{job.combo}: {job.action}" for job in jobs]
+            if pending:
+                labels.append(f"из очереди: {pending}")
+            logger.info(f"Отмена: {', '.join(labels)}", extra={"jobs": [job.id for job in jobs]})
+        return len(jobs) + pending
+
+    def dispatch_event(self, event):
+        """Übergibt eine Aktivierung (Hotkey oder Button) an den Worker-Pool"""
+        hotkey = self.hotkey_registry.get(event)
+        if hotkey is None:
+            return
+        self.worker_pool.submit(
+            hotkey.name,
+            hotkey.provider,
+            self.handle_text_operation,
+            hotkey.name,
+            hotkey.prompt,
+            hotkey.provider,
+            hotkey.model
+        )
 
     # В файле ClipGen.py замените метод create_log_handler следующим кодом:
 
     def create_log_handler(self):
         class LogHandler(logging.Handler):
-            def __init__(self, log_signal, action_colors, config):
+            def __init__(self, log_signal, registry):
                 super().__init__()
                 self.log_signal = log_signal
-                # Модифицируем словарь цветов, используя имя действия вместо комбинации клавиш
-                self.action_colors = {k["name"]: k["log_color"] for k in action_colors}
+                # Вызывается при каждой записи: после сохранения настроек видна новая таблица
+                self.registry = registry
                 self.start_times = {}
-                self.config = config
                 self.processed_activations = set()  # Для отслеживания обработанных активаций
                 
             def emit(self, record):
@@ -345,44 +313,46 @@ class ClipGen(ClipGenView):
                         return
                         
                     # Обрабатываем активацию действий
-                    if "Activated" in msg:
-                        # Извлекаем название действия из сообщения
-                        for combo, name in [(h["combination"], h["name"]) for h in self.config["hotkeys"]]:
-                            if name in msg:
-                                # Формируем уникальный идентификатор для активации
-                                timestamp = time.strftime('%H:%M:%S')
-                                activation_id = f"{combo}:{name}:{timestamp}"
-                                
-                                # Пропускаем, если такая активация уже была обработана
-                                if activation_id in self.processed_activations:
-                                    return
-                                    
-                                self.processed_activations.add(activation_id)
-                                self.start_times[name] = time.time()
-                                
-                                # Находим цвет для действия по его имени
-                                color = self.action_colors.get(name, "#FFFFFF")
-                                
-                                # Отправляем сообщение о действии
-                                formatted_msg = f"{combo}: {name} - {timestamp}"
-                                self.log_signal.emit(formatted_msg, color)
-                                return
+                    # Имя действия передаётся в записи лога (extra={"action": ...})
+                    hotkey = self.registry().get(getattr(record, "action", None))
+                    if hotkey is not None and "Activated" in msg:
+                        combo, name = hotkey.combination, hotkey.name
+                        # Формируем уникальный идентификатор для активации
+                        timestamp = time.strftime('%H:%M:%S')
+                        activation_id = f"{combo}:{name}:{timestamp}"
+                        
+                        # Пропускаем, если такая активация уже была обработана
+                        if activation_id in self.processed_activations:
+                            return
+                            
+                        self.processed_activations.add(activation_id)
+                        self.start_times[name] = time.time()
+                        
+                        # Отправляем сообщение о действии
+                        formatted_msg = f"{combo}: {name} - {timestamp}"
+                        self.log_signal.emit(formatted_msg, hotkey.log_color)
+                        return
                     
                     # Форматируем сообщения о завершении
-                    if "Processed:" in msg:
-                        for name, start_time in list(self.start_times.items()):
-                            if name in msg:
-                                elapsed = time.time() - self.start_times.pop(name)
-                                # Находим цвет для действия по его имени
-                                color = self.action_colors.get(name, "#FFFFFF")
-                                
-                                # Сначала отправляем сообщение о времени выполнения
-                                self.log_signal.emit(f"Выполнено за {elapsed:.2f} секунд", "#888888")
-                                
-                                # Затем отправляем результат
-                                result = msg.split("Processed:")[1].strip()
-                                self.log_signal.emit(result, color)
-                                return
+                    if hotkey is not None and "Processed:" in msg and hotkey.name in self.start_times:
+                        elapsed = time.time() - self.start_times.pop(hotkey.name)
+                        color = hotkey.log_color
+                        
+                        # Сначала отправляем сообщение о времени выполнения
+                        suffix = " (из кэша)" if getattr(record, "cached", False) else ""
+                        self.log_signal.emit(f"Выполнено за {elapsed:.2f} секунд{suffix}", "#888888")
+                        first_chunk = getattr(record, "first_chunk", None)
+                        if first_chunk is not None:
+                            self.log_signal.emit(f"Первый фрагмент через {first_chunk:.2f} секунд", "#888888")
+                        
+                        # Результат уже показан в логе по мере поступления
+                        if getattr(record, "streamed", False):
+                            return
+                        
+                        # Затем отправляем результат
+                        result = msg.split("Processed:")[1].strip()
+                        self.log_signal.emit(result, color)
+                        return
                                 
                     # Обрабатываем ошибки
                     if record.levelno >= logging.ERROR:
@@ -400,79 +370,52 @@ class ClipGen(ClipGenView):
                 except Exception as e:
                     print(f"Ошибка в обработчике логов: {e}")
         
-        return LogHandler(self.log_signal, self.config["hotkeys"], self.config)
+        return LogHandler(self.log_signal, lambda: self.hotkey_registry)
 
     def hotkey_listener(self, queue):
         def on_press(key, queue):
             try:
-                # Преобразуем ключ в строку для сравнения
-                key_str = str(key).lower().replace("key.", "").replace("'", "")
+                key_str = normalize_key(key)
                 
                 # Отслеживаем нажатия модификаторов
-                if key_str in ("ctrl_l", "ctrl_r"):
-                    self.key_states["ctrl"] = True
+                modifier = MODIFIER_KEYS.get(key_str)
+                if modifier:
+                    self.modifier_mask |= modifier
                     return
-                if key_str in ("alt_l", "alt_r"):
-                    self.key_states["alt"] = True
+                
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Key pressed: {key_str}, Modifiers: {self.modifier_mask:03b}")
+                
+                # Esc отменяет все выполняющиеся активации
+                if key_str == "esc" and self.cancel_settings["escape"] and self.cancel_jobs():
                     return
-                if key_str in ("shift_l", "shift_r"):
-                    self.key_states["shift"] = True
+                
+                # Проверяем комбинацию по предкомпилированной таблице
+                entry = self.hotkey_registry.lookup(self.modifier_mask, key_str)
+                if entry is None:
                     return
                 
-                # Логируем для отладки состояние клавиш
-                logger.debug(f"Key pressed: {key_str}, Modifiers: Ctrl={self.key_states['ctrl']}, Alt={self.key_states['alt']}, Shift={self.key_states['shift']}")
+                # Повторное нажатие того же хоткея отменяет его выполняющуюся активацию
+                if self.cancel_settings["repeat_hotkey"] and self.cancel_jobs(entry.name):
+                    if entry.has_modifiers:
+                        self.modifier_mask = 0
+                    return
                 
-                # Проверяем комбинации клавиш
-                for hotkey in self.config["hotkeys"]:
-                    combo_lower = hotkey["combination"].lower()
-                    
-                    # Преобразуем последний ключ в комбинации (после последнего '+')
-                    if "+" in combo_lower:
-                        combo_parts = combo_lower.split("+")
-                        last_key = combo_parts[-1].strip()
-                        
-                        # Проверяем модификаторы
-                        has_ctrl = "ctrl" in combo_lower
-                        has_alt = "alt" in combo_lower
-                        has_shift = "shift" in combo_lower
-                        
-                        # Для цифровых клавиш и клавиш F1-F12
-                        if (last_key == key_str or 
-                            (last_key.startswith("f") and key_str.startswith("f") and last_key == key_str) or
-                            (last_key.isdigit() and key_str.isdigit() and last_key == key_str)):
-                            
-                            # Проверяем, что все требуемые модификаторы нажаты и нет лишних
-                            if ((has_ctrl == self.key_states["ctrl"]) and 
-                                (has_alt == self.key_states["alt"]) and 
-                                (has_shift == self.key_states["shift"])):
-                                
-                                logger.info(f"[{hotkey['combination']}: {hotkey['name']}] Activated")
-                                queue.put(hotkey["name"])
-                                
-                                # Сбрасываем состояния
-                                self.key_states["ctrl"] = False
-                                self.key_states["alt"] = False
-                                self.key_states["shift"] = False
-                                return
-                    else:
-                        # Обработка одиночных клавиш (без модификаторов)
-                        if combo_lower == key_str:
-                            logger.info(f"[{hotkey['combination']}: {hotkey['name']}] Activated")
-                            queue.put(hotkey["name"])
-                            return
+                logger.info(f"[{entry.combination}: {entry.name}] Activated", extra={"action": entry.name})
+                queue.put(entry.name)
+                
+                # Сбрасываем состояния после комбинации с модификаторами
+                if entry.has_modifiers:
+                    self.modifier_mask = 0
                             
             except Exception as e:
                 logger.error(f"Error in on_press: {e}")
 
         def on_release(key, queue):
             try:
-                key_str = str(key).lower().replace("key.", "").replace("'", "")
-                if key_str in ("ctrl_l", "ctrl_r"):
-                    self.key_states["ctrl"] = False
-                if key_str in ("alt_l", "alt_r"):
-                    self.key_states["alt"] = False
-                if key_str in ("shift_l", "shift_r"):
-                    self.key_states["shift"] = False
+                modifier = MODIFIER_KEYS.get(normalize_key(key))
+                if modifier:
+                    self.modifier_mask &= ~modifier
             except Exception as e:
                 logger.error(f"Error in on_release: {e}")
 
@@ -480,9 +423,20 @@ class ClipGen(ClipGenView):
             self.stop_event.wait()
             listener.stop()
 
+    def rpc_show(self):
+        """Zweiter Start von ClipGen.py: Fenster dieser Instanz zeigen"""
+        self.show_signal.emit()
+
+    def rpc_stats(self):
+        return {**super().rpc_stats(), "worker_pool": self.worker_pool.stats(), "jobs": self.jobs.stats()}
+
     def real_closeEvent(self):
+        self.ipc_server.stop()
         self.save_settings()
         self.stop_event.set()
+        self.queue.close()
+        self.worker_pool.shutdown()
+        self.shutdown_core()
         if self.listener_thread.is_alive():
             self.listener_thread.join(timeout=1.0)
         QApplication.instance().quit()
@@ -501,6 +455,20 @@ def set_dark_titlebar(hwnd):
         print(f"Не удалось установить темную тему для заголовка: {e}")
 
 if __name__ == "__main__":
+    # Gebündelte Windows-Version: Kindprozesse von multiprocessing nicht als zweite GUI starten
+    multiprocessing.freeze_support()
+    # Läuft ClipGen schon, nur dessen Fenster zeigen: kein zweiter Hotkey-Listener
+    running = IpcClient.connect()
+    if running is not None:
+        try:
+            running.call("show")
+            shown = True
+        except IpcError:
+            # Instanz hat sich seit connect() beendet oder antwortet nicht mehr: normal starten
+            shown = False
+        running.close()
+        if shown:
+            sys.exit(0)
     app = QApplication(sys.argv)
     window = ClipGen()
     set_dark_titlebar(int(window.winId()))
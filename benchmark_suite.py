@@ -0,0 +1,1873 @@
+"""
+Benchmark-Suite für ClipGen.
+Misst die heißen Pfade der Anwendung lokal, ohne echte API-Aufrufe.
+
+Aufruf:
+    python benchmark_suite.py            # alle Benchmarks
+    python benchmark_suite.py hotkeys    # nur ausgewählte Abschnitte
+    python benchmark_suite.py checks     # nur die Regressionsprüfungen
+
+Schlägt eine Prüfung fehl, endet das Skript mit Exit-Code 1.
+"""
+
+import itertools
+import json
+import logging
+import os
+import socket
+import statistics
+import struct
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from libs.ClipGen_budget import estimate_tokens
+from libs.ClipGen_hotkeys import MODIFIER_KEYS, compile_hotkeys, normalize_key
+from libs.ClipGen_worker import OVERFLOW_POLICIES, WorkerPool
+from libs.ClipGen_events import EventDispatcher
+from libs.ClipGen_clipboard import FakeClipboard, copy_selection, paste_text
+from libs.ClipGen_cache import ResponseCache, make_key
+from libs.ClipGen_streaming import StreamSink, consume_stream, iter_openai_chunks
+
+# --- Hilfsfunktionen ---
+
+def measure_ns(func, iterations):
+    """Führt func wiederholt aus und liefert die mittlere Dauer in Nanosekunden."""
+    start = time.perf_counter_ns()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter_ns() - start) / iterations
+
+def print_header(title):
+    print(f"\n--- {title} ---")
+
+# Beschreibungen fehlgeschlagener Prüfungen; main() endet dann mit Exit-Code 1
+FAILED_CHECKS = []
+
+def check(ok, description):
+    """Gibt das Ergebnis einer Prüfung aus und merkt sich Fehlschläge."""
+    print(f"  Prüfung {'bestanden' if ok else 'FEHLGESCHLAGEN'}: {description}")
+    if not ok:
+        FAILED_CHECKS.append(description)
+    return ok
+
+# --- Lokaler Fake-Provider ---
+
+class FakeProviderServer:
+    """OpenAI-kompatibler Chat-Server (Groq/Mistral) mit skriptbaren Verzögerungen.
+
+    first_token_delay ist eine Zahl oder eine Liste, die Anfrage für Anfrage
+    zyklisch durchlaufen wird. cancelled zählt Streams, die der Client vor dem
+    Ende geschlossen hat. Ist status nicht 200, beantwortet der Server jede
+    Anfrage mit diesem Fehlerstatus (simulierter Ausfall).
+
+    faults ist eine zyklisch durchlaufene Liste eingeschleuster Fehler pro
+    Anfrage: None (normale Antwort), ein HTTP-Status wie 429 oder 500,
+    "reset" (Verbindung ohne Antwort hart schließen) oder "hang" (hang_seconds
+    lang nicht antworten).
+
+    reply kann ebenfalls eine zyklische Liste sein oder eine Funktion, die
+    aus dem Anfrage-JSON die Antwort bildet. Ist context_tokens gesetzt,
+    werden längere Eingaben wie bei einem echten Modell mit 400 abgelehnt. max_tokens der Anfrage
+    wird beachtet, wobei jedes Fragment als ein Token zählt (dann finish_reason "length"); generated zählt
+    die tatsächlich gesendeten Fragmente. upload_rate (Bytes/s) simuliert
+    einen langsamen Upload: der Server wartet so lange, wie das Senden der
+    Anfrage gedauert hätte; received zählt die empfangenen Bytes.
+    """
+
+    def __init__(self, reply="Das ist eine korrigierte Antwort. " * 20, first_token_delay=0.3,
+                 chunk_delay=0.02, chunk_size=8, faults=None, hang_seconds=30, context_tokens=None,
+                 upload_rate=None):
+        self.replies = itertools.cycle(reply if isinstance(reply, (list, tuple)) else [reply])
+        self.delays = itertools.cycle(first_token_delay if isinstance(first_token_delay, (list, tuple))
+                                      else [first_token_delay])
+        self.chunk_delay = chunk_delay
+        self.chunk_size = chunk_size
+        self.requests = 0
+        self.cancelled = 0
+        self.generated = 0
+        self.status = 200
+        self.faults = itertools.cycle(faults or [None])
+        self.hang_seconds = hang_seconds
+        self.context_tokens = context_tokens
+        self.upload_rate = upload_rate
+        self.received = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-Alive, damit Clients ihre Verbindungen wiederverwenden können
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if server.upload_rate:
+                    time.sleep(length / server.upload_rate)
+                with server._lock:
+                    server.requests += 1
+                    server.received += length
+                    delay = next(server.delays)
+                    fault = next(server.faults)
+                    reply = next(server.replies)
+                if callable(reply):
+                    reply = reply(body)
+                try:
+                    if fault == "reset":
+                        # RST statt FIN: SO_LINGER mit Wartezeit 0
+                        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+                        self.close_connection = True
+                        self.connection.close()
+                        return
+                    if fault == "hang":
+                        time.sleep(server.hang_seconds)
+                        self.close_connection = True
+                        return
+                    server.handle_chat(self, body, delay, fault, reply)
+                except (BrokenPipeError, ConnectionResetError):
+                    with server._lock:
+                        server.cancelled += 1
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def chunks(self, reply, max_tokens=None):
+        chunks = [reply[i:i + self.chunk_size] for i in range(0, len(reply), self.chunk_size)]
+        return chunks[:max_tokens] if max_tokens else chunks
+
+    def handle_chat(self, handler, body, delay, fault=None, reply=""):
+        model = body.get("model", "fake-model")
+        chunks = self.chunks(reply, body.get("max_tokens"))
+        # Wie ein echtes Modell: am max_tokens-Limit endet die Antwort mit finish_reason "length"
+        finish_reason = "length" if len(chunks) < len(self.chunks(reply)) else "stop"
+        time.sleep(delay)
+        status = fault if isinstance(fault, int) else self.status
+        if self.context_tokens and status == 200:
+            if estimate_tokens("".join(m.get("content", "") for m in body.get("messages", []))) > self.context_tokens:
+                status = 400
+        if status != 200:
+            payload = json.dumps({"error": {"message": "simulierter Fehler", "type": "server_error"}}).encode("utf-8")
+            handler.send_response(status)
+            if status == 429:
+                handler.send_header("Retry-After", "0.2")
+            handler.send_header("Content-Type", "application/json")
+            handler.send_header("Content-Length", str(len(payload)))
+            handler.end_headers()
+            handler.wfile.write(payload)
+            return
+        if not body.get("stream"):
+            time.sleep(self.chunk_delay * len(chunks))
+            with self._lock:
+                self.generated += len(chunks)
+            payload = json.dumps({
+                "id": "fake", "object": "chat.completion", "created": 0, "model": model,
+                "choices": [{"index": 0, "finish_reason": finish_reason,
+                             "message": {"role": "assistant", "content": "".join(chunks)}}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            }).encode("utf-8")
+            handler.send_response(200)
+            handler.send_header("Content-Type", "application/json")
+            handler.send_header("Content-Length", str(len(payload)))
+            handler.end_headers()
+            handler.wfile.write(payload)
+            return
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        # Ohne Content-Length endet der Stream mit dem Schließen der Verbindung
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        for i, text in enumerate(chunks):
+            if i:
+                time.sleep(self.chunk_delay)
+            with self._lock:
+                self.generated += 1
+            event = {
+                "id": "fake", "object": "chat.completion.chunk", "created": 0, "model": model,
+                "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}],
+            }
+            handler.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            handler.wfile.flush()
+        event = {
+            "id": "fake", "object": "chat.completion.chunk", "created": 0, "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}],
+        }
+        handler.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+        handler.wfile.write(b"data: [DONE]\n\n")
+        handler.wfile.flush()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+# --- Hotkey-Dispatch ---
+
+def generate_hotkeys(count):
+    """Erzeugt count eindeutige Hotkeys nach dem Muster der settings.json."""
+    modifiers = ["Ctrl", "Alt", "Shift", "Ctrl+Alt", "Ctrl+Shift", "Alt+Shift", "Ctrl+Alt+Shift"]
+    hotkeys = []
+    for i in range(count):
+        combination = f"{modifiers[i % len(modifiers)]}+F{i // len(modifiers) + 1}"
+        hotkeys.append({"combination": combination, "name": f"Aktion {i}"})
+    return hotkeys
+
+def legacy_on_press(key, key_states, hotkeys):
+    """Nachbildung der früheren linearen Suche in on_press (zum Vergleich)."""
+    key_str = str(key).lower().replace("key.", "").replace("'", "")
+    for hotkey in hotkeys:
+        combo_lower = hotkey["combination"].lower()
+        if "+" in combo_lower:
+            last_key = combo_lower.split("+")[-1].strip()
+            has_ctrl = "ctrl" in combo_lower
+            has_alt = "alt" in combo_lower
+            has_shift = "shift" in combo_lower
+            if last_key == key_str:
+                if ((has_ctrl == key_states["ctrl"]) and
+                    (has_alt == key_states["alt"]) and
+                    (has_shift == key_states["shift"])):
+                    return hotkey["name"]
+        elif combo_lower == key_str:
+            return hotkey["name"]
+    return None
+
+def bench_hotkey_dispatch():
+    """Kosten pro Tastendruck: lineare Suche gegen vorkompilierte Tabelle."""
+    print_header("Hotkey-Dispatch (ns pro Tastendruck)")
+    print(f"{'Hotkeys':>8} | {'Fall':<8} | {'linear':>10} | {'Tabelle':>10}")
+    for count in (10, 100, 1000):
+        hotkeys = generate_hotkeys(count)
+        table = compile_hotkeys(hotkeys)
+        last = hotkeys[-1]["combination"]
+        mask = 0
+        for part in last.lower().split("+")[:-1]:
+            mask |= MODIFIER_KEYS[part]
+        key_states = {
+            "ctrl": "ctrl" in last.lower(),
+            "alt": "alt" in last.lower(),
+            "shift": "shift" in last.lower(),
+        }
+        # "Treffer" = letzter Hotkey der Liste, "Tippen" = normale Taste ohne Hotkey
+        cases = {
+            "Treffer": (f"Key.{last.split('+')[-1].lower()}", key_states, mask),
+            "Tippen": ("'a'", {"ctrl": False, "alt": False, "shift": False}, 0),
+        }
+        iterations = max(1000, 200000 // count)
+        for case, (key, states, case_mask) in cases.items():
+            legacy = measure_ns(lambda: legacy_on_press(key, states, hotkeys), iterations)
+            compiled = measure_ns(lambda: table.lookup(case_mask, normalize_key(key)), 200000)
+            print(f"{count:>8} | {case:<8} | {legacy:>10.0f} | {compiled:>10.0f}")
+
+def bench_hotkey_registry():
+    """Kosten pro Aktivierung: sechs Suchen nach Aktionsnamen gegen Registry-Lookups."""
+    print_header("Hotkey-Registry (ns pro Aktivierung, 6 Suchen nach Name)")
+    print(f"{'Hotkeys':>8} | {'next(...)':>10} | {'Registry':>10}")
+    for count in (10, 100, 1000):
+        hotkeys = generate_hotkeys(count)
+        registry = compile_hotkeys(hotkeys)
+        # Ungünstigster Fall der früheren Suche: Aktion steht am Ende der Liste
+        action = hotkeys[-1]["name"]
+
+        def legacy():
+            for _ in range(6):
+                next((h for h in hotkeys if h["name"] == action), None)
+
+        def indexed():
+            for _ in range(6):
+                registry.get(action)
+
+        iterations = max(200, 100000 // count)
+        print(f"{count:>8} | {measure_ns(legacy, iterations):>10.0f} | {measure_ns(indexed, 100000):>10.0f}")
+
+# --- Worker-Pool ---
+
+def bench_worker_pool():
+    """Burst von 200 Aktivierungen: Threadanzahl und Warteschlange bleiben begrenzt."""
+    print_header("Worker-Pool (Burst mit 200 Aktivierungen à 20 ms)")
+    print(f"{'Strategie':<12} | {'Threads':>7} | {'ausgeführt':>10} | {'verworfen':>9} | {'Ø Warten':>9} | {'Dauer':>7}")
+    for policy in OVERFLOW_POLICIES:
+        baseline_threads = threading.active_count()
+        pool = WorkerPool(max_workers=4, max_pending=16, overflow_policy=policy, provider_limits={"Gemini": 2})
+        peak_threads = baseline_threads
+        start = time.perf_counter()
+        for i in range(200):
+            provider = "Gemini" if i % 2 else "Groq"
+            pool.submit(f"Aktion {i % 10}", provider, time.sleep, 0.02)
+            peak_threads = max(peak_threads, threading.active_count())
+        while True:
+            stats = pool.stats()
+            if stats["pending"] == 0 and stats["running"] == 0:
+                break
+            time.sleep(0.005)
+        elapsed = time.perf_counter() - start
+        pool.shutdown(wait=True)
+        discarded = stats["dropped"] + stats["rejected"] + stats["coalesced"]
+        print(f"{policy:<12} | {peak_threads - baseline_threads:>7} | {stats['completed']:>10} | "
+              f"{discarded:>9} | {stats['wait_avg_ms']:>6.0f} ms | {elapsed:>5.2f} s")
+
+# --- Ereigniskanal ---
+
+def percentile(values, p):
+    """Einfaches Perzentil ohne NumPy."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+def bench_event_core(idle_seconds=2.0, events=5000):
+    """Aufwachvorgänge im Leerlauf und Latenz Hotkey -> Dispatch."""
+    print_header(f"Ereigniskanal ({idle_seconds:.0f} s Leerlauf, {events} Ereignisse)")
+    latencies = []
+    done = threading.Event()
+
+    def handler(sent_at):
+        latencies.append(time.perf_counter_ns() - sent_at)
+        if len(latencies) == events:
+            done.set()
+
+    dispatcher = EventDispatcher(handler)
+    dispatcher.start()
+    time.sleep(idle_seconds)
+    idle_wakeups = dispatcher.wakeups
+    for _ in range(events):
+        dispatcher.put(time.perf_counter_ns())
+        # Einzelne Tastendrücke nachbilden statt eines Bursts
+        time.sleep(0.0002)
+    done.wait(10)
+    dispatcher.close(timeout=1.0)
+    print(f"EventDispatcher:       {idle_wakeups} Aufwachvorgänge im Leerlauf, "
+          f"Latenz p50 {percentile(latencies, 50) / 1000:.0f} µs, p99 {percentile(latencies, 99) / 1000:.0f} µs")
+    check(idle_wakeups == 0, "EventDispatcher wacht im Leerlauf nicht auf")
+    check(len(latencies) == events, "EventDispatcher stellt alle Ereignisse zu")
+    check(percentile(latencies, 50) < 1_000_000, "EventDispatcher: Median der Latenz unter 1 ms")
+
+    # Zum Vergleich: frühere multiprocessing.Queue mit 0,5 s Polling
+    from multiprocessing import Queue
+    from multiprocessing.queues import Empty
+    queue = Queue()
+    stop = threading.Event()
+    legacy = {"wakeups": 0, "latencies": []}
+
+    def legacy_worker():
+        while not stop.is_set():
+            try:
+                sent_at = queue.get(timeout=0.5)
+                legacy["latencies"].append(time.perf_counter_ns() - sent_at)
+            except Empty:
+                legacy["wakeups"] += 1
+
+    worker = threading.Thread(target=legacy_worker, daemon=True)
+    worker.start()
+    time.sleep(idle_seconds)
+    legacy_idle = legacy["wakeups"]
+    for _ in range(min(events, 1000)):
+        queue.put(time.perf_counter_ns())
+        time.sleep(0.0002)
+    time.sleep(0.2)
+    stop.set()
+    worker.join(1.0)
+    print(f"multiprocessing.Queue: {legacy_idle} Aufwachvorgänge im Leerlauf, "
+          f"Latenz p50 {percentile(legacy['latencies'], 50) / 1000:.0f} µs, "
+          f"p99 {percentile(legacy['latencies'], 99) / 1000:.0f} µs")
+
+# --- Streaming ---
+
+def fake_clients(server):
+    """Erstellt Groq- und Mistral-Clients, die auf den lokalen Fake-Server zeigen."""
+    clients = {}
+    try:
+        from groq import Groq
+        clients["Groq"] = Groq(api_key="test", base_url=server.url, max_retries=0)
+    except ImportError:
+        print("Hinweis: Paket 'groq' ist nicht installiert.")
+    try:
+        from mistralai import Mistral
+        clients["Mistral"] = Mistral(api_key="test", server_url=server.url)
+    except ImportError:
+        print("Hinweis: Paket 'mistralai' ist nicht installiert.")
+    return clients
+
+def bench_streaming():
+    """Zeit bis zur ersten sichtbaren Ausgabe: komplette Antwort gegen Streaming."""
+    from libs.ClipGen_streaming import iter_mistral_chunks
+
+    print_header("Streaming gegen lokalen Fake-Server")
+    server = FakeProviderServer()
+    params = dict(model="fake-model", messages=[{"role": "user", "content": "Text"}], max_tokens=2048)
+    try:
+        for provider, client in fake_clients(server).items():
+            if provider == "Groq":
+                complete = lambda: client.chat.completions.create(**params)
+                stream = lambda: iter_openai_chunks(client.chat.completions.create(**params, stream=True))
+            else:
+                complete = lambda: client.chat.complete(**params)
+                stream = lambda: iter_mistral_chunks(client.chat.stream(**params))
+
+            start = time.perf_counter()
+            full = complete().choices[0].message.content
+            blocking = time.perf_counter() - start
+
+            sink = StreamSink()
+            start = time.perf_counter()
+            streamed = consume_stream(stream(), sink)
+            total = time.perf_counter() - start
+            print(f"{provider:<8} ohne Streaming: erste Ausgabe nach {blocking:.2f} s")
+            print(f"{provider:<8} mit Streaming:  erste Ausgabe nach {sink.first_chunk_latency:.2f} s, "
+                  f"vollständig nach {total:.2f} s ({sink.chunks} Fragmente, "
+                  f"Text {'identisch' if streamed == full else 'ABWEICHEND'})")
+    finally:
+        server.close()
+
+# --- Provider-Handles ---
+
+def bench_provider_handles(requests=50):
+    """Overhead pro Anfrage: Modell/Client je Aufruf neu bauen gegen Registry."""
+    import google.generativeai as genai
+    from google.generativeai import GenerationConfig
+    from groq import Groq
+    from libs.ClipGen_providers import ProviderRegistry
+
+    print_header("Provider-Handles")
+    registry = ProviderRegistry()
+    registry.configure({"gemini_api_key": "test"})
+
+    def legacy_gemini():
+        genai.GenerativeModel("gemini-2.0-flash")
+        GenerationConfig(temperature=0.7, max_output_tokens=2048)
+
+    def cached_gemini():
+        registry.gemini_model("gemini-2.0-flash")
+        registry.generation_config(temperature=0.7, max_output_tokens=2048)
+
+    print(f"Gemini-Handle je Aufruf neu:  {measure_ns(legacy_gemini, 2000) / 1000:8.2f} µs")
+    print(f"Gemini-Handle aus Registry:   {measure_ns(cached_gemini, 2000) / 1000:8.2f} µs")
+
+    # Anfragen ohne Provider-Latenz: gemessen wird nur Client- und Verbindungsaufbau
+    server = FakeProviderServer(reply="OK", first_token_delay=0, chunk_delay=0)
+    params = dict(model="fake-model", messages=[{"role": "user", "content": "Text"}], max_tokens=16)
+    try:
+        def fresh_client():
+            client = Groq(api_key="test", base_url=server.url, max_retries=0)
+            client.chat.completions.create(**params)
+            client.close()
+
+        registry.configure({"groq_api_key": "test", "groq_base_url": server.url})
+        pooled = lambda: registry.groq.chat.completions.create(**params)
+        pooled()  # Verbindung aufbauen
+        for label, func in (("neuer Client je Anfrage", fresh_client), ("Client mit Verbindungspool", pooled)):
+            before = server.requests
+            elapsed = measure_ns(func, requests) / 1e6
+            print(f"Groq {label:<27} {elapsed:6.2f} ms/Anfrage ({server.requests - before} Anfragen)")
+    finally:
+        server.close()
+
+# --- Abgesicherte Anfragen ---
+
+def bench_hedging(requests=20):
+    """Tail-Latenz mit und ohne zweite Anfrage bei langsamem primärem Provider."""
+    from libs.ClipGen_hedging import HEDGE_DEFAULTS, SECONDARY, HedgeStats, LatencyTracker, hedge_delay, run_hedged
+    from libs.ClipGen_streaming import CollectSink
+
+    print_header("Hedged Requests gegen zwei Fake-Provider")
+    reply = "Korrigierter Text. " * 4
+    # Primär: meist 0,1 s, jede zehnte Anfrage hängt 1,5 s; Ersatz: konstant 0,25 s
+    primary = FakeProviderServer(reply=reply, first_token_delay=[0.1] * 9 + [1.5], chunk_delay=0.01)
+    secondary = FakeProviderServer(reply=reply, first_token_delay=0.25, chunk_delay=0.01)
+    params = dict(model="fake-model", messages=[{"role": "user", "content": "Text"}], max_tokens=2048)
+    try:
+        clients = [fake_clients(server).get("Groq") for server in (primary, secondary)]
+        if None in clients:
+            return
+
+        def attempt(client):
+            def run(cancel):
+                stream = client.chat.completions.create(**params, stream=True)
+                return consume_stream(iter_openai_chunks(stream), CollectSink(cancel))
+            return run
+
+        tracker = LatencyTracker()
+        baseline = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            attempt(clients[0])(None)
+            baseline.append(time.perf_counter() - start)
+            tracker.record("primary", "fake-model", baseline[-1])
+
+        stats = HedgeStats()
+        hedged = []
+        for _ in range(requests):
+            delay = hedge_delay(tracker, "primary", "fake-model", HEDGE_DEFAULTS)
+            start = time.perf_counter()
+            outcome = run_hedged(attempt(clients[0]), attempt(clients[1]), delay)
+            hedged.append(time.perf_counter() - start)
+            stats.record(outcome)
+            if outcome.winner != SECONDARY:
+                tracker.record("primary", "fake-model", hedged[-1])
+        time.sleep(0.3)  # abgebrochene Streams beim Server ankommen lassen
+
+        for label, values in (("nur primär", baseline), ("abgesichert", hedged)):
+            print(f"{label:<12} p50 {percentile(values, 50):.2f} s, p95 {percentile(values, 95):.2f} s, "
+                  f"max {max(values):.2f} s")
+        result = stats.stats()
+        print(f"Absicherungsquote {result['hedge_rate']:.0%}, Ersatz schneller: {result['secondary_wins']}, "
+              f"abgebrochene Streams: {primary.cancelled + secondary.cancelled}")
+    finally:
+        primary.close()
+        secondary.close()
+
+# --- Automatisches Routing ---
+
+def bench_routing(requests=30):
+    """Auto-Routing: feste Wahl gegen EWMA-Wahl, Neustart und Ausfall eines Providers."""
+    from libs.ClipGen_routing import Router
+
+    print_header("Auto-Routing gegen zwei Fake-Provider")
+    fast = FakeProviderServer(reply="OK", first_token_delay=0.05, chunk_delay=0)
+    slow = FakeProviderServer(reply="OK", first_token_delay=0.4, chunk_delay=0)
+    clients = {"Groq": fake_clients(fast).get("Groq"), "Mistral": fake_clients(slow).get("Mistral")}
+    if None in clients.values():
+        return
+    params = dict(model="fake-model", messages=[{"role": "user", "content": "Text"}], max_tokens=16)
+    candidates = [("Mistral", "fake-model"), ("Groq", "fake-model")]
+
+    def call(provider):
+        try:
+            if provider == "Groq":
+                clients["Groq"].chat.completions.create(**params)
+            else:
+                clients["Mistral"].chat.complete(**params)
+            return True
+        except Exception:
+            return False
+
+    def run(router, count, pinned=None):
+        timings, chosen, failures = [], [], 0
+        for _ in range(count):
+            provider, model = pinned or router.choose(candidates, 100)
+            start = time.perf_counter()
+            ok = call(provider)
+            elapsed = time.perf_counter() - start
+            router.record(provider, model, 100, False, elapsed, ok)
+            timings.append(elapsed)
+            chosen.append(provider)
+            failures += not ok
+        return timings, chosen, failures
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "routing_stats.json")
+        try:
+            router = Router(path=path)
+            timings, _, _ = run(router, requests // 3, pinned=candidates[0])
+            print(f"fest auf Mistral:  Ø {sum(timings) / len(timings):.3f} s")
+            timings, chosen, _ = run(router, requests)
+            print(f"auto:              Ø {sum(timings) / len(timings):.3f} s, "
+                  f"Groq in {chosen.count('Groq')}/{len(chosen)} Anfragen")
+
+            router.save()
+            restarted = Router(path=path)
+            print(f"nach Neustart:     erste Wahl {restarted.choose(candidates, 100)[0]}")
+
+            fast.status = 503
+            _, chosen, failures = run(restarted, requests // 3)
+            print(f"Groq ausgefallen:  {failures} Fehler, danach Mistral in "
+                  f"{chosen.count('Mistral')}/{len(chosen)} Anfragen")
+        finally:
+            fast.close()
+            slow.close()
+
+# --- Wiederholungen, Fristen, Circuit Breaker ---
+
+def bench_resilience(requests=12):
+    """Eingeschleuste Fehler: Wiederholungen, Frist bei hängendem Provider, Breaker schnell zu und wieder auf."""
+    from libs.ClipGen_resilience import ResilientCaller
+
+    print_header("Wiederholungen und Circuit Breaker gegen fehlerhaften Fake-Provider")
+    flaky = FakeProviderServer(reply="OK", first_token_delay=0.02, chunk_delay=0,
+                               faults=[429, None, 500, "reset", None, None])
+    hanging = FakeProviderServer(reply="OK", first_token_delay=0, chunk_delay=0, faults=["hang"], hang_seconds=5)
+    groq = fake_clients(flaky).get("Groq")
+    stuck = fake_clients(hanging).get("Groq")
+    if groq is None or stuck is None:
+        return
+    events = []
+    caller = ResilientCaller(lambda event: events.append(event.kind), deadline=5, max_retries=3,
+                             backoff_base=0.05, backoff_max=0.5, failure_threshold=3, reset_timeout=0.5)
+    params = dict(model="fake-model", messages=[{"role": "user", "content": "Text"}], max_tokens=16)
+
+    def attempt(client):
+        return lambda timeout: client.chat.completions.create(**params, timeout=timeout).choices[0].message.content
+
+    try:
+        ok = 0
+        start = time.perf_counter()
+        for _ in range(requests):
+            try:
+                ok += caller.call("Groq", attempt(groq)) == "OK"
+            except Exception:
+                pass
+        elapsed = time.perf_counter() - start
+        print(f"{ok}/{requests} erfolgreich trotz jeder zweiten fehlerhaften Antwort, "
+              f"{events.count('retry')} Wiederholungen, {elapsed:.2f} s")
+
+        start = time.perf_counter()
+        try:
+            caller.call("Hang", attempt(stuck), deadline=0.5)
+        except Exception as e:
+            print(f"hängender Provider: {type(e).__name__} nach {time.perf_counter() - start:.2f} s (Frist 0.5 s)")
+
+        events.clear()
+        flaky.status = 503
+        flaky.faults = itertools.cycle([None])
+        before = flaky.requests
+        timings = []
+        for _ in range(6):
+            start = time.perf_counter()
+            try:
+                caller.call("Groq", attempt(groq))
+            except Exception:
+                pass
+            timings.append(time.perf_counter() - start)
+        print(f"Ausfall: Breaker offen nach {flaky.requests - before} Fehlversuchen, erste Anfrage {timings[0]:.2f} s, "
+              f"abgelehnte danach Ø {sum(timings[1:]) / 5 * 1000:.2f} ms "
+              f"({events.count('circuit_rejected')} sofort abgelehnt)")
+
+        flaky.status = 200
+        time.sleep(0.6)
+        result = caller.call("Groq", attempt(groq))
+        print(f"nach reset_timeout: Probeanfrage {result!r}, Breaker {caller.breaker('Groq').state}")
+    finally:
+        flaky.close()
+        hanging.close()
+
+# --- Doppelte Aktivierungen ---
+
+def bench_single_flight(activations=4):
+    """Mehrfach ausgelöster Hotkey: Netzwerkaufrufe ohne und mit Zusammenlegen."""
+    from libs.ClipGen_singleflight import DROP, JOIN, SingleFlight
+
+    print_header(f"Doppelte Aktivierungen ({activations} gleichzeitig)")
+    server = FakeProviderServer(reply="OK", first_token_delay=0.2, chunk_delay=0)
+    groq = fake_clients(server).get("Groq")
+    if groq is None:
+        return
+    params = dict(model="fake-model", messages=[{"role": "user", "content": "Text"}], max_tokens=16)
+
+    def call():
+        return groq.chat.completions.create(**params).choices[0].message.content
+
+    def burst(run):
+        results = []
+        before = server.requests
+        threads = [threading.Thread(target=lambda: results.append(run())) for _ in range(activations)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+        return server.requests - before, time.perf_counter() - start, results
+
+    try:
+        requests, elapsed, _ = burst(call)
+        print(f"{'ohne:':<15}{requests} Anfragen, {elapsed:.2f} s")
+        for policy in (JOIN, DROP):
+            flight = SingleFlight()
+            requests, elapsed, results = burst(lambda: flight.run("key", call, policy))
+            answered = sum(1 for r in results if r.result)
+            print(f"{policy + ':':<15}{requests} Anfrage(n), {elapsed:.2f} s, {answered} Aktivierungen mit Ergebnis, "
+                  f"eingespart: {flight.stats()['saved']}")
+    finally:
+        server.close()
+
+# --- Ausgabebudget ---
+
+def bench_output_budget(requests=30):
+    """Korrekturen mit gelegentlich ausufernder Antwort: feste 2048 Tokens gegen Budget aus der Eingabelänge."""
+    from libs.ClipGen_budget import output_budget
+    from libs.ClipGen_streaming import CollectSink
+
+    print_header(f"Ausgabebudget ({requests} Korrekturen, jede zehnte ufert aus)")
+    text = "Das ist ein kurzer Satz mit einem Fehler drin, bitte korrigieren."
+    normal = "Das ist ein kurzer Satz mit einem Fehler darin, bitte korrigieren."
+    runaway = normal + " Außerdem möchte ich erklären, warum das so ist." * 40
+    # Ein Fragment von 4 Zeichen entspricht beim Fake-Server einem Token
+    server = FakeProviderServer(reply=[normal] * 9 + [runaway], first_token_delay=0.05, chunk_delay=0.003,
+                                chunk_size=4)
+    groq = fake_clients(server).get("Groq")
+    if groq is None:
+        return
+    budget = output_budget("correction", text)
+    print(f"Eingabe ~{estimate_tokens(text)} Tokens -> Budget {budget.limit}, max_tokens {budget.max_tokens}")
+
+    def run(max_tokens, limit=None):
+        timings = []
+        before = server.generated
+        for _ in range(requests):
+            params = dict(model="fake-model", messages=[{"role": "user", "content": text}], max_tokens=max_tokens)
+            start = time.perf_counter()
+            if limit is None:
+                groq.chat.completions.create(**params)
+            else:
+                sink = CollectSink()
+                sink.token_limit = limit
+                consume_stream(iter_openai_chunks(groq.chat.completions.create(**params, stream=True)), sink)
+            timings.append(time.perf_counter() - start)
+        return timings, server.generated - before
+
+    try:
+        for label, max_tokens, limit in (("fest 2048", 2048, None),
+                                         ("Budget", budget.max_tokens, None),
+                                         ("Budget + Stream", budget.max_tokens, budget.limit)):
+            timings, generated = run(max_tokens, limit)
+            print(f"{label:<16} p50 {percentile(timings, 50):.2f} s, p99 {percentile(timings, 99):.2f} s, "
+                  f"erzeugte Tokens {generated}")
+    finally:
+        server.close()
+
+# --- Lange Texte in Abschnitten ---
+
+def synthetic_document(pages=50, seed=7):
+    """Erzeugt einen Text mit etwa 500 Wörtern pro Seite in Absätzen und Sätzen."""
+    import random
+    rng = random.Random(seed)
+    words = ("der die das Text Satz wird wurde schnell langsam Modell Antwort Fehler korrigiert "
+             "ClipGen Zwischenablage Absatz Beispiel lang kurz und oder aber").split()
+    paragraphs = []
+    for _ in range(pages * 5):
+        sentences = [" ".join(rng.choice(words) for _ in range(rng.randint(6, 18))).capitalize() + "."
+                     for _ in range(rng.randint(4, 8))]
+        paragraphs.append(" ".join(sentences))
+    return "\n\n".join(paragraphs)
+
+def bench_chunking(pages=50):
+    """Langer Text: eine einzige Anfrage gegen parallele Abschnitte (Reihenfolge bleibt erhalten)."""
+    from libs.ClipGen_chunking import join_results, run_chunks, split_text
+    from libs.ClipGen_ratelimit import RateLimiter
+
+    text = synthetic_document(pages)
+    print_header(f"Abschnittsweise Verarbeitung ({pages} Seiten, ~{estimate_tokens(text)} Tokens)")
+    # Der Fake-Provider gibt die Eingabe zurück; die Dauer wächst mit der Länge der Antwort
+    server = FakeProviderServer(reply=lambda body: body["messages"][-1]["content"], first_token_delay=0.2,
+                                chunk_delay=0.002, chunk_size=64)
+    groq = fake_clients(server).get("Groq")
+    if groq is None:
+        return
+    limiter = RateLimiter({"Bench": {"requests_per_minute": 600, "tokens_per_minute": None,
+                                     "requests_per_day": None}}, path=None)
+
+    def call(chunk_text):
+        limiter.acquire("Bench", estimate_tokens(chunk_text) * 2)
+        return groq.chat.completions.create(model="fake-model", max_tokens=100000,
+                                            messages=[{"role": "user", "content": chunk_text}]
+                                            ).choices[0].message.content
+
+    try:
+        start = time.perf_counter()
+        single = call(text)
+        print(f"eine Anfrage:      {time.perf_counter() - start:.2f} s (Text identisch: {single == text})")
+        chunks = split_text(text, 1500)
+        for parallel in (1, 4, 8):
+            first = []
+            start = time.perf_counter()
+            results = run_chunks(chunks, lambda chunk: call(chunk.text), parallel,
+                                 lambda chunk, result: first or first.append(time.perf_counter() - start))
+            elapsed = time.perf_counter() - start
+            print(f"{len(chunks)} Abschnitte x{parallel}: {elapsed:.2f} s, erster Abschnitt nach {first[0]:.2f} s "
+                  f"(Text identisch: {join_results(chunks, results) == text})")
+    finally:
+        server.close()
+
+def bench_map_reduce(pages=50):
+    """Zusammenfassung eines langen Texts: Map über Abschnitte, Reduce stufenweise zu einer Antwort."""
+    from libs.ClipGen_chunking import map_reduce, split_text
+
+    text = synthetic_document(pages)
+    print_header(f"Map-Reduce ({pages} Seiten, ~{estimate_tokens(text)} Tokens, Kontext 8000 Tokens)")
+    summary = "Zusammenfassung: Der Abschnitt beschreibt Modelle, Antworten und Fehler in ClipGen. " * 6
+    server = FakeProviderServer(reply=summary, first_token_delay=0.3, chunk_delay=0.002, chunk_size=16,
+                                context_tokens=8000)
+    groq = fake_clients(server).get("Groq")
+    if groq is None:
+        return
+    usage = {"calls": 0, "input": 0, "output": 0}
+    lock = threading.Lock()
+
+    def call(prompt, chunk_text):
+        content = prompt + chunk_text
+        result = groq.chat.completions.create(model="fake-model", max_tokens=1024,
+                                              messages=[{"role": "user", "content": content}]
+                                              ).choices[0].message.content
+        with lock:
+            usage["calls"] += 1
+            usage["input"] += estimate_tokens(content)
+            usage["output"] += estimate_tokens(result)
+        return result
+
+    try:
+        try:
+            call("Fasse zusammen: ", text)
+            print("eine Anfrage:  erfolgreich")
+        except Exception as e:
+            print(f"eine Anfrage:  abgelehnt ({type(e).__name__}, Status {getattr(e, 'status_code', '?')})")
+        for chunk_tokens, reduce_tokens in ((1500, 3000), (1500, 300)):
+            usage.update(calls=0, input=0, output=0)
+            chunks = split_text(text, chunk_tokens)
+            start = time.perf_counter()
+            result, levels = map_reduce(chunks, lambda chunk_text: call("Fasse zusammen: ", chunk_text),
+                                        lambda partials, final: call("Vereinige: ", partials), reduce_tokens, 8)
+            print(f"Reduce bis {reduce_tokens} Tokens: {' -> '.join(map(str, levels + [1]))} in "
+                  f"{time.perf_counter() - start:.2f} s, {usage['calls']} Aufrufe, "
+                  f"~{usage['input']} Tokens ein / ~{usage['output']} aus, Ergebnis: {bool(result)}")
+    finally:
+        server.close()
+
+# --- Bilder ---
+
+def benchmark_images():
+    """test_images plus daraus gebaute Screenshots: 4K-Vollbild und zwei 4K-Monitore mit leerem zweiten Bildschirm."""
+    from PIL import Image
+
+    folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_images")
+    images = {}
+    for name in sorted(os.listdir(folder)):
+        try:
+            with Image.open(os.path.join(folder, name)) as image:
+                images[name] = image.convert("RGB")
+        except OSError:
+            continue  # z.B. Thumbs.db
+    if images:
+        sample = next(iter(images.values()))
+        screen = Image.new("RGB", (3840, 2160))
+        tile = sample.resize((sample.width * 2, sample.height * 2), Image.LANCZOS)
+        for y in range(0, screen.height, tile.height):
+            for x in range(0, screen.width, tile.width):
+                screen.paste(tile, (x, y))
+        images["4K-Vollbild"] = screen
+        desktop = Image.new("RGB", (7680, 2160), (0, 0, 0))
+        desktop.paste(screen.crop((0, 0, 1920, 1080)), (640, 540))
+        images["2x4K, ein Fenster"] = desktop
+    return images
+
+def bench_image_preprocessing(upload_rate=1_250_000):
+    """Bildgröße und Upload: unverändertes PNG gegen Zuschneiden, Verkleinern und JPEG (10 Mbit/s Upload)."""
+    import base64
+    import io
+    from libs.ClipGen_imaging import IMAGE_DEFAULTS, format_bytes, prepare_image
+
+    print_header(f"Vorverarbeitung von Bildern (Upload {upload_rate * 8 / 1_000_000:.0f} Mbit/s)")
+    server = FakeProviderServer(reply="Erkannter Text.", first_token_delay=0.3, chunk_delay=0.0,
+                                upload_rate=upload_rate)
+    groq = fake_clients(server).get("Groq")
+    if groq is None:
+        return
+
+    def send(data, mime_type):
+        url = f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+        groq.chat.completions.create(model="fake-model", max_tokens=64, messages=[{"role": "user", "content": [
+            {"type": "text", "text": "Erkenne den Text: "}, {"type": "image_url", "image_url": {"url": url}}]}])
+
+    try:
+        for name, image in benchmark_images().items():
+            start = time.perf_counter()
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG")
+            send(buffer.getvalue(), "image/png")
+            before = time.perf_counter() - start
+            print(f"{name} {image.width}x{image.height}:")
+            print(f"  PNG unverändert:  {format_bytes(buffer.tell()):>8}, gesamt {before:.2f} s")
+            for label, settings in (("vorverarbeitet", IMAGE_DEFAULTS),
+                                    ("OCR, Graustufen", {**IMAGE_DEFAULTS, "grayscale": True})):
+                start = time.perf_counter()
+                prepared = prepare_image(image, settings)
+                send(prepared.data, prepared.mime_type)
+                elapsed = time.perf_counter() - start
+                encoding = prepared.mime_type.split("/")[1].upper()
+                if prepared.quality:
+                    encoding += f" q{prepared.quality}"
+                print(f"  {label + ':':<17} {format_bytes(len(prepared.data)):>8}, gesamt {elapsed:.2f} s "
+                      f"({prepared.size[0]}x{prepared.size[1]} {encoding}, "
+                      f"Vorverarbeitung {prepared.seconds * 1000:.0f} ms)")
+    finally:
+        server.close()
+
+def bench_vision_encoding(attempts=4):
+    """Bild-Hotkeys mit Wiederholungen und Absicherung: pro Versuch neu kodieren gegen einmal kodieren."""
+    import base64
+    from libs.ClipGen_imaging import IMAGE_DEFAULTS, EncodedImage, prepare_image
+
+    print_header(f"Kodierung von Bildern für Vision-Anfragen ({attempts} Versuche: Wiederholungen + Absicherung)")
+    for name, image in benchmark_images().items():
+        start = time.perf_counter()
+        for _ in range(attempts):
+            prepared = prepare_image(image, IMAGE_DEFAULTS)
+            url = f"data:{prepared.mime_type};base64,{base64.b64encode(prepared.data).decode('ascii')}"
+        per_attempt = time.perf_counter() - start
+
+        start = time.perf_counter()
+        encoded = EncodedImage.from_prepared(prepare_image(image, IMAGE_DEFAULTS))
+        urls = {id(encoded.openai_part()["image_url"]["url"]) for _ in range(attempts)}
+        once = time.perf_counter() - start
+        assert len(urls) == 1 and encoded.data_url() == url
+        print(f"{name} {image.width}x{image.height}:")
+        print(f"  pro Versuch:  {attempts} Kodierungen, {per_attempt * 1000:7.0f} ms")
+        print(f"  einmal:       1 Kodierung,  {once * 1000:7.0f} ms ({per_attempt / once:.1f}x schneller)")
+
+
+def bench_file_batch(count=16, upload_rate=1_250_000):
+    """Kopierte Scans: nacheinander dekodieren und senden gegen Dekodier-Pool und parallele Anfragen."""
+    import base64
+    import random
+    from PIL import Image, ImageDraw
+    from libs.ClipGen_batch import BATCH_DEFAULTS, DecodePool, collect_files, load_image
+    from libs.ClipGen_chunking import run_chunks
+    from libs.ClipGen_imaging import IMAGE_DEFAULTS
+    from libs.ClipGen_ratelimit import RateLimiter
+
+    print_header(f"Stapel kopierter Dateien ({count} Scans A4 200 dpi, {BATCH_DEFAULTS['max_parallel']} parallel)")
+    server = FakeProviderServer(reply="Erkannter Text einer Seite.", first_token_delay=0.3, chunk_delay=0.0,
+                                upload_rate=upload_rate)
+    groq = fake_clients(server).get("Groq")
+    if groq is None:
+        return
+    limiter = RateLimiter({"Bench": {"requests_per_minute": 60, "tokens_per_minute": None,
+                                     "requests_per_day": None}}, path=None)
+
+    def send(prepared):
+        limiter.acquire("Bench", 1000)
+        url = f"data:{prepared.mime_type};base64,{base64.b64encode(prepared.data).decode('ascii')}"
+        return groq.chat.completions.create(model="fake-model", max_tokens=256, messages=[{"role": "user", "content": [
+            {"type": "text", "text": "Erkenne den Text: "}, {"type": "image_url", "image_url": {"url": url}}]}]
+                                            ).choices[0].message.content
+
+    rng = random.Random(5)
+    pool = DecodePool()
+    with tempfile.TemporaryDirectory() as folder:
+        for index in range(count):
+            page = Image.new("RGB", (1654, 2339), (250, 248, 240))
+            draw = ImageDraw.Draw(page)
+            for y in range(150, 2200, 40):
+                draw.text((150, y), " ".join(str(rng.randint(0, 99999)) for _ in range(12)), fill=(30, 30, 30))
+            page.save(os.path.join(folder, f"scan{index + 1}.png"))
+        batch = collect_files([folder], BATCH_DEFAULTS)
+        try:
+            start = time.perf_counter()
+            for file in batch.files:
+                send(load_image(file.path, IMAGE_DEFAULTS))
+            sequential = time.perf_counter() - start
+
+            start = time.perf_counter()
+            futures = pool.submit(batch.files, IMAGE_DEFAULTS)
+            results = run_chunks(batch.files, lambda file: send(futures[file.index].result()),
+                                 BATCH_DEFAULTS["max_parallel"])
+            parallel = time.perf_counter() - start
+            assert results is not None and len(results) == count
+            print(f"nacheinander:               {sequential:6.2f} s ({sequential / count * 1000:.0f} ms pro Datei)")
+            print(f"Thread-Pool + {BATCH_DEFAULTS['max_parallel']} Anfragen:   {parallel:6.2f} s "
+                  f"({sequential / parallel:.1f}x schneller, inkl. Start des Pools)")
+        finally:
+            pool.shutdown()
+            server.close()
+
+
+class FakeOcr:
+    """Simulierte Texterkennung für den Fake-Provider.
+
+    Kennt alle gerenderten Zeilen und ordnet jedes Textband im empfangenen
+    Bild der ähnlichsten Zeile zu; nebeneinander liegende Fenster werden
+    zeilenweise von links nach rechts gelesen. Bänder unter min_height Pixeln (zu stark
+    verkleinert) sind unleserlich, am Bildrand angeschnittene Zeilen werden
+    wie von einem Modell ausgelassen. Pro Megapixel kostet die Erkennung
+    seconds_per_megapixel.
+    """
+    SIGNATURE = (160, 10)
+    # Ab dieser Lücke (Pixel ohne Text) gehören zwei Textstücke einer Zeile zu verschiedenen Fenstern
+    COLUMN_GAP = 100
+
+    def __init__(self, min_height=7, seconds_per_megapixel=0.25):
+        self.min_height = min_height
+        self.seconds_per_megapixel = seconds_per_megapixel
+        self.texts = []
+        self.signatures = []
+
+    def render(self, lines, width=1200, line_height=22, margin=20, sidebar=0):
+        """Zeichnet die Zeilen untereinander auf eine weiße Seite und merkt sich ihre Signaturen.
+
+        sidebar: Breite einer hellgrauen Leiste am linken Rand (wie die Zeilennummern eines Editors);
+        dann gibt es keine einfarbigen Zeilen, an denen geschnitten werden könnte.
+        """
+        import numpy as np
+        from PIL import Image, ImageDraw
+
+        image = Image.new("RGB", (width, line_height * len(lines) + 2 * margin), "white")
+        draw = ImageDraw.Draw(image)
+        if sidebar:
+            draw.rectangle((0, 0, sidebar - 1, image.height), fill=(220, 220, 220))
+        for i, line in enumerate(lines):
+            draw.text((sidebar + margin, margin + i * line_height), line, fill="black")
+        gray = np.asarray(image.convert("L"))
+        for top, bottom in self.bands(gray):
+            self.signatures.append(self.signature(gray[top:bottom]))
+        self.texts.extend(lines)
+        return image
+
+    @staticmethod
+    def bands(gray):
+        """(oben, unten) jeder zusammenhängenden Zeilengruppe mit dunklen Pixeln."""
+        import numpy as np
+        ink = np.concatenate(([False], (gray < 128).any(axis=1), [False]))
+        edges = np.flatnonzero(ink[1:] != ink[:-1])
+        return list(zip(edges[::2], edges[1::2]))
+
+    def signature(self, band):
+        import numpy as np
+        from PIL import Image
+        columns = np.flatnonzero((band < 128).any(axis=0))
+        band = band[:, columns[0]:columns[-1] + 1]
+        sample = Image.fromarray(band).resize(self.SIGNATURE, Image.BOX)
+        return np.asarray(sample, dtype=np.float32).ravel()
+
+    def reply(self, body):
+        """Antwortfunktion für FakeProviderServer: erkennt das Bild aus der OpenAI-Vision-Anfrage."""
+        import base64
+        import io
+        import numpy as np
+        from PIL import Image
+
+        url = next(part["image_url"]["url"] for part in body["messages"][-1]["content"] if part["type"] == "image_url")
+        image = Image.open(io.BytesIO(base64.b64decode(url.split(",", 1)[1]))).convert("L")
+        time.sleep(image.width * image.height / 1e6 * self.seconds_per_megapixel)
+        gray = np.asarray(image)
+        signatures = np.stack(self.signatures)
+        lines = []
+        for top, bottom in self.bands(gray):
+            if top == 0 or bottom == gray.shape[0]:
+                continue
+            if bottom - top < self.min_height:
+                lines.append("[unleserlich]")
+                continue
+            band = gray[top:bottom]
+            ink = np.flatnonzero((band < 128).any(axis=0))
+            pieces = np.split(ink, np.flatnonzero(np.diff(ink) > self.COLUMN_GAP) + 1)
+            for piece in pieces:
+                distances = ((signatures - self.signature(band[:, piece[0]:piece[-1] + 1])) ** 2).sum(axis=1)
+                lines.append(self.texts[int(distances.argmin())])
+        return "\n".join(lines)
+
+def bench_tiled_ocr(upload_rate=1_250_000):
+    """Große Screenshots: eine Anfrage gegen parallele Kacheln (Fake-Vision-Provider mit simulierter Erkennung)."""
+    import base64
+    import difflib
+    import random
+    from PIL import Image
+    from libs.ClipGen_chunking import run_chunks
+    from libs.ClipGen_imaging import IMAGE_DEFAULTS, TILING_DEFAULTS, TileMerger, crop_borders, prepare_image, split_tiles
+    from libs.ClipGen_ratelimit import RateLimiter
+
+    print_header(f"Kachelweise Texterkennung (Upload {upload_rate * 8 / 1_000_000:.0f} Mbit/s, "
+                 f"{TILING_DEFAULTS['max_parallel']} parallel)")
+    rng = random.Random(3)
+    words = "der die das Text Satz Modell Antwort Fehler korrigiert ClipGen Zwischenablage Absatz Seite".split()
+
+    def lines(count, prefix):
+        return [f"{prefix}{i:03d} " + " ".join(rng.choice(words) for _ in range(rng.randint(8, 14)))
+                for i in range(count)]
+
+    ocr = FakeOcr()
+    scroll = ocr.render(lines(400, "S"))
+    editor = ocr.render(lines(300, "E"), sidebar=40)
+    left, right = lines(90, "L"), lines(90, "R")
+    desktop = Image.new("RGB", (7680, 2160), (200, 210, 220))
+    desktop.paste(ocr.render(left), (200, 40))
+    desktop.paste(ocr.render(right), (4200, 40))
+    cases = {f"{name} (Test-Bild)": (image, None) for name, image in benchmark_images().items()
+             if "x" not in name and "K" not in name}
+    cases.update({
+        "Scroll-Aufnahme": (scroll, ocr.texts[:400]),
+        "Editor mit Seitenleiste": (editor, ocr.texts[400:700]),
+        "2x4K, zwei Fenster": (desktop, left + right),
+    })
+
+    server = FakeProviderServer(reply=ocr.reply, first_token_delay=0.3, chunk_delay=0.004, chunk_size=16,
+                                upload_rate=upload_rate)
+    groq = fake_clients(server).get("Groq")
+    if groq is None:
+        return
+    limiter = RateLimiter({"Bench": {"requests_per_minute": 60, "tokens_per_minute": None,
+                                     "requests_per_day": None}}, path=None)
+
+    def recognize(image, settings):
+        prepared = prepare_image(image, settings)
+        limiter.acquire("Bench", 1000)
+        url = f"data:{prepared.mime_type};base64,{base64.b64encode(prepared.data).decode('ascii')}"
+        return groq.chat.completions.create(model="fake-model", max_tokens=100000, messages=[{"role": "user", "content": [
+            {"type": "text", "text": "Erkenne den Text: "}, {"type": "image_url", "image_url": {"url": url}}]}]
+                                            ).choices[0].message.content
+
+    def quality(text, expected):
+        if expected is None:
+            return ""
+        found = [line for line in text.splitlines() if line.strip()]
+        matcher = difflib.SequenceMatcher(None, found, expected, autojunk=False)
+        correct = sum(block.size for block in matcher.get_matching_blocks())
+        readable = [line for line in found if line != "[unleserlich]"]
+        duplicates = len(readable) - len(set(readable))
+        return f", Zeilen richtig {correct}/{len(expected)}, doppelt {duplicates}"
+
+    try:
+        for name, (image, expected) in cases.items():
+            print(f"{name} {image.width}x{image.height}:")
+            for label, settings in (("eine Anfrage", IMAGE_DEFAULTS),
+                                    ("eine Anfrage, volle Größe", {**IMAGE_DEFAULTS, "max_side": None})):
+                start = time.perf_counter()
+                text = recognize(image, settings)
+                print(f"  {label + ':':<27} {time.perf_counter() - start:5.2f} s{quality(text, expected)}")
+            start = time.perf_counter()
+            tiles = split_tiles(crop_borders(image, IMAGE_DEFAULTS), TILING_DEFAULTS).tiles
+            results = run_chunks(tiles, lambda tile: recognize(tile.image, IMAGE_DEFAULTS),
+                                 TILING_DEFAULTS["max_parallel"])
+            merger = TileMerger()
+            text = "".join(merger.add(tile, result) for tile, result in zip(tiles, results))
+            overlapping = sum(tile.overlaps for tile in tiles)
+            print(f"  {f'{len(tiles)} Kacheln ({overlapping} überlappend):':<27} {time.perf_counter() - start:5.2f} s"
+                  f"{quality(text, expected)}")
+    finally:
+        server.close()
+
+# --- Abbruch von Aktivierungen ---
+
+def bench_cancellation():
+    """Abbruch einer langen Generierung: wie schnell ist der Worker wieder frei?"""
+    from libs.ClipGen_jobs import JobTracker, run_cancellable
+    from libs.ClipGen_streaming import CollectSink, StreamCancelled
+
+    print_header("Abbruch laufender Aktivierungen (1 Worker, lange Antwort)")
+    server = FakeProviderServer(reply="Token " * 400, first_token_delay=0.1, chunk_delay=0.01, chunk_size=6)
+    groq = fake_clients(server).get("Groq")
+    if groq is None:
+        return
+    params = dict(model="fake-model", messages=[{"role": "user", "content": "Langer Text"}], max_tokens=2048)
+    # Lazy-Import der SDK-Ressourcen vor dem Start der Worker auslösen
+    groq.chat.completions
+    jobs = JobTracker()
+    pool = WorkerPool(max_workers=1, max_pending=4)
+
+    def activation(name, stream):
+        job = jobs.start(name)
+        try:
+            if stream:
+                sink = CollectSink(job.cancel_event)
+                consume_stream(iter_openai_chunks(groq.chat.completions.create(**params, stream=True)), sink)
+            else:
+                run_cancellable(lambda: groq.chat.completions.create(**params), job.cancel_event)
+        except StreamCancelled:
+            pass
+        finally:
+            jobs.finish(job)
+
+    try:
+        for stream in (True, False):
+            start = time.perf_counter()
+            activation("ohne Abbruch", stream)
+            full = time.perf_counter() - start
+            pool.submit("lang", "Groq", activation, "lang", stream)
+            next_job = threading.Event()
+            pool.submit("kurz", "Groq", next_job.set)
+            time.sleep(0.3)
+            cancelled_at = time.perf_counter()
+            jobs.cancel("lang")
+            next_job.wait()
+            print(f"{'Stream' if stream else 'ohne Stream':<12} volle Antwort {full:.2f} s, "
+                  f"nächster Job startet {(time.perf_counter() - cancelled_at) * 1000:.0f} ms nach dem Abbruch")
+        print(f"abgebrochene Streams laut Server: {server.cancelled}")
+    finally:
+        pool.shutdown()
+        server.close()
+
+# --- Ratenbegrenzung ---
+
+def bench_rate_limiter(burst=130):
+    """Burst über dem Minutenlimit: Anfragen warten statt zu scheitern; Tageszähler bleibt erhalten."""
+    from libs.ClipGen_ratelimit import RateLimiter
+
+    print_header("Ratenbegrenzung (120 Anfragen/Minute, 125/Tag)")
+    limits = {"Test": {"requests_per_minute": 120, "requests_per_day": 125}}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "quota_state.json")
+        limiter = RateLimiter(limits, path)
+        waits = []
+        granted = 0
+        start = time.perf_counter()
+        for _ in range(burst):
+            before = time.perf_counter()
+            granted += limiter.acquire("Test")
+            waits.append(time.perf_counter() - before)
+        elapsed = time.perf_counter() - start
+        queued = [w for w in waits if w > 0.01]
+        print(f"{granted} von {burst} erlaubt in {elapsed:.1f} s, {len(queued)} davon mussten warten "
+              f"(max {max(waits):.2f} s), {burst - granted} wegen Tageskontingent abgelehnt")
+        limiter.save()
+        restarted = RateLimiter(limits, path)
+        print(f"nach Neustart: heute {restarted.remaining()['Test']['today']} Anfragen gezählt")
+
+# --- Antwort-Cache ---
+
+def bench_response_cache(entries=1000):
+    """Latenz von Cache-Treffern im Speicher und auf der Platte."""
+    print_header(f"Antwort-Cache ({entries} Einträge)")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cache.sqlite3")
+        cache = ResponseCache(path=path, memory_entries=entries)
+        keys = [make_key("Gemini", "gemini-2.0-flash", "Korrigiere: ", f"Text Nummer {i} " * 20) for i in range(entries)]
+        start = time.perf_counter()
+        for key in keys:
+            cache.put(key, "Antwort " * 50)
+        put_us = (time.perf_counter() - start) / entries * 1e6
+
+        key_us = measure_ns(lambda: make_key("Gemini", "gemini-2.0-flash", "Korrigiere: ", "Text " * 200), 2000) / 1000
+        memory_us = measure_ns(lambda: cache.get(keys[entries // 2]), 20000) / 1000
+        miss_us = measure_ns(lambda: cache.get("fehlt"), 2000) / 1000
+        cache.close()
+
+        # Neuer Prozessstart: Speicher leer, Treffer kommen aus SQLite
+        cold = ResponseCache(path=path, memory_entries=1)
+        disk_us = measure_ns(lambda: cold.get(keys[0]) and cold.get(keys[1]), 2000) / 2000
+        cold.close()
+
+    print(f"Schlüssel berechnen (1 KB Text): {key_us:8.1f} µs")
+    print(f"Treffer im Speicher:             {memory_us:8.1f} µs")
+    print(f"Treffer aus SQLite:              {disk_us:8.1f} µs")
+    print(f"Fehlschlag:                      {miss_us:8.1f} µs")
+    print(f"Schreiben:                       {put_us:8.1f} µs")
+
+def text_screenshot(seed, size=(1200, 800)):
+    """Synthetischer Screenshot einer Textseite (gleiches Layout, je seed anderer Text)."""
+    import random
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    words = "der die das Text Satz Modell Antwort Fehler korrigiert ClipGen Zwischenablage Absatz".split()
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    for y in range(20, size[1] - 30, 22):
+        draw.text((20, y), " ".join(rng.choice(words) for _ in range(16)), fill="black")
+    return image
+
+def bench_image_cache(pages=6, entries=500):
+    """Bild-Hotkeys: exakter Schlüssel gegen Wahrnehmungs-Hash bei erneut kopierten und neu zugeschnittenen Screenshots."""
+    import hashlib
+    from PIL import Image
+    from libs.ClipGen_imaging import IMAGE_DEFAULTS, prepare_image
+
+    print_header(f"Bild-Cache ({pages} Textseiten, je 4 Aktivierungen)")
+    activations = []
+    for page in range(pages):
+        image = text_screenshot(page)
+        width, height = image.size
+        activations += [
+            (page, "Original", image),
+            (page, "erneut kopiert", image.copy()),
+            (page, "neu zugeschnitten", image.crop((3, 2, width - 4, height - 3))),
+            (page, "andere Zoomstufe", image.resize((width * 9 // 10, height * 9 // 10), Image.LANCZOS)),
+        ]
+    variants = [("exakt (SHA-256 der Bytes)", None)] + [
+        (f"{method}, Abstand <= {distance}", {**IMAGE_DEFAULTS, "hash": method, "max_distance": distance})
+        for method, distance in (("phash", 6), ("dhash", 6))]
+    with tempfile.TemporaryDirectory() as directory:
+        for label, settings in variants:
+            cache = ResponseCache(path=os.path.join(directory, f"{len(label)}.sqlite3"))
+            calls = wrong = 0
+            for page, _, image in activations:
+                prepared = prepare_image(image, settings or IMAGE_DEFAULTS)
+                if settings is None:
+                    fingerprint, distance = hashlib.sha256(prepared.data).digest(), 0
+                else:
+                    fingerprint, distance = prepared.fingerprint, settings["max_distance"]
+                hit = cache.get_image("scope", fingerprint, distance)
+                if hit is None:
+                    calls += 1
+                    cache.put_image("scope", fingerprint, f"Seite {page}")
+                elif hit[0] != f"Seite {page}":
+                    wrong += 1
+            stats = cache.stats()
+            print(f"{label:<26} Trefferquote {stats['image_hit_rate']:.0%}, Provider-Aufrufe {calls}/{len(activations)}, "
+                  f"falsche Treffer {wrong}")
+            cache.close()
+
+        cache = ResponseCache(path=None, image_entries=entries)
+        fingerprints = [os.urandom(8) for _ in range(entries)]
+        for fingerprint in fingerprints:
+            cache.put_image("scope", fingerprint, "Antwort")
+        lookup_us = measure_ns(lambda: cache.get_image("scope", fingerprints[0], 6), 200) / 1000
+        print(f"Suche unter {entries} Einträgen: {lookup_us:.0f} µs")
+
+# --- Zwischenablage ---
+
+def bench_cli(inputs=40):
+    """Kommandozeile: Startzeit ohne PyQt5/SDKs und Durchsatz bei begrenzter Parallelität (Fake-Provider)."""
+    import subprocess
+
+    print_header(f"Kommandozeile python -m clipgen ({inputs} Eingaben über stdin)")
+    root = os.path.dirname(os.path.abspath(__file__))
+
+    def elapsed(command, stdin=None):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=root, input=stdin, capture_output=True, text=True, check=True)
+        return time.perf_counter() - start
+
+    eager = "import libs.ClipGen_core, PyQt5.QtWidgets, google.generativeai, mistralai, groq"
+    print(f"Start mit GUI-Bibliothek und allen SDKs: {elapsed([sys.executable, '-c', eager]):5.2f} s")
+    print(f"Start python -m clipgen --help:          "
+          f"{elapsed([sys.executable, '-m', 'clipgen', '--help']):5.2f} s")
+
+    server = FakeProviderServer(reply="Korrigierter Text.", first_token_delay=0.3, chunk_delay=0.0)
+    lines = "".join(json.dumps({"id": i, "text": f"Eingabe {i}"}) + "\n" for i in range(inputs))
+    try:
+        # Kostenloses Groq-Kontingent (30/min) gegen ein bezahltes: das Ratenlimit gilt auch hier
+        for label, limits in (("Groq-Standardlimit", None),
+                              ("600 Anfragen/min", {"Groq": {"requests_per_minute": 600, "tokens_per_minute": None,
+                                                             "requests_per_day": None}})):
+            print(f"{label}:")
+            for parallel in (8,) if limits is None else (1, 4, 8):
+                with tempfile.TemporaryDirectory() as folder:
+                    settings = os.path.join(folder, "settings.json")
+                    with open(settings, "w", encoding="utf-8") as f:
+                        json.dump({"groq_api_key": "test", "groq_base_url": server.url, "cache": {"enabled": False},
+                                   "rate_limits": limits or {},
+                                   "hotkeys": [{"name": "Korrektur", "prompt": "Korrigiere: ", "api_provider": "Groq",
+                                                "model": "fake-model"}]}, f)
+                    seconds = elapsed([sys.executable, "-m", "clipgen", "run", "--settings", settings,
+                                       "--hotkey", "Korrektur", "-q", "-j", str(parallel), "-"], lines)
+                print(f"  {parallel} parallel: {seconds:6.2f} s gesamt ({inputs / seconds:5.1f} Eingaben/s)")
+    finally:
+        server.close()
+
+def bench_ipc(runs=5):
+    """Einzelaufruf der Kommandozeile: eigener Prozess (kalt) gegen Weiterleitung an eine laufende Instanz."""
+    import subprocess
+    from libs.ClipGen_core import HeadlessClipGen
+    from libs.ClipGen_ipc import IPC_PATH, IpcServer
+
+    print_header(f"Weiterleitung an laufende Instanz (Median aus {runs} Aufrufen, Fake-Provider 0.3 s)")
+    root = os.path.dirname(os.path.abspath(__file__))
+    server = FakeProviderServer(reply="Korrigierter Text.", first_token_delay=0.3, chunk_delay=0.0)
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            settings = os.path.join(folder, "settings.json")
+            config = {"groq_api_key": "test", "groq_base_url": server.url, "cache": {"enabled": False},
+                      "hotkeys": [{"name": "Korrektur", "prompt": "Korrigiere: ", "api_provider": "Groq",
+                                   "model": "fake-model"}]}
+            with open(settings, "w", encoding="utf-8") as f:
+                json.dump(config, f)
+
+            def median(extra, stdin=None):
+                timings = []
+                for i in range(runs):
+                    start = time.perf_counter()
+                    subprocess.run([sys.executable, "-m", "clipgen", *extra, "--settings", settings], cwd=root,
+                                   input=stdin and stdin.format(i=i), capture_output=True, text=True, check=True)
+                    timings.append(time.perf_counter() - start)
+                return statistics.median(timings)
+
+            commands = (("hotkeys", ["hotkeys"], None),
+                        ("run (1 Eingabe)", ["run", "--hotkey", "Korrektur", "-q", "-"], '"Eingabe {i}"\n'))
+            cold = {label: median(extra + ["--local"], stdin) for label, extra, stdin in commands}
+            # Die "GUI": derselbe Kern mit offener Schnittstelle, Clients schon warm
+            os.chdir(folder)
+            app = HeadlessClipGen(config)
+            ipc = IpcServer(app, os.path.join(folder, IPC_PATH))
+            ipc.start()
+            app.run_hotkey("Korrektur", "Aufwärmen")
+            try:
+                warm = {label: median(extra, stdin) for label, extra, stdin in commands}
+            finally:
+                ipc.stop()
+                app.shutdown_core()
+                os.chdir(cwd)
+    finally:
+        server.close()
+    print(f"{'Aufruf':<16} | {'eigener Prozess':>15} | {'weitergeleitet':>14}")
+    for label in cold:
+        print(f"{label:<16} | {cold[label]:>13.2f} s | {warm[label]:>12.2f} s")
+
+def legacy_clipboard_roundtrip(clipboard, result):
+    """Frühere feste Pausen aus handle_text_operation (zum Vergleich)."""
+    clipboard.send_copy()
+    time.sleep(0.1 + 0.1)
+    text = clipboard.get_text()
+    clipboard.set_text(result)
+    time.sleep(0.3)
+    clipboard.send_paste()
+    time.sleep(0.2)
+    return text
+
+def handshake_clipboard_roundtrip(clipboard, result):
+    text, _ = copy_selection(clipboard)
+    paste_text(clipboard, result)
+    return text
+
+def bench_clipboard_handshake():
+    """Overhead von Kopieren + Einfügen pro Aktivierung (ohne Provider-Aufruf).
+
+    Gemessen wird die Zeit bis zum Senden von Strg+V, also bis das Ergebnis sichtbar wird.
+    """
+    print_header("Zwischenablage: feste Pausen gegen Handshake (FakeClipboard)")
+    print(f"{'Reaktionszeit App':<18} | {'fest':>8} | {'korrekt':>7} | {'Handshake':>9} | {'korrekt':>7}")
+    for app_delay in (0.0, 0.005, 0.03, 0.25):
+        row = [f"{app_delay * 1000:>5.0f} ms".ljust(18)]
+        for roundtrip in (legacy_clipboard_roundtrip, handshake_clipboard_roundtrip):
+            clipboard = FakeClipboard(selection="Ausgewählter Text", app_delay=app_delay)
+            clipboard.set_text("Alter Inhalt")
+            start = time.perf_counter()
+            text = roundtrip(clipboard, "Ergebnis")
+            elapsed = clipboard.paste_sent_at - start
+            time.sleep(app_delay + 0.01)
+            ok = text == "Ausgewählter Text" and clipboard.pasted == ["Ergebnis"]
+            row.append(f"{elapsed * 1000:>6.0f} ms".rjust(8 if roundtrip is legacy_clipboard_roundtrip else 9))
+            row.append(("ja" if ok else "NEIN").rjust(7))
+        print(" | ".join(row))
+
+_qt_app = None
+
+def ensure_qt_app():
+    """Startet bei Bedarf eine QApplication (ohne Display: offscreen)."""
+    global _qt_app
+    from PyQt5.QtWidgets import QApplication
+    if QApplication.instance() is None:
+        if not os.environ.get("DISPLAY") and sys.platform.startswith("linux"):
+            os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        _qt_app = QApplication(sys.argv[:1])
+    return QApplication.instance()
+
+def clipboard_backends():
+    """Alle auf dieser Plattform verfügbaren Backends (Name -> Objekt)."""
+    import pyperclip
+    from libs import ClipGen_clipboard as clipboard
+
+    class PyperclipOnly(clipboard.ClipboardBackend):
+        # Ohne Tastatur-Controller: hier wird nur der Text-Transport gemessen
+        def get_text(self):
+            return pyperclip.paste()
+
+        def set_text(self, text):
+            pyperclip.copy(text)
+
+    backends = {"pyperclip": PyperclipOnly()}
+    if sys.platform == "win32":
+        backends["Win32"] = clipboard.Win32Clipboard()
+    if clipboard.QObject is not None and ensure_qt_app():
+        backends["QClipboard"] = clipboard.QtClipboard(send_keys=False)
+    return backends
+
+def bench_clipboard_backends():
+    """Text schreiben + lesen: pyperclip gegen native Backends."""
+    print_header("Zwischenablage-Backends (Schreiben + Lesen)")
+    payloads = {"1 KB": "a" * 1024, "100 KB": "ä" * 51200, "5 MB": "x" * (5 * 1024 * 1024)}
+    print(f"{'Backend':<12} | " + " | ".join(f"{name:>10}" for name in payloads))
+    backends = clipboard_backends()
+    for name, backend in backends.items():
+        row = []
+        for payload in payloads.values():
+            try:
+                iterations = 20 if len(payload) < 1024 * 1024 else 3
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    backend.set_text(payload)
+                    if backend.get_text() != payload:
+                        raise RuntimeError("Inhalt abweichend")
+                row.append(f"{(time.perf_counter() - start) / iterations * 1000:>7.2f} ms")
+            except Exception as e:
+                row.append(f"{'Fehler':>10}")
+                error = e
+        print(f"{name:<12} | " + " | ".join(row))
+        if "Fehler" in " ".join(row):
+            print(f"  {name}: {error}")
+
+    # Aufrufe aus einem Worker-Thread werden in den GUI-Thread umgeleitet
+    if "QClipboard" in backends:
+        from PyQt5.QtWidgets import QApplication
+        backend = backends["QClipboard"]
+        timings = []
+
+        def worker():
+            start = time.perf_counter()
+            for _ in range(100):
+                backend.set_text("a" * 1024)
+                backend.get_text()
+            timings.append((time.perf_counter() - start) / 100)
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        while thread.is_alive():
+            QApplication.processEvents()
+        print(f"QClipboard aus Worker-Thread (1 KB): {timings[0] * 1000:.2f} ms")
+
+# --- Regressionsprüfungen ---
+
+def check_split_text():
+    from libs.ClipGen_chunking import split_text
+
+    paragraph = "Das ist ein Satz. Noch ein etwas längerer Satz mit mehr Wörtern! Und eine Frage? "
+    texts = {
+        "Absätze": "\n\n".join(paragraph * (i + 1) for i in range(8)),
+        "führender Leerraum": "\n\n  \n" + paragraph * 20 + "\n\n\n",
+        "überlange Sätze": ("wort " * 400 + ". ") * 3,
+        "ein langes Wort": "x" * 5000,
+        "kurz": "Hallo",
+    }
+    for label, text in texts.items():
+        chunks = split_text(text, 50)
+        joined = "".join(chunk.text + chunk.separator for chunk in chunks)
+        check(joined == text and all(chunk.text.strip() for chunk in chunks)
+              and [chunk.index for chunk in chunks] == list(range(len(chunks))),
+              f"split_text setzt sich wieder zum Text zusammen ({label}, {len(chunks)} Abschnitte)")
+
+def check_hotkey_precedence():
+    from libs.ClipGen_hotkeys import MOD_CTRL
+
+    single_first = compile_hotkeys([{"combination": "F1", "name": "Einzeln"},
+                                    {"combination": "Ctrl+F1", "name": "Kombi"}])
+    combo_first = compile_hotkeys([{"combination": "Ctrl+F1", "name": "Kombi"},
+                                   {"combination": "F1", "name": "Einzeln"}])
+    check(single_first.lookup(MOD_CTRL, "f1").name == "Einzeln",
+          "Hotkey weiter oben gewinnt: Einzeltaste vor Kombination")
+    check(combo_first.lookup(MOD_CTRL, "f1").name == "Kombi" and combo_first.lookup(0, "f1").name == "Einzeln",
+          "Hotkey weiter oben gewinnt: Kombination vor Einzeltaste")
+    twice = compile_hotkeys([{"combination": "Ctrl+F2", "name": "Doppelt", "prompt": "erster"},
+                             {"combination": "Ctrl+F3", "name": "Doppelt", "prompt": "zweiter"}])
+    check(twice.get("Doppelt").prompt == "erster" and twice.by_combination("ctrl+f3").prompt == "zweiter",
+          "Gleicher Name: get() liefert den ersten Eintrag, by_combination() den passenden")
+
+def check_circuit_breaker():
+    from libs.ClipGen_resilience import CLOSED, OPEN, CircuitOpen, ResilientCaller
+
+    caller = ResilientCaller(max_retries=0, backoff_base=0.0, failure_threshold=2, reset_timeout=0.05)
+    calls = []
+
+    def failing(remaining):
+        calls.append(remaining)
+        raise ConnectionError("Verbindung abgebrochen")
+
+    for _ in range(2):
+        try:
+            caller.call("Bench", failing)
+        except ConnectionError:
+            pass
+    try:
+        caller.call("Bench", failing)
+        rejected = False
+    except CircuitOpen:
+        rejected = True
+    check(rejected and len(calls) == 2 and caller.breaker("Bench").state == OPEN,
+          "Circuit Breaker öffnet nach failure_threshold Fehlern und weist ohne Aufruf ab")
+    time.sleep(0.06)
+    check(caller.call("Bench", lambda remaining: "ok") == "ok" and caller.breaker("Bench").state == CLOSED,
+          "Circuit Breaker schließt nach erfolgreicher Probeanfrage")
+
+    # Lokal zurückgehaltene Anfragen (Tageskontingent) setzen die Fehlerserie nicht zurück
+    from libs.ClipGen_ratelimit import QuotaExhausted
+
+    def exhausted(remaining):
+        raise QuotaExhausted("Tageskontingent erschöpft")
+
+    for attempt in (failing, exhausted, failing):
+        try:
+            caller.call("Kontingent", attempt)
+        except (ConnectionError, QuotaExhausted):
+            pass
+    check(caller.breaker("Kontingent").state == OPEN,
+          "Circuit Breaker: erschöpftes Kontingent zählt nicht als Erfolg des Providers")
+
+def check_single_flight():
+    from libs.ClipGen_singleflight import DROP, DROPPED, JOIN, JOINED, LEADER, SingleFlight
+    from libs.ClipGen_streaming import StreamCancelled
+
+    for policy, expected in ((JOIN, {LEADER: "Antwort", JOINED: "Antwort"}), (DROP, {LEADER: "Antwort", DROPPED: None})):
+        flights = SingleFlight()
+        calls = []
+        started = threading.Event()
+        results = {}
+
+        def func():
+            calls.append(1)
+            started.set()
+            time.sleep(0.1)
+            return "Antwort"
+
+        leader = threading.Thread(target=lambda: results.setdefault("a", flights.run("Schlüssel", func, policy)))
+        leader.start()
+        started.wait(1.0)
+        second = flights.run("Schlüssel", func, policy)
+        leader.join()
+        roles = {flight.role: flight.result for flight in (results["a"], second)}
+        check(len(calls) == 1 and roles == expected and flights.in_flight() == 0,
+              f"SingleFlight '{policy}': ein Aufruf, zweite Aktivierung {second.role}")
+
+    flights = SingleFlight()
+    started = threading.Event()
+    errors = []
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("Providerfehler")
+
+    def leader_run():
+        try:
+            flights.run("Fehler", failing, JOIN)
+        except RuntimeError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=leader_run)
+    leader.start()
+    started.wait(1.0)
+    try:
+        flights.run("Fehler", failing, JOIN)
+    except RuntimeError as e:
+        errors.append(e)
+    leader.join()
+    check(len(errors) == 2, "SingleFlight 'join': Fehler des Aufrufs erreicht auch die angehängte Aktivierung")
+
+    flights = SingleFlight()
+    started = threading.Event()
+    leader_cancel = threading.Event()
+    calls = []
+    outcome = {}
+
+    def cancellable():
+        calls.append(1)
+        if len(calls) == 1:
+            started.set()
+            leader_cancel.wait(1.0)
+            raise StreamCancelled()
+        return "Antwort"
+
+    def cancelled_leader():
+        try:
+            flights.run("Abbruch", cancellable, JOIN, leader_cancel)
+        except StreamCancelled:
+            outcome["leader"] = "abgebrochen"
+
+    leader = threading.Thread(target=cancelled_leader)
+    leader.start()
+    started.wait(1.0)
+    threading.Timer(0.1, leader_cancel.set).start()
+    joined = flights.run("Abbruch", cancellable, JOIN, threading.Event())
+    leader.join()
+    check(outcome.get("leader") == "abgebrochen" and joined.role == LEADER and joined.result == "Antwort"
+          and len(calls) == 2 and flights.stats()["saved"] == 0,
+          "SingleFlight 'join': nach Abbruch des laufenden Aufrufs übernimmt die angehängte Aktivierung")
+
+def check_hedge_stream():
+    from libs.ClipGen_hedging import PRIMARY, HedgeStream, run_hedged
+    from libs.ClipGen_streaming import LogSink, consume_stream
+
+    shown = []
+    stream = HedgeStream(LogSink(shown.append))
+
+    def attempt(index, words, first_delay, pause):
+        def chunks():
+            time.sleep(first_delay)
+            for word in words:
+                yield word
+                time.sleep(pause)
+
+        def run(cancel):
+            result = consume_stream(chunks(), stream.attempt_sink(index, cancel))
+            return "" if stream.lost(index) else result
+        return run
+
+    # Die Absicherung ist schneller fertig, die primäre Anfrage hat aber zuerst Tokens geliefert
+    outcome = run_hedged(attempt(PRIMARY, ["Ers", "te"], 0.05, 0.2), attempt(1, ["Zwei", "te"], 0.1, 0.0), 0.02)
+    check(outcome.winner == PRIMARY and outcome.result == "Erste" and "".join(shown) == "Erste",
+          "Hedging mit Streaming: die zuerst streamende Anfrage gewinnt, das Log zeigt nur ihren Text")
+
+def check_truncated_reply():
+    from libs.ClipGen_budget import is_truncated
+    from libs.ClipGen_core import HeadlessClipGen
+
+    # 100 Fragmente: mehr als das geschätzte Korrekturbudget (64), weniger als dessen Obergrenze (2048)
+    reply = "Korrigierter Satz, Teil 1. " * 30
+    server = FakeProviderServer(reply=reply.strip(), first_token_delay=0.0, chunk_delay=0.0)
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            os.chdir(folder)
+            hotkeys = [{"name": "Korrektur", "prompt": "Korrigiere: ", "api_provider": "Groq", "model": "fake-model",
+                        "output_budget": "correction"},
+                       {"name": "Kurz", "prompt": "Erkläre: ", "api_provider": "Groq", "model": "fake-model",
+                        "output_budget": 32}]
+            app = HeadlessClipGen({"groq_api_key": "test", "groq_base_url": server.url, "hotkeys": hotkeys})
+            try:
+                first = app.run_hotkey("Korrektur", "Eingabe")["result"]
+                second = app.run_hotkey("Korrektur", "Eingabe")["result"]
+                check(first == reply.strip() and second == first and server.requests == 2,
+                      "Ausgabebudget ohne Streaming: abgeschnittene Antwort wird einmal ohne Schätzung wiederholt")
+                requests = server.requests
+                short = app.run_hotkey("Kurz", "Eingabe")["result"]
+                app.run_hotkey("Kurz", "Eingabe")
+                check(is_truncated(short) and len(short) < len(reply.strip()) and server.requests == requests + 2,
+                      "Ausgabebudget ohne Streaming: an der Obergrenze abgeschnittene Antwort landet nicht im Cache")
+            finally:
+                app.shutdown_core()
+                os.chdir(cwd)
+    finally:
+        server.close()
+
+def check_cancelled_call_stops():
+    from libs.ClipGen_core import HeadlessClipGen
+    from libs.ClipGen_streaming import StreamCancelled
+
+    # 100 Fragmente zu je 20 ms: ohne Abbruch liefe der verlassene Aufruf 2 s weiter
+    server = FakeProviderServer(reply="x" * 800, first_token_delay=0.1, chunk_delay=0.02)
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            os.chdir(folder)
+            app = HeadlessClipGen({"groq_api_key": "test", "groq_base_url": server.url, "cache": {"enabled": False},
+                                   "hotkeys": [{"name": "Lang", "prompt": "Schreibe: ", "api_provider": "Groq",
+                                                "model": "fake-model"}]})
+            try:
+                cancel = threading.Event()
+                threading.Timer(0.3, cancel.set).start()
+                start = time.perf_counter()
+                try:
+                    app.run_hotkey("Lang", "Eingabe", cancel_event=cancel)
+                except StreamCancelled:
+                    pass
+                returned = time.perf_counter() - start
+                time.sleep(0.5)
+                check(returned < 0.6 and server.cancelled == 1 and server.generated < 60,
+                      "Abbruch ohne Stream: der verlassene Provider-Aufruf endet beim nächsten Fragment")
+            finally:
+                app.shutdown_core()
+                os.chdir(cwd)
+    finally:
+        server.close()
+
+def check_shared_quota_file():
+    from libs.ClipGen_ratelimit import RateLimiter
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "quota_state.json")
+        # Wie GUI und model_test_suite.py: zwei Zähler auf derselben Datei
+        gui, suite = RateLimiter(path=path), RateLimiter(path=path)
+        for _ in range(3):
+            gui.acquire("Gemini")
+        for _ in range(2):
+            suite.acquire("Gemini")
+        gui.save()
+        suite.save()
+        with open(path, "r", encoding="utf-8") as f:
+            saved = json.load(f)["Gemini"]["used"]
+        restarted = RateLimiter(path=path).remaining()["Gemini"]["today"]
+        check(saved == 5 and suite.remaining()["Gemini"]["today"] == 5 and restarted == 5,
+              "Tageskontingent: zwei Prozesse auf derselben Datei überschreiben ihre Zählung nicht")
+
+def check_chunked_rate_limit():
+    from libs.ClipGen_chunking import split_text
+    from libs.ClipGen_core import HeadlessClipGen
+
+    text = "\n\n".join(f"Absatz {i}: " + "ein kurzer Satz mit einigen Wörtern darin " * 3 for i in range(3))
+    hotkey = {"name": "Abschnitte", "prompt": "Korrigiere: ", "api_provider": "Groq", "model": "fake-model",
+              "execution": "chunked", "chunking": {"threshold_tokens": 10, "chunk_tokens": 45, "max_parallel": 3}}
+    parts = len(split_text(text, 45))
+    cwd = os.getcwd()
+    for faults in (None, [None, None, 400, None, None, None]):
+        server = FakeProviderServer(reply="Teil.", first_token_delay=0.0, chunk_delay=0.0, faults=faults)
+        try:
+            with tempfile.TemporaryDirectory() as folder:
+                os.chdir(folder)
+                config = {"groq_api_key": "test", "groq_base_url": server.url, "hotkeys": [hotkey],
+                          "resilience": {"deadline": 0.5}}
+                if faults is None:
+                    # 100 Tokens/s bei leerem Bucket: jeder Abschnitt wartet länger als die Frist
+                    config["rate_limits"] = {"Groq": {"tokens_per_minute": 6000}}
+                app = HeadlessClipGen(config)
+                try:
+                    if faults is None:
+                        app.rate_limiter.acquire("Groq", 6000)
+                        result = app.run_hotkey("Abschnitte", text)["result"]
+                        check(result is not None and result.count("Teil.") == parts and server.requests == parts,
+                              "Abschnitte: Wartezeit im Ratenlimit zählt nicht gegen die Frist")
+                    else:
+                        failed = app.run_hotkey("Abschnitte", text)["result"]
+                        # Bereits gesendete Teile laufen nach dem Fehler noch zu Ende und landen im Cache
+                        time.sleep(0.3)
+                        retried = app.run_hotkey("Abschnitte", text)["result"]
+                        # Nur der gescheiterte Teil geht zweimal an den Provider
+                        check(failed is None and retried is not None and server.requests == parts + 1,
+                              "Abschnitte: nach einem Fehler sendet der nächste Lauf nur die fehlenden Teile")
+                finally:
+                    app.shutdown_core()
+                    os.chdir(cwd)
+        finally:
+            server.close()
+
+def bench_checks():
+    """Regressionsprüfungen für Abschnitte, Hotkey-Vorrang, Circuit Breaker, Zusammenlegen, Hedging, Budget, Ratenlimit und Abbruch."""
+    print_header("Regressionsprüfungen")
+    check_split_text()
+    check_hotkey_precedence()
+    check_circuit_breaker()
+    check_single_flight()
+    check_hedge_stream()
+    check_truncated_reply()
+    check_chunked_rate_limit()
+    check_shared_quota_file()
+    check_cancelled_call_stops()
+
+# --- Hauptlogik ---
+
+BENCHMARKS = {
+    "checks": bench_checks,
+    "hotkeys": bench_hotkey_dispatch,
+    "registry": bench_hotkey_registry,
+    "pool": bench_worker_pool,
+    "events": bench_event_core,
+    "streaming": bench_streaming,
+    "providers": bench_provider_handles,
+    "hedging": bench_hedging,
+    "routing": bench_routing,
+    "resilience": bench_resilience,
+    "singleflight": bench_single_flight,
+    "budget": bench_output_budget,
+    "chunking": bench_chunking,
+    "mapreduce": bench_map_reduce,
+    "cancel": bench_cancellation,
+    "images": bench_image_preprocessing,
+    "tiles": bench_tiled_ocr,
+    "vision": bench_vision_encoding,
+    "batch": bench_file_batch,
+    "ratelimit": bench_rate_limiter,
+    "cache": bench_response_cache,
+    "imagecache": bench_image_cache,
+    "cli": bench_cli,
+    "ipc": bench_ipc,
+    "clipboard": bench_clipboard_handshake,
+    "clipboard_backends": bench_clipboard_backends,
+}
+
+def main():
+    """Führt die ausgewählten Benchmarks aus."""
+    # Warnungen der Module (z.B. verworfene Aktivierungen) nicht in die Messausgabe mischen
+    logging.getLogger('ClipGen').setLevel(logging.ERROR)
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        if name not in BENCHMARKS:
+            print(f"Unbekannter Benchmark: {name} (verfügbar: {', '.join(BENCHMARKS)})")
+            continue
+        BENCHMARKS[name]()
+    if FAILED_CHECKS:
+        print(f"\n{len(FAILED_CHECKS)} Prüfung(en) fehlgeschlagen:")
+        for description in FAILED_CHECKS:
+            print(f"  - {description}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,3 @@
+"""
+Einstiegspunkt für ``python -m clipgen`` (Kommandozeile ohne Oberfläche, siehe libs/ClipGen_cli.py).
+"""
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# libs/ liegt neben diesem Paket, auch wenn python -m clipgen aus einem anderen Ordner läuft
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from libs.ClipGen_cli import main
+
+sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+Stapelverarbeitung kopierter Dateien für Bild-Hotkeys.
+
+Werden im Explorer Dateien oder Ordner kopiert, liefert die Zwischenablage
+eine Liste von Pfaden statt eines Bildes. Die Bilddateien darin (Ordner
+rekursiv, in natürlicher Sortierung) werden in einem Thread-Pool dekodiert
+und vorbereitet; Pillow gibt beim Dekodieren und Skalieren das GIL frei. Die
+Anfragen laufen gleichzeitig unter den Ratenlimits der Provider; das
+Ergebnis wird in der Reihenfolge der Eingabe zusammengesetzt.
+"""
+import logging
+import os
+import re
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+from libs.ClipGen_imaging import prepare_image
+
+logger = logging.getLogger('ClipGen')
+
+BATCH_DEFAULTS = {
+    # Gleichzeitig laufende Anfragen pro Stapel
+    "max_parallel": 4,
+    # Threads zum Dekodieren (None = Anzahl der CPU-Kerne)
+    "workers": None,
+    # Bilder in Unterordnern kopierter Ordner einbeziehen
+    "recursive": True,
+    # Größere Stapel werden abgeschnitten
+    "max_files": 200,
+    # Überschrift vor dem Ergebnis jeder Datei ({name}: Dateiname bzw. Pfad im kopierten Ordner)
+    "header": "=== {name} ===",
+}
+
+# Datei, die nicht gelesen oder beantwortet werden konnte. Der Stapel läuft weiter,
+# an ihrer Stelle steht im Ergebnis "[не обработан]".
+BATCH_FAILED = object()
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".gif", ".tif", ".tiff")
+
+# index: Position im Stapel; name: Anzeigename (relativ zum kopierten Ordner)
+BatchFile = namedtuple("BatchFile", "index path name")
+# files: Bilddateien in Eingabereihenfolge; skipped: übergangene Dateien (kein Bild, über max_files)
+FileBatch = namedtuple("FileBatch", "files skipped")
+
+_DIGITS = re.compile(r"(\d+)")
+
+
+def natural_key(name):
+    """Sortierschlüssel, bei dem "scan2" vor "scan10" kommt"""
+    return [int(part) if part.isdigit() else part.casefold() for part in _DIGITS.split(name)]
+
+
+def _folder_images(folder, recursive):
+    """(Pfad, Name relativ zum Elternordner von folder) aller Bilder im Ordner"""
+    root = os.path.dirname(os.path.normpath(folder))
+    for current, dirs, files in os.walk(folder):
+        dirs.sort(key=natural_key)
+        if not recursive:
+            dirs.clear()
+        for name in sorted(files, key=natural_key):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(current, name)
+                yield path, os.path.relpath(path, root)
+
+
+def collect_files(paths, settings=BATCH_DEFAULTS):
+    """FileBatch aus einer Liste kopierter Dateien und Ordner"""
+    found = []
+    skipped = 0
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(_folder_images(path, settings["recursive"]))
+        elif path.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(path):
+            found.append((path, os.path.basename(path)))
+        else:
+            skipped += 1
+    limit = settings["max_files"]
+    if limit and len(found) > limit:
+        skipped += len(found) - limit
+        found = found[:limit]
+    return FileBatch([BatchFile(index, path, name) for index, (path, name) in enumerate(found)], skipped)
+
+
+def load_image(path, settings):
+    """Dekodiert und bereitet eine Bilddatei vor (läuft im DecodePool); liefert PreparedImage"""
+    with Image.open(path) as image:
+        # Hochkant fotografierte Seiten richtig herum; bei mehrseitigen TIFFs die erste Seite
+        image = ImageOps.exif_transpose(image)
+        image.load()
+        return prepare_image(image, settings)
+
+
+class DecodePool:
+    """Thread-Pool zum Dekodieren, beim ersten Stapel gestartet und danach wiederverwendet
+
+    Bewusst keine Prozesse: die gebündelte Windows-Version müsste jeden
+    Prozess neu starten (spawn), und fork aus dem laufenden Qt-/pynput-
+    Prozess kann hängen bleiben.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._workers = None
+
+    def _get(self, workers):
+        with self._lock:
+            if self._executor is not None and workers != self._workers:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                                                    thread_name_prefix="ClipGenDecode")
+                self._workers = workers
+            return self._executor
+
+    def submit(self, files, settings, workers=None):
+        """Startet das Dekodieren aller Dateien; liefert die Futures in Eingabereihenfolge"""
+        executor = self._get(workers)
+        return [executor.submit(load_image, file.path, settings) for file in files]
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+def format_entry(header, name, text):
+    """Ergebnis einer Datei mit Überschrift"""
+    return f"{header.format(name=name)}\n{text.strip()}" if header else text.strip()
@@ -0,0 +1,93 @@
+"""
+Ausgabebudget pro Hotkey aus der Länge der Eingabe.
+
+Statt fest 2048 Tokens darf eine Korrektur etwa 1,5-mal so viele Tokens
+erzeugen wie die Eingabe hat; Erklärungen bekommen eine eigene Obergrenze.
+Die Tokenzahl wird lokal geschätzt. Beim Provider wird das Budget mit etwas
+Spielraum (slack) als max_tokens gesetzt; gestreamte Antworten werden beim
+Budget selbst beendet. Abgeschnittene Antworten werden als TruncatedText
+gekennzeichnet, damit sie nicht im Cache landen.
+"""
+import logging
+import math
+import re
+from collections import namedtuple
+
+logger = logging.getLogger('ClipGen')
+
+# ratio: Ausgabe-Tokens pro Eingabe-Token (None = feste Grenze max)
+OUTPUT_BUDGET_DEFAULTS = {"ratio": None, "min": 64, "max": 2048, "slack": 1.25}
+
+BUDGET_PRESETS = {
+    "correction": {"ratio": 1.5, "min": 32, "max": 2048},
+    "translation": {"ratio": 2.0, "min": 32, "max": 2048},
+    "explanation": {"ratio": None, "max": 1024},
+}
+
+# Provider-Limits auf Vielfache davon runden, damit sich die Parametersätze wiederholen
+ROUNDING = 32
+
+# limit: lokale Grenze für gestreamte Antworten; max_tokens: Grenze beim Provider
+OutputBudget = namedtuple("OutputBudget", "limit max_tokens")
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+# Endegründe der Provider, wenn max_tokens erreicht wurde (OpenAI/Groq/Mistral bzw. Gemini)
+_LENGTH_REASONS = ("LENGTH", "MAX_TOKENS")
+
+
+class TruncatedText(str):
+    """Antwort, die der Provider oder das lokale Budget abgeschnitten hat; verhält sich wie str"""
+
+
+def mark_truncated(text, truncated=True):
+    """text als TruncatedText, wenn truncated (leere Antworten bleiben leer)"""
+    return TruncatedText(text) if truncated and text else text
+
+
+def is_truncated(text):
+    return isinstance(text, TruncatedText)
+
+
+def stopped_at_limit(finish_reason):
+    """Hat der Provider wegen max_tokens aufgehört? finish_reason als String oder Enum (Gemini)"""
+    if finish_reason is None:
+        return False
+    return str(getattr(finish_reason, "name", finish_reason)).upper() in _LENGTH_REASONS
+
+
+def estimate_tokens(text):
+    """Schätzt die Tokenzahl wie ein BPE-Tokenizer (ohne dessen Vokabular)
+
+    Satzzeichen zählen einzeln, lateinische Wörter etwa 4 Zeichen pro Token,
+    andere Schriften (z.B. Kyrillisch) etwa 3 Zeichen pro Token.
+    """
+    tokens = 0
+    for word in _TOKEN_PATTERN.findall(text):
+        tokens += -(-len(word) // (4 if word.isascii() else 3))
+    return max(1, tokens)
+
+
+def resolve_budget(spec):
+    """Hotkey-Feld "output_budget" (Preset-Name, Zahl oder dict) -> vollständige Einstellungen"""
+    if spec is None:
+        return OUTPUT_BUDGET_DEFAULTS
+    if isinstance(spec, str):
+        if spec not in BUDGET_PRESETS:
+            logger.warning(f"Unbekanntes Ausgabebudget '{spec}', verwende die Standardgrenze")
+        spec = BUDGET_PRESETS.get(spec, {})
+    elif isinstance(spec, (int, float)):
+        spec = {"ratio": None, "max": int(spec)}
+    return {**OUTPUT_BUDGET_DEFAULTS, **spec}
+
+
+def output_budget(spec, text, is_image=False):
+    """OutputBudget für diese Eingabe; spec wie in resolve_budget"""
+    settings = resolve_budget(spec)
+    maximum = int(settings["max"])
+    if settings["ratio"] is None or is_image:
+        limit = maximum
+    else:
+        limit = min(maximum, max(int(settings["min"]), math.ceil(settings["ratio"] * estimate_tokens(text))))
+    max_tokens = min(maximum, -(-math.ceil(limit * settings["slack"]) // ROUNDING) * ROUNDING)
+    return OutputBudget(limit, max(limit, max_tokens))
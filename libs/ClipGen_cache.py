@@ -0,0 +1,253 @@
+"""
+Zweistufiger Antwort-Cache: LRU im Speicher plus SQLite-Datei auf der Platte.
+
+Schlüssel ist (Provider, Modell, Prompt, normalisierter Eingabetext). Treffer
+aus dem Speicher kosten Mikrosekunden und sparen Kontingent beim Provider.
+
+Antworten auf Bild-Hotkeys werden unter dem Wahrnehmungs-Hash des Bildes
+abgelegt und auch für ähnliche Bilder (kleiner Hamming-Abstand) geliefert.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from libs.ClipGen_imaging import hamming_distances
+
+logger = logging.getLogger('ClipGen')
+
+CACHE_DEFAULTS = {
+    "enabled": True,
+    "memory_entries": 256,
+    "disk_max_mb": 50,
+    "ttl_hours": 168,
+    "path": "response_cache.sqlite3",
+    # Gespeicherte Antworten auf Bild-Hotkeys (Speicher und Platte)
+    "image_entries": 500,
+}
+
+
+def normalize_input(text):
+    """Vereinheitlicht Zeilenenden, Unicode-Form und Rand-Leerraum"""
+    text = unicodedata.normalize("NFC", text.replace("\r\n", "\n").replace("\r", "\n"))
+    return text.strip()
+
+
+def make_key(provider, model, prompt, text, variant=None):
+    """Cache-Schlüssel; variant: weitere Einstellungen, die die Antwort verändern (JSON-serialisierbar)"""
+    payload = json.dumps([provider, model, prompt, variant, normalize_input(text)], ensure_ascii=False,
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """LRU-Cache im Speicher vor einem persistenten SQLite-Speicher"""
+
+    def __init__(self, path=CACHE_DEFAULTS["path"], memory_entries=256, disk_max_mb=50, ttl_hours=168, enabled=True,
+                 image_entries=500):
+        self.enabled = enabled
+        self.memory_entries = max(1, int(memory_entries))
+        self.image_entries = max(1, int(image_entries))
+        # (scope, fingerprint) -> (value, created); scope aus make_key ohne Eingabetext
+        self._images = OrderedDict()
+        self.image_hits = 0
+        self.image_near_hits = 0
+        self.image_misses = 0
+        self.disk_max_bytes = int(disk_max_mb * 1024 * 1024)
+        self.ttl = ttl_hours * 3600 if ttl_hours else None
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        if enabled and path:
+            self._open(path)
+
+    def _open(self, path):
+        try:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, "
+                "accessed REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS image_responses ("
+                "scope TEXT NOT NULL, fingerprint BLOB NOT NULL, value TEXT NOT NULL, created REAL NOT NULL, "
+                "accessed REAL NOT NULL, PRIMARY KEY (scope, fingerprint))"
+            )
+            self._db.commit()
+            self._evict_disk()
+            rows = self._db.execute(
+                "SELECT scope, fingerprint, value, created FROM image_responses ORDER BY accessed DESC LIMIT ?",
+                (self.image_entries,)
+            ).fetchall()
+            for scope, fingerprint, value, created in reversed(rows):
+                self._images[(scope, bytes(fingerprint))] = (value, created)
+        except sqlite3.Error as e:
+            logger.error(f"Antwort-Cache konnte nicht geöffnet werden ({path}): {e}")
+            self._db = None
+
+    def get(self, key):
+        """Liefert die gespeicherte Antwort oder None"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created = entry
+                if self.ttl is None or now - created < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+                    if row and (self.ttl is None or now - row[1] < self.ttl):
+                        self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        self._remember(key, row[0], row[1])
+                        self.disk_hits += 1
+                        return row[0]
+                except sqlite3.Error as e:
+                    logger.error(f"Fehler beim Lesen des Antwort-Caches: {e}")
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if not self.enabled or not value:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO responses (key, value, created, accessed, size) VALUES (?, ?, ?, ?, ?)",
+                        (key, value, now, now, len(value.encode("utf-8")))
+                    )
+                    self._db.commit()
+                    self._evict_disk()
+                except sqlite3.Error as e:
+                    logger.error(f"Fehler beim Schreiben des Antwort-Caches: {e}")
+
+    def get_image(self, scope, fingerprint, max_distance=0):
+        """Antwort für das ähnlichste Bild im Bereich scope: (Antwort, Abstand in Bit) oder None"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            keys = [key for key in self._images
+                    if key[0] == scope and len(key[1]) == len(fingerprint)
+                    and (self.ttl is None or now - self._images[key][1] < self.ttl)]
+            if keys:
+                distances = hamming_distances([key[1] for key in keys], fingerprint)
+                best = int(distances.argmin())
+                distance = int(distances[best])
+                if distance <= max_distance:
+                    key = keys[best]
+                    self._images.move_to_end(key)
+                    self.image_hits += 1
+                    if distance:
+                        self.image_near_hits += 1
+                    if self._db is not None:
+                        try:
+                            self._db.execute(
+                                "UPDATE image_responses SET accessed = ? WHERE scope = ? AND fingerprint = ?",
+                                (now, key[0], key[1])
+                            )
+                            self._db.commit()
+                        except sqlite3.Error as e:
+                            logger.error(f"Fehler beim Schreiben des Antwort-Caches: {e}")
+                    return self._images[key][0], distance
+            self.image_misses += 1
+            return None
+
+    def put_image(self, scope, fingerprint, value):
+        if not self.enabled or not value:
+            return
+        now = time.time()
+        with self._lock:
+            key = (scope, fingerprint)
+            self._images[key] = (value, now)
+            self._images.move_to_end(key)
+            while len(self._images) > self.image_entries:
+                self._images.popitem(last=False)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO image_responses (scope, fingerprint, value, created, accessed) "
+                        "VALUES (?, ?, ?, ?, ?)", (scope, fingerprint, value, now, now)
+                    )
+                    self._db.execute(
+                        "DELETE FROM image_responses WHERE rowid NOT IN "
+                        "(SELECT rowid FROM image_responses ORDER BY accessed DESC LIMIT ?)", (self.image_entries,)
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"Fehler beim Schreiben des Antwort-Caches: {e}")
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            image_total = self.image_hits + self.image_misses
+            return {
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+                "entries": len(self._memory),
+                "image_hits": self.image_hits,
+                "image_near_hits": self.image_near_hits,
+                "image_misses": self.image_misses,
+                "image_hit_rate": self.image_hits / image_total if image_total else 0.0,
+                "image_entries": len(self._images),
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _remember(self, key, value, created):
+        # Aufrufer hält self._lock
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        # Aufrufer hält self._lock (oder ist _open)
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+            self._db.execute("DELETE FROM image_responses WHERE created < ?", (time.time() - self.ttl,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.disk_max_bytes:
+            # Älteste Zugriffe zuerst entfernen, bis die Größe wieder passt
+            excess = total - self.disk_max_bytes
+            rows = self._db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall()
+            victims = []
+            for key, size in rows:
+                if excess <= 0:
+                    break
+                victims.append((key,))
+                excess -= size
+            self._db.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self._db.commit()
@@ -0,0 +1,223 @@
+"""
+Parallele Verarbeitung langer Texte in Abschnitten.
+
+Lange Eingaben werden an Absatz- und Satzgrenzen in Abschnitte mit einem
+Tokenbudget zerlegt. Die Abschnitte laufen gleichzeitig (die Ratenlimits
+der Provider greifen pro Abschnitt), fertige Abschnitte werden in der
+ursprünglichen Reihenfolge weitergereicht und wieder zusammengesetzt.
+
+Für Zusammenfassungen und Erklärungen gibt es zusätzlich Map-Reduce: die
+Teilantworten werden mit einem eigenen Prompt zu einer Antwort vereinigt,
+bei zu vielen Teilantworten stufenweise.
+"""
+import logging
+import re
+import threading
+from collections import namedtuple
+
+from libs.ClipGen_budget import estimate_tokens
+from libs.ClipGen_jobs import CANCEL_POLL_INTERVAL
+from libs.ClipGen_streaming import StreamCancelled
+
+logger = logging.getLogger('ClipGen')
+
+SINGLE = "single"
+CHUNKED = "chunked"
+MAP_REDUCE = "map_reduce"
+EXECUTION_MODES = (SINGLE, CHUNKED, MAP_REDUCE)
+
+# Standard-Prompt für den Reduce-Schritt (Hotkey-Feld "reduce_prompt")
+REDUCE_PROMPT = ("Ниже приведены ответы на отдельные части одного длинного текста. "
+                 "Объедини их в один связный ответ без повторов:\n\n")
+# Trenner zwischen Teilantworten in der Eingabe des Reduce-Schritts
+PARTIAL_SEPARATOR = "\n\n---\n\n"
+
+CHUNKING_DEFAULTS = {
+    # Ab dieser Eingabelänge (geschätzte Tokens) wird zerlegt
+    "threshold_tokens": 2000,
+    # Zielgröße eines Abschnitts
+    "chunk_tokens": 1500,
+    # Gleichzeitig laufende Abschnitte pro Aktivierung
+    "max_parallel": 4,
+    # Map-Reduce: maximale Eingabe eines Reduce-Schritts
+    "reduce_tokens": 3000,
+}
+
+# text: Abschnitt ohne abschließende Leerzeichen; separator: die Leerzeichen/Umbrüche danach
+Chunk = namedtuple("Chunk", "index text separator")
+
+_PARAGRAPH_SPLIT = re.compile(r"(\n\s*\n)")
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?…])(\s+)")
+_WORD_SPLIT = re.compile(r"(\s+)")
+
+
+def _pieces(text, pattern):
+    # re.split mit Gruppe: [Teil, Trenner, Teil, ...] -> [(Teil, Trenner)]
+    parts = pattern.split(text)
+    return [(parts[i], parts[i + 1] if i + 1 < len(parts) else "") for i in range(0, len(parts), 2)]
+
+
+def _segments(text, max_tokens):
+    """Zerlegt rekursiv (Absatz -> Satz -> Wort), bis jedes Stück ins Budget passt"""
+    for piece, separator in _pieces(text, _PARAGRAPH_SPLIT):
+        if estimate_tokens(piece) <= max_tokens:
+            yield piece, separator
+            continue
+        sentences = _pieces(piece, _SENTENCE_SPLIT)
+        if len(sentences) == 1:
+            sentences = _pieces(piece, _WORD_SPLIT)
+        if len(sentences) == 1:
+            # Ein einzelnes überlanges "Wort" (z.B. Base64) hart nach Zeichen teilen
+            step = max(1, max_tokens * 3)
+            for start in range(0, len(piece), step):
+                yield piece[start:start + step], separator if start + step >= len(piece) else ""
+            continue
+        sentences[-1] = (sentences[-1][0], sentences[-1][1] + separator)
+        for sentence, sentence_separator in sentences:
+            if estimate_tokens(sentence) <= max_tokens:
+                yield sentence, sentence_separator
+            else:
+                parts = list(_segments(sentence, max_tokens))
+                parts[-1] = (parts[-1][0], parts[-1][1] + sentence_separator)
+                yield from parts
+
+
+def split_text(text, max_tokens):
+    """Liste von Chunk; "".join(c.text + c.separator) ergibt wieder den Text"""
+    chunks = []
+    current = []
+    current_tokens = 0
+    prefix = ""
+    for piece, separator in _segments(text, max_tokens):
+        if not piece.strip():
+            # Reiner Leerraum bildet keinen eigenen Abschnitt
+            if current or chunks:
+                parts = current or chunks[-1]
+                parts[-1] = (parts[-1][0], parts[-1][1] + piece + separator)
+            else:
+                prefix += piece + separator
+            continue
+        piece, prefix = prefix + piece, ""
+        tokens = estimate_tokens(piece)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(current)
+            current, current_tokens = [], 0
+        current.append((piece, separator))
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+
+    result = []
+    for parts in chunks:
+        body = "".join(piece + separator for piece, separator in parts[:-1]) + parts[-1][0]
+        result.append(Chunk(len(result), body, parts[-1][1]))
+    return result
+
+
+def run_chunks(chunks, func, max_parallel=4, on_ready=None, cancel_event=None):
+    """Führt func(chunk) für alle Abschnitte mit bis zu max_parallel Threads aus
+
+    on_ready(chunk, result) wird in Abschnittsreihenfolge aufgerufen, sobald
+    alle vorherigen Abschnitte fertig sind. Liefert die Ergebnisse in
+    Reihenfolge; liefert ein Abschnitt "" oder einen Fehler, werden die
+    übrigen abgebrochen und None zurückgegeben.
+    """
+    cond = threading.Condition()
+    results = {}
+    pending = list(reversed(chunks))
+    state = {"next": 0, "failed": False}
+
+    def worker():
+        while True:
+            with cond:
+                if not pending or state["failed"] or (cancel_event is not None and cancel_event.is_set()):
+                    return
+                chunk = pending.pop()
+            try:
+                result = func(chunk)
+            except StreamCancelled:
+                result = None
+            except Exception as e:
+                logger.error(f"Fehler in Abschnitt {chunk.index + 1}/{len(chunks)}: {e}")
+                result = None
+            with cond:
+                if not result:
+                    state["failed"] = True
+                else:
+                    results[chunk.index] = result
+                cond.notify_all()
+
+    threads = [threading.Thread(target=worker, name=f"ClipGenChunk-{i}", daemon=True)
+               for i in range(max(1, min(int(max_parallel), len(chunks))))]
+    for thread in threads:
+        thread.start()
+
+    with cond:
+        try:
+            while state["next"] < len(chunks) and not state["failed"]:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise StreamCancelled()
+                index = state["next"]
+                if index not in results:
+                    cond.wait(CANCEL_POLL_INTERVAL if cancel_event is not None else None)
+                    continue
+                state["next"] += 1
+                if on_ready is not None:
+                    # Ohne Sperre weiterreichen, damit die Worker nicht warten
+                    cond.release()
+                    try:
+                        on_ready(chunks[index], results[index])
+                    finally:
+                        cond.acquire()
+        except BaseException:
+            # Keine weiteren Abschnitte mehr starten
+            state["failed"] = True
+            raise
+    if state["failed"]:
+        return None
+    return [results[chunk.index] for chunk in chunks]
+
+
+def join_results(chunks, results):
+    """Setzt die Ergebnisse mit den ursprünglichen Trennern wieder zusammen"""
+    return "".join(result.strip() + chunk.separator for chunk, result in zip(chunks, results)).strip()
+
+
+def group_results(results, max_tokens):
+    """Fasst Teilantworten zu Gruppen von höchstens max_tokens zusammen (mindestens zwei pro Gruppe)"""
+    groups = []
+    current = []
+    current_tokens = 0
+    for result in results:
+        tokens = estimate_tokens(result)
+        if len(current) >= 2 and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(result)
+        current_tokens += tokens
+    if current:
+        if len(current) == 1 and groups:
+            groups[-1].append(current[0])
+        else:
+            groups.append(current)
+    return groups
+
+
+def map_reduce(chunks, map_func, reduce_func, max_tokens, max_parallel=4, cancel_event=None):
+    """Map über alle Abschnitte, dann Reduce (stufenweise, bis eine Antwort übrig ist)
+
+    map_func(text) und reduce_func(text, final) liefern den Antworttext ("" bei
+    Fehler); final ist nur beim letzten Reduce-Schritt True. Liefert
+    (Ergebnis oder None, Anzahl der Teilantworten pro Stufe).
+    """
+    results = run_chunks(chunks, lambda chunk: map_func(chunk.text), max_parallel, cancel_event=cancel_event)
+    levels = [len(chunks)]
+    while results is not None:
+        groups = group_results(results, max_tokens)
+        if len(groups) == 1:
+            return reduce_func(PARTIAL_SEPARATOR.join(r.strip() for r in groups[0]), True) or None, levels
+        merged = [Chunk(i, PARTIAL_SEPARATOR.join(r.strip() for r in group), "") for i, group in enumerate(groups)]
+        results = run_chunks(merged, lambda chunk: reduce_func(chunk.text, False), max_parallel,
+                             cancel_event=cancel_event)
+        levels.append(len(merged))
+    return None, levels
@@ -0,0 +1,326 @@
+"""
+Kommandozeile ohne Oberfläche: den Prompt eines Hotkeys auf Dateien oder stdin anwenden.
+
+    python -m clipgen run --hotkey "Коррекция" texte/ brief.txt -o ergebnisse.jsonl
+    type eingaben.jsonl | python -m clipgen run --hotkey "Перевод" -
+
+Eingaben sind Dateien, Ordner (rekursiv, natürlich sortiert) oder JSONL von
+stdin ("-", eine Zeile pro Eingabe: {"id": ..., "text": ...} bzw.
+{"id": ..., "path": ...}). Die Anfragen laufen über denselben Weg wie die
+Hotkeys der GUI (ClipGenCore: Cache, Ausführungsarten, Routing, Absicherung,
+Ratenlimits, Wiederholungen) mit begrenzter Parallelität. Jedes Ergebnis
+wird sofort als JSON-Zeile geschrieben; beim erneuten Aufruf mit derselben
+Ausgabedatei werden bereits erfolgreiche Eingaben übersprungen.
+
+Läuft die GUI, gehen die Anfragen über ClipGen_ipc an sie (warme Clients,
+gemeinsamer Cache und gemeinsame Kontingente); sonst wird ClipGenCore im
+eigenen Prozess gestartet. PyQt5 wird nie importiert, PIL, numpy und die
+Provider-SDKs nur ohne laufende Instanz.
+
+    python -m clipgen hotkeys      # Hotkeys auflisten
+    python -m clipgen stats        # Zähler der laufenden Instanz
+"""
+import argparse
+import fnmatch
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from libs.ClipGen_ipc import IpcClient
+
+logger = logging.getLogger('ClipGen')
+
+CLI_DEFAULTS = {
+    # Gleichzeitig bearbeitete Eingaben (die Ratenlimits der Provider gelten zusätzlich)
+    "parallel": 4,
+}
+
+# id: Schlüssel in der Ausgabe (Pfad oder "id" aus JSONL); text: Eingabetext; path: Bilddatei;
+# error: Grund, warum die Eingabe nicht lesbar ist (sonst None)
+Item = namedtuple("Item", "id text path error", defaults=(None,))
+
+
+class RemoteBackend:
+    """Leitet die Anfragen an die laufende ClipGen-Instanz weiter"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def describe(self):
+        return f"über laufende ClipGen-Instanz (PID {self.client.call('ping')['pid']})"
+
+    def hotkeys(self, name=None):
+        return self.client.call("hotkeys", name=name)
+
+    def run_hotkey(self, hotkey, text="", path=None, provider=None, model=None, cancel_event=None):
+        # Laufende Anfragen der Instanz lassen sich von hier nicht abbrechen, sie laufen zu Ende
+        return self.client.call("run", hotkey=hotkey, text=text, path=path, provider=provider, model=model)
+
+    def close(self):
+        self.client.close()
+
+
+def open_backend(config, local=False):
+    """RemoteBackend, wenn ClipGen läuft (und local nicht gesetzt ist), sonst HeadlessClipGen"""
+    if not local:
+        client = IpcClient.connect()
+        if client is not None:
+            return RemoteBackend(client)
+    # Erst hier importiert: PIL, numpy und der Anfrageweg braucht nur der eigene Prozess
+    from libs.ClipGen_core import HeadlessClipGen
+    return HeadlessClipGen(config)
+
+
+def load_config(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _walk(folder, pattern):
+    from libs.ClipGen_batch import natural_key
+    for current, dirs, files in os.walk(folder):
+        dirs[:] = sorted((d for d in dirs if not d.startswith(".")), key=natural_key)
+        for name in sorted(files, key=natural_key):
+            if not name.startswith(".") and fnmatch.fnmatch(name, pattern):
+                yield os.path.join(current, name)
+
+
+def _file_item(path, is_image):
+    if is_image:
+        return Item(path, "", path)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return Item(path, f.read(), None)
+    except (OSError, UnicodeDecodeError) as e:
+        return Item(path, None, None, str(e))
+
+
+def _stdin_items(stream, is_image, base):
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield Item(f"stdin:{number}", None, None, f"Ungültiges JSON: {e}")
+            continue
+        if isinstance(entry, str):
+            entry = {"text": entry}
+        item_id = str(entry.get("id", f"stdin:{number}"))
+        if "path" in entry:
+            yield _file_item(os.path.join(base, entry["path"]), is_image)._replace(id=item_id)
+        elif is_image:
+            yield Item(item_id, None, None, "Bild-Hotkeys brauchen \"path\"")
+        else:
+            yield Item(item_id, str(entry.get("text", "")), None)
+
+
+def iter_inputs(inputs, is_image, pattern="*", stdin=None, base=""):
+    """Item für jede Eingabe in Reihenfolge; unlesbare Eingaben haben text None und einen Fehler
+
+    Relative Pfade in JSONL von stdin gelten relativ zu base.
+    """
+    from libs.ClipGen_batch import IMAGE_EXTENSIONS
+    for source in inputs:
+        if source == "-":
+            yield from _stdin_items(stdin or sys.stdin, is_image, base)
+        elif os.path.isdir(source):
+            for path in _walk(source, pattern):
+                if not is_image or path.lower().endswith(IMAGE_EXTENSIONS):
+                    yield _file_item(path, is_image)
+        elif os.path.isfile(source):
+            yield _file_item(source, is_image)
+        else:
+            yield Item(source, None, None, "Datei nicht gefunden")
+
+
+def completed_ids(path):
+    """IDs, die in einer früheren Ausgabedatei schon erfolgreich bearbeitet wurden"""
+    done = set()
+    if not path or not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Beim Abbruch halb geschriebene Zeile
+                continue
+            if record.get("ok"):
+                done.add(record.get("id"))
+    return done
+
+
+def load_settings(args):
+    """Liest settings.json und wechselt in ihren Ordner; liefert die Konfiguration oder None"""
+    settings_path = os.path.abspath(args.settings)
+    try:
+        config = load_config(settings_path)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Einstellungen nicht lesbar ({settings_path}): {e}", file=sys.stderr)
+        return None
+    # Cache, Kontingente, Routing-Statistik und IPC-Zustand wie bei der GUI neben settings.json
+    os.chdir(os.path.dirname(settings_path))
+    return config
+
+
+def run(args):
+    """Unterbefehl "run"; liefert den Exit-Code"""
+    inputs = [source if source == "-" else os.path.abspath(source) for source in args.inputs or ["-"]]
+    output_path = os.path.abspath(args.output) if args.output else None
+    base = os.getcwd()
+    config = load_settings(args)
+    if config is None:
+        return 2
+
+    backend = open_backend(config, args.local)
+    found = backend.hotkeys(args.hotkey)
+    if not found:
+        names = ", ".join(h["name"] for h in backend.hotkeys())
+        print(f"Hotkey '{args.hotkey}' nicht gefunden (vorhanden: {names})", file=sys.stderr)
+        backend.close()
+        return 2
+    hotkey = found[0]
+    is_image = hotkey["type"] == "image"
+    parallel = max(1, args.parallel or config.get("cli", {}).get("parallel", CLI_DEFAULTS["parallel"]))
+    if not args.quiet:
+        print(f"Hotkey '{hotkey['name']}' {backend.describe()}", file=sys.stderr)
+
+    skip = completed_ids(output_path)
+    output = open(output_path, "a", encoding="utf-8") if output_path else sys.stdout
+    cancel_event = threading.Event()
+    lock = threading.Lock()
+    # Begrenzt auch das Einlesen: stdin wird nur so weit gelesen, wie Plätze frei sind
+    slots = threading.BoundedSemaphore(parallel * 2)
+    counts = {"done": 0, "failed": 0, "skipped": 0}
+    start = time.perf_counter()
+
+    def write(record):
+        with lock:
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            counts["done"] += 1
+            counts["failed"] += not record["ok"]
+            if not args.quiet:
+                status = f"{record['seconds']:.1f} s" if record["ok"] else f"Fehler: {record['error']}"
+                print(f"[{counts['done']}] {record['id']}: {status}", file=sys.stderr)
+
+    def process(item):
+        try:
+            item_start = time.perf_counter()
+            if item.error is not None:
+                write({"id": item.id, "ok": False, "result": None, "error": item.error, "seconds": 0.0})
+                return
+            answer = backend.run_hotkey(hotkey["name"], item.text, item.path, args.provider, args.model,
+                                        cancel_event)
+            if cancel_event.is_set() and not answer["result"]:
+                # Nicht als erledigt schreiben: beim nächsten Aufruf erneut bearbeiten
+                return
+            write({"id": item.id, "ok": bool(answer["result"]), "result": answer["result"],
+                   "error": answer["error"], "seconds": round(time.perf_counter() - item_start, 3)})
+        except Exception as e:
+            # Abgebrochene Anfragen (StreamCancelled) ebenfalls nicht als erledigt schreiben
+            if not cancel_event.is_set():
+                write({"id": item.id, "ok": False, "result": None, "error": str(e), "seconds": 0.0})
+        finally:
+            slots.release()
+
+    executor = ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="ClipGenCli")
+    try:
+        for item in iter_inputs(inputs, is_image, args.glob, base=base):
+            if item.id in skip:
+                counts["skipped"] += 1
+                continue
+            slots.acquire()
+            executor.submit(process, item)
+        executor.shutdown(wait=True)
+    except KeyboardInterrupt:
+        cancel_event.set()
+        print("Abgebrochen, laufende Anfragen werden beendet …", file=sys.stderr)
+        executor.shutdown(wait=True, cancel_futures=True)
+        return 130
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        backend.close()
+        if not args.quiet:
+            skipped = f", übersprungen (schon erledigt): {counts['skipped']}" if counts["skipped"] else ""
+            print(f"Fertig: {counts['done'] - counts['failed']}/{counts['done']} erfolgreich{skipped}, "
+                  f"{time.perf_counter() - start:.1f} s", file=sys.stderr)
+    return 1 if counts["failed"] else 0
+
+
+def list_hotkeys(args):
+    """Unterbefehl "hotkeys": eine Zeile pro Hotkey (Kombination, Name, Typ, Provider/Modell)"""
+    config = load_settings(args)
+    if config is None:
+        return 2
+    backend = open_backend(config, args.local)
+    try:
+        for hotkey in backend.hotkeys():
+            print(f"{hotkey['combination']}\t{hotkey['name']}\t{hotkey['type']}\t"
+                  f"{hotkey['provider']}/{hotkey['model']}")
+    finally:
+        backend.close()
+    return 0
+
+
+def show_stats(args):
+    """Unterbefehl "stats": Zähler der laufenden Instanz als JSON"""
+    if load_settings(args) is None:
+        return 2
+    client = IpcClient.connect()
+    if client is None:
+        print("ClipGen läuft nicht", file=sys.stderr)
+        return 1
+    try:
+        print(json.dumps(client.call("stats"), ensure_ascii=False, indent=2))
+    finally:
+        client.close()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m clipgen", description="ClipGen ohne Oberfläche")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Prompt eines Hotkeys auf Dateien, Ordner oder stdin anwenden")
+    run_parser.set_defaults(handler=run)
+    run_parser.add_argument("inputs", nargs="*",
+                            help="Dateien, Ordner oder - für JSONL von stdin (Standard: -)")
+    run_parser.add_argument("--hotkey", required=True, help="Name oder Kombination des Hotkeys aus settings.json")
+    run_parser.add_argument("-o", "--output",
+                            help="JSONL-Ausgabedatei (Standard: stdout); vorhandene Ergebnisse werden fortgesetzt")
+    run_parser.add_argument("-j", "--parallel", type=int,
+                            help=f"Gleichzeitige Eingaben (Standard: {CLI_DEFAULTS['parallel']})")
+    run_parser.add_argument("--provider", help="Provider des Hotkeys überschreiben")
+    run_parser.add_argument("--model", help="Modell des Hotkeys überschreiben")
+    run_parser.add_argument("--glob", default="*", help="Dateimuster in Ordnern (z.B. *.md)")
+    run_parser.add_argument("-q", "--quiet", action="store_true", help="Keine Fortschrittsmeldungen auf stderr")
+    run_parser.add_argument("-v", "--verbose", action="store_true", help="Meldungen der Anfragen auf stderr")
+    hotkeys_parser = commands.add_parser("hotkeys", help="Hotkeys auflisten")
+    hotkeys_parser.set_defaults(handler=list_hotkeys)
+    stats_parser = commands.add_parser("stats", help="Zähler der laufenden ClipGen-Instanz als JSON")
+    stats_parser.set_defaults(handler=show_stats)
+    for command in (run_parser, hotkeys_parser, stats_parser):
+        command.add_argument("--settings", default="settings.json", help="Pfad zu settings.json")
+    for command in (run_parser, hotkeys_parser):
+        command.add_argument("--local", action="store_true",
+                             help="Nicht an eine laufende ClipGen-Instanz weiterleiten")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%H:%M:%S'))
+    verbose, quiet = getattr(args, "verbose", False), getattr(args, "quiet", False)
+    handler.setLevel(logging.INFO if verbose else logging.ERROR if quiet else logging.WARNING)
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    return args.handler(args)
@@ -0,0 +1,321 @@
+"""
+Zwischenablage-Zugriff und Handshake für Kopieren/Einfügen.
+
+Statt fester Pausen nach Strg+C wird auf die Änderung der Zwischenablage
+(Sequenznummer) gewartet, mit einer Frist für Anwendungen ohne Auswahl.
+Text und Bilder werden im Prozess über die native API gelesen (Win32 bzw.
+QClipboard, das unter Linux die X11-Selections bedient); pyperclip bleibt
+nur als Fallback ohne laufende Qt-Anwendung.
+"""
+import hashlib
+import logging
+import sys
+import threading
+import time
+
+import pyperclip
+from PIL import Image, ImageGrab
+
+try:
+    from PyQt5.QtCore import QObject, QThread, Qt, pyqtSignal
+    from PyQt5.QtGui import QImage
+    from PyQt5.QtWidgets import QApplication
+except ImportError:
+    QObject = None
+
+logger = logging.getLogger('ClipGen')
+
+CLIPBOARD_DEFAULTS = {
+    # Maximale Wartezeit, bis die Ziel-Anwendung auf Strg+C reagiert
+    "copy_timeout": 0.5,
+    # Kürzere Frist bei Bild-Hotkeys: das Bild liegt meist schon in der Zwischenablage
+    "image_copy_timeout": 0.2,
+    # Pause nach Strg+V, bevor die Zwischenablage wieder verändert werden darf
+    "paste_settle": 0.05,
+}
+
+# Abfrageintervalle beim Warten: zuerst sehr kurz, dann zunehmend länger
+_POLL_STEPS = (0.001, 0.001, 0.002, 0.002, 0.005, 0.005, 0.01)
+
+
+class ClipboardBackend:
+    """Schnittstelle für Zwischenablage und Tastenkürzel der Ziel-Anwendung"""
+
+    def sequence_number(self):
+        """Zähler, der sich bei jeder Änderung der Zwischenablage ändert"""
+        raise NotImplementedError
+
+    def get_text(self):
+        raise NotImplementedError
+
+    def set_text(self, text):
+        raise NotImplementedError
+
+    def send_copy(self):
+        raise NotImplementedError
+
+    def send_paste(self):
+        raise NotImplementedError
+
+    def get_image(self):
+        """Bild aus der Zwischenablage (PIL), Liste kopierter Dateien oder None"""
+        return ImageGrab.grabclipboard()
+
+
+class _PynputKeys:
+    """Strg+C / Strg+V über pynput (alle Plattformen außer Windows)"""
+
+    def _init_keys(self):
+        from pynput import keyboard
+        self._keyboard = keyboard
+        self._controller = keyboard.Controller()
+
+    def send_copy(self):
+        self._send_ctrl('c')
+
+    def send_paste(self):
+        self._send_ctrl('v')
+
+    def _send_ctrl(self, key):
+        with self._controller.pressed(self._keyboard.Key.ctrl):
+            self._controller.tap(key)
+
+
+class Win32Clipboard(ClipboardBackend):
+    """Windows: native Clipboard-API, Sequenznummer und keybd_event"""
+    # Andere Anwendungen halten die Zwischenablage manchmal kurz geöffnet
+    OPEN_RETRIES = 20
+    OPEN_RETRY_DELAY = 0.005
+
+    def __init__(self):
+        import pywintypes
+        import win32api
+        import win32con
+        import win32clipboard
+        self._win32api = win32api
+        self._win32con = win32con
+        self._win32clipboard = win32clipboard
+        self._error = pywintypes.error
+
+    def sequence_number(self):
+        return self._win32clipboard.GetClipboardSequenceNumber()
+
+    def get_text(self):
+        clipboard = self._win32clipboard
+        self._open()
+        try:
+            if clipboard.IsClipboardFormatAvailable(clipboard.CF_UNICODETEXT):
+                return clipboard.GetClipboardData(clipboard.CF_UNICODETEXT)
+            return ""
+        finally:
+            clipboard.CloseClipboard()
+
+    def set_text(self, text):
+        clipboard = self._win32clipboard
+        self._open()
+        try:
+            clipboard.EmptyClipboard()
+            clipboard.SetClipboardData(clipboard.CF_UNICODETEXT, text)
+        finally:
+            clipboard.CloseClipboard()
+
+    def _open(self):
+        for attempt in range(self.OPEN_RETRIES):
+            try:
+                self._win32clipboard.OpenClipboard()
+                return
+            except self._error:
+                if attempt == self.OPEN_RETRIES - 1:
+                    raise
+                time.sleep(self.OPEN_RETRY_DELAY)
+
+    def send_copy(self):
+        self._send_ctrl(ord('C'))
+
+    def send_paste(self):
+        self._send_ctrl(ord('V'))
+
+    def _send_ctrl(self, key):
+        keybd_event = self._win32api.keybd_event
+        keyup = self._win32con.KEYEVENTF_KEYUP
+        keybd_event(self._win32con.VK_CONTROL, 0, 0, 0)
+        keybd_event(key, 0, 0, 0)
+        keybd_event(key, 0, keyup, 0)
+        keybd_event(self._win32con.VK_CONTROL, 0, keyup, 0)
+
+
+class PyperclipClipboard(_PynputKeys, ClipboardBackend):
+    """Fallback ohne Qt: Änderung wird über den Inhalt erkannt"""
+
+    def __init__(self):
+        self._init_keys()
+        # Eigene Schreibvorgänge zählen mit, auch wenn der Inhalt gleich bleibt
+        self._writes = 0
+
+    def sequence_number(self):
+        return self._writes, hashlib.sha1(self.get_text().encode("utf-8", "surrogatepass")).hexdigest()
+
+    def get_text(self):
+        return pyperclip.paste()
+
+    def set_text(self, text):
+        pyperclip.copy(text)
+        self._writes += 1
+
+
+if QObject is not None:
+    class QtClipboard(QObject, _PynputKeys, ClipboardBackend):
+        """QClipboard im Prozess; Aufrufe aus Worker-Threads laufen im GUI-Thread"""
+        _invoke = pyqtSignal(object)
+
+        def __init__(self, send_keys=True):
+            super().__init__()
+            if send_keys:
+                self._init_keys()
+            self._clipboard = QApplication.clipboard()
+            self._sequence = 0
+            self._clipboard.dataChanged.connect(self._on_changed)
+            self._invoke.connect(self._run, Qt.BlockingQueuedConnection)
+
+        def sequence_number(self):
+            return self._sequence
+
+        def get_text(self):
+            return self._call(self._clipboard.text)
+
+        def set_text(self, text):
+            def set_in_gui_thread():
+                self._clipboard.setText(text)
+                self._sequence += 1
+            self._call(set_in_gui_thread)
+
+        def get_image(self):
+            return self._call(self._read_image)
+
+        def _read_image(self):
+            mime = self._clipboard.mimeData()
+            if mime is None:
+                return None
+            if mime.hasImage():
+                image = self._clipboard.image().convertToFormat(QImage.Format_RGBA8888)
+                if image.isNull():
+                    return None
+                data = image.constBits()
+                data.setsize(image.byteCount())
+                return Image.frombuffer("RGBA", (image.width(), image.height()), bytes(data),
+                                        "raw", "RGBA", image.bytesPerLine(), 1).convert("RGB")
+            if mime.hasUrls():
+                # Wie ImageGrab.grabclipboard(): kopierte Dateien als Pfadliste
+                return [url.toLocalFile() for url in mime.urls() if url.isLocalFile()] or None
+            return None
+
+        def _on_changed(self):
+            self._sequence += 1
+
+        def _run(self, call):
+            call()
+
+        def _call(self, func):
+            if QThread.currentThread() is self.thread():
+                return func()
+            outcome = {}
+
+            def call():
+                try:
+                    outcome["result"] = func()
+                except Exception as e:
+                    outcome["error"] = e
+            self._invoke.emit(call)
+            if "error" in outcome:
+                raise outcome["error"]
+            return outcome.get("result")
+
+
+class FakeClipboard(ClipboardBackend):
+    """Simulierte Zwischenablage für Tests und Benchmarks
+
+    selection ist der Text, den die Ziel-Anwendung bei Strg+C kopiert (None =
+    keine Auswahl), app_delay ihre Reaktionszeit in Sekunden, image der Inhalt
+    für Bild-Hotkeys.
+    """
+
+    def __init__(self, selection="", app_delay=0.0, image=None):
+        self.selection = selection
+        self.app_delay = app_delay
+        self.image = image
+        self.pasted = []
+        self.paste_sent_at = None
+        self._text = ""
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def sequence_number(self):
+        return self._seq
+
+    def get_text(self):
+        return self._text
+
+    def set_text(self, text):
+        with self._lock:
+            self._text = text
+            self._seq += 1
+
+    def send_copy(self):
+        if self.selection is not None:
+            self._respond(lambda: self.set_text(self.selection))
+
+    def send_paste(self):
+        self.paste_sent_at = time.perf_counter()
+        self._respond(lambda: self.pasted.append(self._text))
+
+    def get_image(self):
+        return self.image
+
+    def _respond(self, action):
+        if self.app_delay:
+            threading.Timer(self.app_delay, action).start()
+        else:
+            action()
+
+
+def create_clipboard_backend():
+    """Wählt beim Start das schnellste verfügbare Backend"""
+    if sys.platform == "win32":
+        return Win32Clipboard()
+    if QObject is not None and QApplication.instance() is not None:
+        return QtClipboard()
+    return PyperclipClipboard()
+
+
+def wait_for_change(backend, sequence, timeout):
+    """Wartet, bis sich die Sequenznummer ändert; liefert False nach Ablauf der Frist"""
+    deadline = time.perf_counter() + timeout
+    step = 0
+    while backend.sequence_number() == sequence:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return False
+        time.sleep(min(_POLL_STEPS[step], remaining))
+        step = min(step + 1, len(_POLL_STEPS) - 1)
+    return True
+
+
+def copy_selection(backend, timeout=CLIPBOARD_DEFAULTS["copy_timeout"]):
+    """Sendet Strg+C und liefert (Text, geändert) sobald die Zwischenablage aktualisiert wurde"""
+    sequence = backend.sequence_number()
+    backend.send_copy()
+    changed = wait_for_change(backend, sequence, timeout)
+    return backend.get_text(), changed
+
+
+def paste_text(backend, text, timeout=CLIPBOARD_DEFAULTS["copy_timeout"], settle=CLIPBOARD_DEFAULTS["paste_settle"]):
+    """Legt text in die Zwischenablage und sendet Strg+V, sobald er dort angekommen ist"""
+    sequence = backend.sequence_number()
+    backend.set_text(text)
+    if not wait_for_change(backend, sequence, timeout):
+        # Gleicher Inhalt wie vorher oder langsame Zwischenablage: trotzdem einfügen
+        logger.debug("Zwischenablage hat sich vor dem Einfügen nicht geändert")
+    backend.send_paste()
+    if settle:
+        # Die Ziel-Anwendung liest die Zwischenablage asynchron
+        time.sleep(settle)
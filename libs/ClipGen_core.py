@@ -0,0 +1,871 @@
+"""
+Kern von ClipGen ohne Oberfläche: Konfiguration der Dienste und Weiterleitung
+der Anfragen an die Provider.
+
+Die GUI (ClipGen.py) und die Kommandozeile (ClipGen_cli) erben beide von
+ClipGenCore und verwenden damit dieselben Wege für Cache, Zusammenlegen,
+Ausführungsarten, Routing, Absicherung, Ratenlimits und Wiederholungen.
+Die rpc_*-Methoden beantwortet die GUI über ClipGen_ipc für die
+Kommandozeile. Dieses Modul importiert kein PyQt5.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from PIL import Image
+
+from libs.ClipGen_hotkeys import compile_hotkeys
+from libs.ClipGen_providers import ProviderRegistry
+from libs.ClipGen_cache import CACHE_DEFAULTS, ResponseCache, make_key
+from libs.ClipGen_streaming import (CollectSink, StreamCancelled, consume_stream, iter_gemini_chunks,
+                                    iter_mistral_chunks, iter_openai_chunks)
+from libs.ClipGen_budget import (OutputBudget, estimate_tokens, is_truncated, mark_truncated, output_budget,
+                                 resolve_budget, stopped_at_limit)
+from libs.ClipGen_imaging import (TILED, TILE_BLANK, TILING_DEFAULTS, EncodedImage, TileMerger, TileSet, crop_borders,
+                                  format_bytes, image_fingerprint, image_settings, prepare_image, split_tiles,
+                                  user_content)
+from libs.ClipGen_batch import BATCH_DEFAULTS, BATCH_FAILED, DecodePool, FileBatch, collect_files, format_entry
+from libs.ClipGen_chunking import (CHUNKED, CHUNKING_DEFAULTS, MAP_REDUCE, REDUCE_PROMPT, SINGLE, join_results,
+                                   map_reduce, run_chunks, split_text)
+from libs.ClipGen_ratelimit import QUOTA_PATH, QuotaExhausted, RateLimiter
+from libs.ClipGen_resilience import RESILIENCE_DEFAULTS, ResilientCaller
+from libs.ClipGen_jobs import CANCEL_POLL_INTERVAL, run_cancellable
+from libs.ClipGen_singleflight import DROP, JOIN, JOINED, LEADER, SingleFlight
+from libs.ClipGen_routing import AUTO_PROVIDER, ROUTING_DEFAULTS, Router
+from libs.ClipGen_hedging import (HEDGE_DEFAULTS, PRIMARY, SECONDARY, HedgeStats, HedgeStream, LatencyTracker,
+                                  hedge_delay, run_hedged)
+
+logger = logging.getLogger('ClipGen')
+
+
+class ErrorCapture(logging.Handler):
+    """Merkt sich die letzte Fehlermeldung pro Thread, um sie mit dem Ergebnis zurückzugeben"""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.last = {}
+
+    def emit(self, record):
+        self.last[threading.get_ident()] = record.getMessage()
+
+    def pop(self):
+        return self.last.pop(threading.get_ident(), None)
+
+
+def can_resend(sink):
+    """Darf die Anfrage neu gesendet werden? Getippte oder im Log gezeigte Fragmente lassen sich nicht zurücknehmen"""
+    return sink is None or sink.chunks == 0 or (sink.pastes_result and not sink.logs_output)
+
+
+class ClipGenCore:
+    """Dienste und Anfrageweg; erwartet self.config (Inhalt von settings.json)"""
+
+    def init_core(self):
+        """Erstellt Provider-Clients, Cache, Routing, Absicherung, Wiederholungen und Ratenlimits"""
+        self.init_api_clients()
+        self.rebuild_hotkeys()
+        self.configure_response_cache()
+        self.decode_pool = DecodePool()
+        # Laufende Stapel: Aktion -> (fertig, gesamt) für die Statuszeile
+        self.batch_progress = {}
+        self.latency_tracker = LatencyTracker({**HEDGE_DEFAULTS, **self.config.get("hedging", {})}["window"])
+        self.hedge_stats = HedgeStats()
+        self.single_flight = SingleFlight()
+        self.configure_router()
+        self.resilience = ResilientCaller(self.on_resilience_event,
+                                          **{**RESILIENCE_DEFAULTS, **self.config.get("resilience", {})})
+        self.rate_limiter = RateLimiter(self.config.get("rate_limits"), QUOTA_PATH, on_stats=self.publish_stats)
+        self.request_errors = ErrorCapture()
+        logger.addHandler(self.request_errors)
+
+    def configure_core(self):
+        """Übernimmt eine geänderte Konfiguration in die laufenden Dienste"""
+        self.rebuild_hotkeys()
+        self.configure_response_cache()
+        self.configure_router()
+        self.rate_limiter.configure(self.config.get("rate_limits"))
+        self.resilience.configure(**{**RESILIENCE_DEFAULTS, **self.config.get("resilience", {})})
+
+    def shutdown_core(self):
+        """Gibt Threads und Dateien frei und speichert die Routing-Statistik"""
+        self.decode_pool.shutdown()
+        self.response_cache.close()
+        self.router.save()
+        self.rate_limiter.save()
+        logger.removeHandler(self.request_errors)
+
+    def publish_stats(self):
+        """Aktualisiert die Statusanzeige (GUI: Statuszeile unter den Logs)"""
+
+    def init_api_clients(self):
+        """Initialize API clients for all providers"""
+        # Clients und Modell-Handles bleiben erhalten, solange sich Schlüssel/Endpunkte nicht ändern
+        if not hasattr(self, "providers"):
+            self.providers = ProviderRegistry()
+        self.providers.configure(self.config)
+
+    def configure_response_cache(self):
+        """Erstellt den Antwort-Cache neu, wenn sich seine Einstellungen geändert haben"""
+        settings = {**CACHE_DEFAULTS, **self.config.get("cache", {})}
+        if getattr(self, "response_cache_settings", None) == settings:
+            return
+        if hasattr(self, "response_cache"):
+            self.response_cache.close()
+        self.response_cache = ResponseCache(**settings)
+        self.response_cache_settings = settings
+
+    def configure_router(self):
+        """Erstellt die Routing-Statistik neu, wenn sich ihre Einstellungen geändert haben"""
+        settings = {**ROUTING_DEFAULTS, **self.config.get("routing", {})}
+        if getattr(self, "router_settings", None) == settings:
+            return
+        if hasattr(self, "router"):
+            self.router.save()
+        self.router = Router(**settings)
+        self.router_settings = settings
+
+    def rebuild_hotkeys(self):
+        """Kompiliert die Hotkey-Registry neu"""
+        # Die Zuweisung ist atomar, alle Threads sehen immer eine vollständige Registry
+        self.hotkey_registry = compile_hotkeys(self.config.get("hotkeys", []))
+
+    def find_hotkey(self, name):
+        """Hotkey anhand des Namens oder der Kombination (z.B. "Ctrl+F1")"""
+        return self.hotkey_registry.get(name) or self.hotkey_registry.by_combination(name)
+
+    def rpc_ping(self):
+        return {"pid": os.getpid()}
+
+    def rpc_hotkeys(self, name=None):
+        """Name, Kombination, Typ, Provider und Modell aller Hotkeys bzw. nur des Hotkeys name"""
+        if name is not None:
+            entry = self.find_hotkey(name)
+            hotkeys = [entry] if entry is not None else []
+        else:
+            hotkeys = list(self.hotkey_registry)
+        return [{"name": h.name, "combination": h.combination, "type": "image" if h.is_image else "text",
+                 "provider": h.provider, "model": h.model} for h in hotkeys]
+
+    def run_hotkey(self, hotkey, text="", path=None, provider=None, model=None, cancel_event=None):
+        """Prompt eines Hotkeys auf text bzw. die Bilddatei path anwenden; {"result", "error"}"""
+        entry = self.find_hotkey(hotkey)
+        if entry is None:
+            names = ", ".join(h.name for h in self.hotkey_registry)
+            raise ValueError(f"Hotkey '{hotkey}' nicht gefunden (vorhanden: {names})")
+        if entry.is_image and not path:
+            raise ValueError("Bild-Hotkeys brauchen \"path\"")
+        self.request_errors.pop()
+        # Gleiche Eingaben warten auf dieselbe Antwort; verwerfen ist nur für doppelte Tastendrücke gedacht
+        result = self.process_text_with_provider(text, entry.name, entry.prompt, entry.is_image,
+                                                 provider or entry.provider, model or entry.model, None,
+                                                 cancel_event, [path] if path else None, duplicates=JOIN)
+        return {"result": result or None, "error": None if result else self.request_errors.pop() or "keine Antwort"}
+
+    def rpc_run(self, hotkey, text="", path=None, provider=None, model=None):
+        return self.run_hotkey(hotkey, text, path, provider, model)
+
+    def rpc_stats(self):
+        """Zähler von Cache, Absicherung, Zusammenlegen, Kontingenten und laufenden Stapeln"""
+        return {
+            "cache": self.response_cache.stats(),
+            "hedging": self.hedge_stats.stats(),
+            "single_flight": self.single_flight.stats(),
+            "quotas": self.rate_limiter.remaining(),
+            "batches": {action: {"done": done, "total": total}
+                        for action, (done, total) in list(self.batch_progress.items())},
+        }
+
+    def process_text_with_provider(self, text, action, prompt, is_image=False, provider=None, model=None, sink=None,
+                                   cancel_event=None, image=None, duplicates=None):
+        """Process text with selected provider
+
+        image: Eingabe für Bild-Hotkeys (sonst aus der Zwischenablage); duplicates:
+        Richtlinie für gleiche gleichzeitige Anfragen (None: Hotkey-Feld "duplicates").
+        """
+        try:
+            hotkey = self.hotkey_registry.get(action)
+            combo = hotkey.combination if hotkey else ""
+            
+            provider = provider or hotkey.provider
+            model = model or hotkey.model
+            
+            # Nicht-deterministische Prompts können "cache": false setzen
+            use_cache = hotkey.cache
+            variant = self.cache_variant(hotkey, is_image)
+            cache_key = make_key(provider, model, prompt, text, variant)
+            fingerprint = None
+            if is_image:
+                # Das Bild einmal lesen und vorbereiten, auch wenn die Anfrage wiederholt wird
+                settings = image_settings(self.config.get("image"), hotkey.get("image"))
+                if image is None:
+                    image = self.clipboard.get_image()
+                image, fingerprint = self.input_image(action, image, settings, sink)
+                if not image:
+                    logger.warning(f"[{combo}: {action}] Буфер обмена пуст")
+                    return ""
+                # Bildantworten liegen unter dem Wahrnehmungs-Hash, ähnliche Bilder treffen ebenfalls
+                cache_key = make_key(provider, model, prompt, f"image:{settings['hash']}", variant)
+                use_cache = use_cache and fingerprint is not None
+            if use_cache:
+                if is_image:
+                    cached = self.lookup_image_cache(combo, action, cache_key, fingerprint, settings["max_distance"])
+                else:
+                    cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    if sink is not None:
+                        sink.write(cached)
+                        sink.close()
+                    self.log_processed(combo, action, cached, sink, cached=True)
+                    self.publish_stats()
+                    return cached
+            
+            if is_image:
+                # Gleiche Bilder fängt der Bild-Cache ab, daher kein Zusammenlegen
+                result = self.run_activation(text, action, prompt, is_image, provider, model, sink, cancel_event,
+                                             image)
+            else:
+                # Läuft dieselbe Anfrage schon (z.B. Hotkey doppelt gedrückt), nur einmal senden
+                flight = self.single_flight.run(
+                    cache_key,
+                    lambda: self.run_activation(text, action, prompt, is_image, provider, model, sink, cancel_event),
+                    duplicates or hotkey.get("duplicates", DROP),
+                    cancel_event
+                )
+                if flight.role != LEADER:
+                    self.log_duplicate(combo, action, flight)
+                    if flight.result and sink is not None:
+                        sink.write(flight.result)
+                        sink.close()
+                    return flight.result or ""
+                result = flight.result
+            
+            if result:
+                self.log_processed(combo, action, result, sink)
+            # Am Budget abgeschnittene Antworten nicht wiederverwenden
+            if use_cache and result and not is_truncated(result) and not (sink is not None and sink.truncated):
+                if is_image:
+                    self.response_cache.put_image(cache_key, fingerprint, result)
+                else:
+                    self.response_cache.put(cache_key, result)
+                self.publish_stats()
+            return result
+        except StreamCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"[{combo}: {action}] Fehler: {e}")
+            return ""
+
+    def hotkey_settings(self, section, defaults, hotkey):
+        """Abschnitt section: Vorgaben, überschrieben von settings.json und dann vom gleichnamigen Hotkey-Feld"""
+        return {**defaults, **self.config.get(section, {}), **hotkey.get(section, {})}
+
+    def cache_variant(self, hotkey, is_image):
+        """Einstellungen des Hotkeys, die die Antwort verändern; Teil des Cache-Schlüssels"""
+        execution = hotkey.get("execution", SINGLE)
+        variant = {"budget": resolve_budget(hotkey.get("output_budget")), "execution": execution}
+        if not is_image and execution in (CHUNKED, MAP_REDUCE):
+            variant["chunking"] = self.hotkey_settings("chunking", CHUNKING_DEFAULTS, hotkey)
+            if execution == MAP_REDUCE:
+                variant["reduce_prompt"] = hotkey.get("reduce_prompt", REDUCE_PROMPT)
+        return variant
+
+    def lookup_image_cache(self, combo, action, scope, fingerprint, max_distance):
+        """Antwort für ein gleiches oder ähnliches Bild aus dem Cache (None: kein Treffer); meldet die Trefferquote"""
+        hit = self.response_cache.get_image(scope, fingerprint, max_distance)
+        if hit is None:
+            return None
+        result, distance = hit
+        stats = self.response_cache.stats()
+        similarity = f"похожее изображение (отличие: {distance} из {len(fingerprint) * 8} бит)" if distance \
+            else "то же изображение"
+        logger.info(f"[{combo}: {action}] В кэше найдено {similarity}, попаданий: {stats['image_hits']} из "
+                    f"{stats['image_hits'] + stats['image_misses']} ({stats['image_hit_rate']:.0%})",
+                    extra={"image_cache": {"distance": distance, "hit_rate": stats["image_hit_rate"]}})
+        return result
+
+    def run_activation(self, text, action, prompt, is_image, provider, model, sink=None, cancel_event=None,
+                       image=None):
+        """Wählt die Ausführungsart des Hotkeys (Feld "execution") für diese Eingabe"""
+        hotkey = self.hotkey_registry.get(action)
+        if isinstance(image, TileSet):
+            return self.process_tiled(image, action, prompt, provider, model, sink, cancel_event)
+        if isinstance(image, FileBatch):
+            return self.process_batch(image, action, prompt, provider, model, sink, cancel_event)
+        execution = hotkey.get("execution", SINGLE) if hotkey and not is_image else SINGLE
+        if execution in (CHUNKED, MAP_REDUCE):
+            settings = self.hotkey_settings("chunking", CHUNKING_DEFAULTS, hotkey)
+            if estimate_tokens(text) > settings["threshold_tokens"]:
+                if execution == MAP_REDUCE:
+                    return self.process_map_reduce(text, action, prompt, provider, model, sink, cancel_event,
+                                                   settings)
+                return self.process_chunked(text, action, prompt, provider, model, sink, cancel_event, settings)
+        return self.run_request(text, action, prompt, is_image, provider, model, sink, cancel_event, image)
+
+    def continue_stream_below(self, hotkey, sink):
+        """Neue Zeile für die live angezeigte Antwort unter einer Statusmeldung (GUI: im Log)"""
+
+    def process_chunked(self, text, action, prompt, provider, model, sink, cancel_event, settings):
+        """Verarbeitet einen langen Text abschnittsweise parallel und setzt das Ergebnis in Reihenfolge zusammen"""
+        hotkey = self.hotkey_registry.get(action)
+        combo = hotkey.combination if hotkey else ""
+        chunks = split_text(text, settings["chunk_tokens"])
+        parallel = max(1, min(int(settings["max_parallel"]), len(chunks)))
+        logger.info(f"[{combo}: {action}] Текст разбит на {len(chunks)} частей "
+                    f"(~{estimate_tokens(text)} токенов), параллельно: {parallel}",
+                    extra={"chunks": len(chunks)})
+        self.continue_stream_below(hotkey, sink)
+
+        finished = []
+
+        def process(chunk):
+            result = self.run_part(chunk.text, action, prompt, provider, model, cancel_event)
+            if result:
+                finished.append(chunk.index)
+            return result
+
+        def on_ready(chunk, result):
+            # Fertige Abschnitte in Reihenfolge weiterreichen (Log, Tippen)
+            sink.write(result.strip() + chunk.separator)
+
+        results = run_chunks(chunks, process, parallel, on_ready if sink is not None else None, cancel_event)
+        if sink is not None:
+            sink.close()
+        if results is None:
+            kept = f", готовые части ({len(finished)}) сохранены для повтора" if hotkey.cache and finished else ""
+            logger.error(f"[{combo}: {action}] Не все части обработаны, результат не вставлен{kept}")
+            return ""
+        return mark_truncated(join_results(chunks, results), any(map(is_truncated, results)))
+
+    def run_part(self, text, action, prompt, provider, model, cancel_event):
+        """Anfrage für einen Abschnitt; fertige Abschnitte kommen in den Cache
+
+        Scheitert ein anderer Abschnitt, sendet ein erneuter Lauf nur die
+        fehlenden, das Kontingent der fertigen ist nicht verloren.
+        """
+        hotkey = self.hotkey_registry.get(action)
+        key = make_key(provider, model, prompt, text,
+                       {"budget": resolve_budget(hotkey.get("output_budget")), "execution": "part"})
+        cached = self.response_cache.get(key) if hotkey.cache else None
+        if cached is not None:
+            return cached
+        result = self.run_request(text, action, prompt, False, provider, model, None, cancel_event)
+        if hotkey.cache and result and not is_truncated(result):
+            self.response_cache.put(key, result)
+        return result
+
+    def process_tiled(self, image, action, prompt, provider, model, sink, cancel_event):
+        """Erkennt die Kacheln eines großen Bildes parallel und setzt den Text in Lesereihenfolge zusammen"""
+        hotkey = self.hotkey_registry.get(action)
+        combo = hotkey.combination if hotkey else ""
+        settings = image_settings(self.config.get("image"), hotkey.get("image"))
+        tiling = self.hotkey_settings("tiling", TILING_DEFAULTS, hotkey)
+        parallel = max(1, min(int(tiling["max_parallel"]), len(image.tiles)))
+        width, height = image.size
+        logger.info(f"[{combo}: {action}] Изображение {width}×{height} разбито на {len(image.tiles)} фрагментов, "
+                    f"параллельно: {parallel}", extra={"tiles": len(image.tiles)})
+        self.continue_stream_below(hotkey, sink)
+        merger = TileMerger()
+        pieces = []
+
+        def process(tile):
+            encoded = EncodedImage.from_prepared(prepare_image(tile.image, settings))
+            self.request_errors.pop()
+            result = self.run_request("", action, prompt, True, provider, model, None, cancel_event, encoded)
+            if result:
+                return result
+            # Leere Antwort ohne Fehlermeldung: in diesem Bereich steht kein Text, die Kachel zählt als erledigt
+            return TILE_BLANK if self.request_errors.pop() is None else ""
+
+        def on_ready(tile, result):
+            # Fertige Kacheln in Reihenfolge weiterreichen, doppelte Zeilen aus Überlappungen entfernen
+            piece = merger.add(tile, "" if result is TILE_BLANK else result)
+            pieces.append(piece)
+            if sink is not None and piece:
+                sink.write(piece)
+
+        results = run_chunks(image.tiles, process, parallel, on_ready, cancel_event)
+        if sink is not None:
+            sink.close()
+        if results is None:
+            logger.error(f"[{combo}: {action}] Не все фрагменты изображения обработаны, результат не вставлен")
+            return ""
+        return mark_truncated("".join(pieces), any(map(is_truncated, results)))
+
+    def process_batch(self, batch, action, prompt, provider, model, sink, cancel_event):
+        """Verarbeitet kopierte Bilddateien parallel und setzt die Ergebnisse in Eingabereihenfolge zusammen"""
+        hotkey = self.hotkey_registry.get(action)
+        combo = hotkey.combination if hotkey else ""
+        files = batch.files
+        if not files:
+            logger.warning(f"[{combo}: {action}] Среди скопированных файлов нет изображений")
+            return ""
+        settings = image_settings(self.config.get("image"), hotkey.get("image"))
+        batch_settings = self.hotkey_settings("batch", BATCH_DEFAULTS, hotkey)
+        parallel = max(1, min(int(batch_settings["max_parallel"]), len(files)))
+        skipped = f", пропущено: {batch.skipped}" if batch.skipped else ""
+        logger.info(f"[{combo}: {action}] Пакет: {len(files)} файлов{skipped}, параллельно: {parallel}",
+                    extra={"batch": {"files": len(files), "skipped": batch.skipped}})
+        self.continue_stream_below(hotkey, sink)
+        # Alle Dateien sofort im Hintergrund dekodieren; die Anfragen warten nur auf ihre eigene Datei
+        futures = self.decode_pool.submit(files, settings, batch_settings["workers"])
+        header = batch_settings["header"] if len(files) > 1 else ""
+        cache_key = make_key(provider, model, prompt, f"image:{settings['hash']}", self.cache_variant(hotkey, True))
+        lock = threading.Lock()
+        progress = {"done": 0, "failed": 0, "truncated": 0}
+        pieces = []
+        # Beim Streaming ins Log stehen die Ergebnisse selbst dort, der Fortschritt nur in der Statuszeile
+        log_progress = logger.debug if sink is not None and sink.logs_output else logger.info
+        self.batch_progress[action] = (0, len(files))
+        self.publish_stats()
+        start = time.perf_counter()
+
+        def decoded(file):
+            future = futures[file.index]
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise StreamCancelled()
+                try:
+                    return future.result(timeout=CANCEL_POLL_INTERVAL)
+                except FutureTimeout:
+                    continue
+                except Exception as e:
+                    logger.error(f"[{combo}: {action}] {file.name}: не удалось открыть ({e})")
+                    return None
+
+        def process(file):
+            file_start = time.perf_counter()
+            prepared = decoded(file)
+            result = None
+            if prepared is not None:
+                hit = self.response_cache.get_image(cache_key, prepared.fingerprint, settings["max_distance"]) \
+                    if hotkey.cache else None
+                if hit is not None:
+                    result = hit[0]
+                else:
+                    result = self.run_request("", action, prompt, True, provider, model, None, cancel_event,
+                                              EncodedImage.from_prepared(prepared))
+                    if result and hotkey.cache and not is_truncated(result):
+                        self.response_cache.put_image(cache_key, prepared.fingerprint, result)
+            with lock:
+                progress["done"] += 1
+                progress["failed"] += not result
+                progress["truncated"] += is_truncated(result)
+                done = progress["done"]
+                self.batch_progress[action] = (done, len(files))
+            self.publish_stats()
+            status = f"{time.perf_counter() - file_start:.1f} с" if result else "ошибка"
+            log_progress(f"[{combo}: {action}] Файл {done}/{len(files)}: {file.name} ({status})",
+                        extra={"batch": {"done": done, "total": len(files)}})
+            return result or BATCH_FAILED
+
+        def on_ready(file, result):
+            piece = format_entry(header, file.name, result if result is not BATCH_FAILED else "[не обработан]")
+            if pieces:
+                piece = "\n\n" + piece
+            pieces.append(piece)
+            if sink is not None:
+                sink.write(piece)
+
+        try:
+            run_chunks(files, process, parallel, on_ready, cancel_event)
+        finally:
+            for future in futures:
+                future.cancel()
+            self.batch_progress.pop(action, None)
+            if sink is not None:
+                sink.close()
+        self.publish_stats()
+        succeeded = len(files) - progress["failed"]
+        logger.info(f"[{combo}: {action}] Пакет: обработано {succeeded}/{len(files)} файлов за "
+                    f"{time.perf_counter() - start:.1f} с", extra={"batch": {"succeeded": succeeded}})
+        if not succeeded:
+            return ""
+        return mark_truncated("".join(pieces), progress["truncated"] > 0)
+
+    def process_map_reduce(self, text, action, prompt, provider, model, sink, cancel_event, settings):
+        """Map mit dem Hotkey-Prompt über alle Abschnitte, dann Reduce mit "reduce_prompt" zu einer Antwort"""
+        hotkey = self.hotkey_registry.get(action)
+        combo = hotkey.combination if hotkey else ""
+        reduce_prompt = hotkey.get("reduce_prompt", REDUCE_PROMPT)
+        chunks = split_text(text, settings["chunk_tokens"])
+        parallel = max(1, min(int(settings["max_parallel"]), len(chunks)))
+        logger.info(f"[{combo}: {action}] Map-Reduce: {len(chunks)} частей (~{estimate_tokens(text)} токенов), "
+                    f"параллельно: {parallel}", extra={"chunks": len(chunks)})
+        self.continue_stream_below(hotkey, sink)
+        lock = threading.Lock()
+        usage = {"calls": 0, "input": 0, "output": 0}
+        truncated = []
+
+        def request(step_prompt, step_text, step_sink=None):
+            result = self.run_request(step_text, action, step_prompt, False, provider, model, step_sink, cancel_event)
+            if is_truncated(result):
+                truncated.append(result)
+            with lock:
+                usage["calls"] += 1
+                usage["input"] += estimate_tokens(step_prompt + step_text)
+                usage["output"] += estimate_tokens(result) if result else 0
+            return result
+
+        start = time.perf_counter()
+        result, levels = map_reduce(
+            chunks,
+            lambda chunk_text: request(prompt, chunk_text),
+            lambda partials, final: request(reduce_prompt, partials, sink if final else None),
+            settings["reduce_tokens"], parallel, cancel_event
+        )
+        stages = " → ".join(str(count) for count in levels + ([1] if result is not None else []))
+        logger.info(f"[{combo}: {action}] Map-Reduce: {stages}, вызовов: {usage['calls']}, "
+                    f"токенов: ~{usage['input']} вход / ~{usage['output']} выход, "
+                    f"{time.perf_counter() - start:.2f} с", extra={"map_reduce": {**usage, "levels": levels}})
+        if result is None:
+            logger.error(f"[{combo}: {action}] Map-Reduce не завершён, результат не вставлен")
+            return ""
+        # Auch eine abgeschnittene Teilantwort fehlt in der Zusammenfassung
+        return mark_truncated(result, bool(truncated))
+
+    def run_request(self, text, action, prompt, is_image, provider, model, sink=None, cancel_event=None, image=None):
+        """Wählt bei 'auto' den Provider und sendet die Anfrage (ggf. abgesichert); image: vorbereitetes Bild"""
+        hotkey = self.hotkey_registry.get(action)
+        combo = hotkey.combination if hotkey else ""
+        if provider != AUTO_PROVIDER:
+            return self.send_request(text, action, prompt, is_image, provider, model, sink, cancel_event, image)
+        tried = []
+        while True:
+            route = self.choose_route(hotkey, text, is_image, tried)
+            if route is None:
+                if not tried:
+                    logger.warning(f"[{combo}: {action}] Keine passenden Kandidaten für 'auto' (Feld \"candidates\")")
+                return ""
+            result = self.send_request(text, action, prompt, is_image, *route, sink, cancel_event, image)
+            # Scheitert ein Kandidat, sofort den nächsten versuchen, solange nichts ausgegeben wurde
+            if result or not can_resend(sink):
+                return result
+            tried.append(route)
+            logger.warning(f"[{combo}: {action}] Auto-Routing: {route[0]}/{route[1]} ohne Antwort, "
+                           f"versuche den nächsten Kandidaten")
+
+    def send_request(self, text, action, prompt, is_image, provider, model, sink=None, cancel_event=None, image=None):
+        """Sendet die Anfrage an einen Provider, mit dem Hotkey-Feld "hedge" abgesichert"""
+        hotkey = self.hotkey_registry.get(action)
+        hedge = hotkey.get("hedge") if hotkey else None
+        if hedge:
+            result = self.process_hedged(text, action, prompt, provider, model, hedge, cancel_event, image, sink)
+            if result and sink is not None:
+                if sink.chunks == 0:
+                    sink.write(result)
+                sink.close()
+            return result
+        start = time.perf_counter()
+        result = self.call_provider(provider, text, action, prompt, is_image, model, sink, cancel_event, image)
+        self.record_latency(provider, model, text, is_image, time.perf_counter() - start, bool(result))
+        return result
+
+    def log_duplicate(self, combo, action, flight):
+        """Meldet eine zusammengelegte Aktivierung samt Zähler der eingesparten Aufrufe"""
+        saved = self.single_flight.stats()["saved"]
+        if flight.role == JOINED:
+            message = f"Ответ взят из такого же выполнявшегося запроса (сэкономлено вызовов: {saved})"
+        else:
+            message = f"Повторная активация пропущена: такой же запрос уже выполняется (сэкономлено вызовов: {saved})"
+        logger.info(f"[{combo}: {action}] {message}", extra={"duplicate": flight.role, "saved_calls": saved})
+        self.publish_stats()
+
+    def call_provider(self, provider, text, action, prompt, is_image, model, sink=None, cancel_event=None,
+                      image=None):
+        """Leitet die Anfrage mit Frist und Wiederholungen an den Provider weiter; liefert "" bei Fehlern
+
+        Schneidet das aus der Eingabelänge geschätzte Budget die Antwort ab,
+        wird sie einmal mit der vollen Obergrenze des Hotkeys ("max")
+        wiederholt, sofern noch nichts sichtbar ausgegeben wurde. Bleibt sie
+        abgeschnitten, ist das Ergebnis ein TruncatedText (nicht im Cache).
+        """
+        hotkey = self.hotkey_registry.get(action)
+        combo = hotkey.combination if hotkey else ""
+        spec = hotkey.get("output_budget") if hotkey else None
+        budget = output_budget(spec, text, is_image)
+        result = self.request_provider(provider, text, action, prompt, is_image, model, sink, cancel_event, image,
+                                       budget)
+        cap = int(resolve_budget(spec)["max"])
+        if is_truncated(result) and budget.max_tokens < cap and can_resend(sink):
+            logger.warning(f"[{combo}: {action}] Ответ обрезан на {budget.limit} токенах, повтор с пределом {cap}",
+                           extra={"budget": budget.limit})
+            if sink is not None:
+                sink.truncated = False
+            budget = OutputBudget(None, cap)
+            result = self.request_provider(provider, text, action, prompt, is_image, model, sink, cancel_event,
+                                           image, budget)
+        if is_truncated(result):
+            limit = budget.limit or budget.max_tokens
+            logger.warning(f"[{combo}: {action}] Ответ обрезан: превышен бюджет в {limit} токенов",
+                           extra={"budget": limit})
+        return result
+
+    def request_provider(self, provider, text, action, prompt, is_image, model, sink, cancel_event, image, budget):
+        """Ein Aufruf von call_provider mit festem OutputBudget; TruncatedText, wenn die Antwort abgeschnitten ist"""
+        hotkey = self.hotkey_registry.get(action)
+        combo = hotkey.combination if hotkey else ""
+        if cancel_event is None:
+            cancel_event = getattr(sink, "cancel_event", None)
+        detached = sink is None and cancel_event is not None
+        if detached:
+            # Auch ohne sichtbare Ausgabe als Stream senden: ein nach Abbruch verlassener Aufruf endet beim
+            # nächsten Fragment und schließt die Verbindung, statt die ganze Antwort weiter zu erzeugen
+            sink = CollectSink(cancel_event)
+        elif sink is not None:
+            sink.token_limit = budget.limit
+        max_tokens = budget.max_tokens
+        # Dasselbe EncodedImage für jeden Versuch: Wiederholungen kodieren nicht neu
+        image = image if is_image else None
+        methods = {
+            "Gemini": lambda timeout: self._process_with_gemini(text, action, prompt, image, model, sink, timeout,
+                                                                max_tokens),
+            "Mistral": lambda timeout: self._process_with_mistral(text, action, prompt, model, sink, timeout,
+                                                                  max_tokens, image),
+            "Groq": lambda timeout: self._process_with_groq(text, action, prompt, model, sink, timeout, max_tokens,
+                                                            image),
+        }
+        if provider not in methods:
+            logger.error(f"[{combo}: {action}] Ungültiger Provider: {provider}")
+            return ""
+        # Eingabe plus eine etwa gleich lange Antwort gegen das Tokenlimit rechnen
+        tokens = estimate_tokens(prompt + text) * 2
+
+        def admit():
+            # Wartet ohne Frist: in der Warteschlange des Ratenlimits verstreicht keine Provider-Zeit
+            if not self.rate_limiter.acquire(provider, tokens, cancel_event):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise StreamCancelled()
+                raise QuotaExhausted(f"Tageskontingent für {provider} erschöpft")
+
+        def attempt(timeout):
+            if detached:
+                # Vor dem ersten Fragment lässt sich der Aufruf nicht unterbrechen, nur verlassen
+                return run_cancellable(lambda: methods[provider](timeout), cancel_event)
+            return methods[provider](timeout)
+
+        try:
+            result = self.resilience.call(provider, attempt, hotkey.get("timeout") if hotkey else None,
+                                          lambda: can_resend(sink), cancel_event, admit)
+            return mark_truncated(result, sink is not None and sink.truncated)
+        except StreamCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"[{combo}: {action}] {provider} Error: {e}")
+            return ""
+
+    def on_resilience_event(self, event):
+        """Meldet Wiederholungen und Breaker-Wechsel im Log (strukturiert in extra["event"])"""
+        extra = {"event": event._asdict()}
+        if event.kind == "retry":
+            logger.warning(f"{event.provider}: повтор {event.attempt}/{self.resilience.max_retries} "
+                           f"через {event.delay:.1f} с ({event.error})", extra=extra)
+        elif event.kind == "circuit_open":
+            logger.warning(f"{event.provider}: провайдер недоступен, запросы приостановлены на "
+                           f"{self.resilience.reset_timeout} с", extra=extra)
+        elif event.kind == "circuit_closed":
+            logger.info(f"{event.provider}: провайдер снова доступен", extra=extra)
+        else:
+            logger.debug(f"{event.provider}: {event.kind} (Versuch {event.attempt})", extra=extra)
+
+    def choose_route(self, hotkey, text, is_image, exclude=()):
+        """Schnellster gesunder Kandidat aus dem Hotkey-Feld "candidates" (ohne exclude) oder None"""
+        candidates = [
+            (c.get("api_provider", "Gemini"), c.get("model", ""))
+            for c in hotkey.get("candidates", [])
+            if (c.get("api_provider", "Gemini"), c.get("model", "")) not in exclude
+            and self.providers.has_client(c.get("api_provider", "Gemini"))
+            and self.resilience.available(c.get("api_provider", "Gemini"))
+            # Erschöpfte Tageskontingente sofort überspringen, nicht erst nach gescheiterten Anfragen
+            and not self.rate_limiter.exhausted(c.get("api_provider", "Gemini"))
+        ]
+        route = self.router.choose(candidates, len(text), is_image)
+        if route is not None:
+            logger.debug(f"[{hotkey.label}] Auto-Routing: {route[0]}/{route[1]}")
+        return route
+
+    def record_latency(self, provider, model, text, is_image, seconds, ok):
+        """Antwortzeit für Hedging (nur Erfolge) und Routing (auch Fehler) erfassen"""
+        if ok:
+            self.latency_tracker.record(provider, model, seconds)
+        self.router.record(provider, model, len(text), is_image, seconds, ok)
+
+    def process_hedged(self, text, action, prompt, provider, model, hedge, cancel_event=None, image=None,
+                       sink=None):
+        """Sichert die Anfrage mit einem zweiten Provider ab (Hotkey-Feld "hedge"); beide teilen sich image
+
+        Wird die Antwort live getippt oder im Log gezeigt, streamt die Anfrage,
+        die zuerst Tokens liefert, in sink; sonst schreibt send_request die
+        erste vollständige Antwort am Ende.
+        """
+        is_image = image is not None
+        settings = {**HEDGE_DEFAULTS, **self.config.get("hedging", {}), **hedge}
+        backup_provider = hedge.get("api_provider", provider)
+        backup_model = hedge.get("model", model)
+        stream = HedgeStream(sink) if sink is not None and (sink.logs_output or not sink.pastes_result) else None
+
+        def attempt(index, attempt_provider, attempt_model):
+            def run(cancel):
+                attempt_sink = CollectSink(cancel) if stream is None else stream.attempt_sink(index, cancel)
+                start = time.perf_counter()
+                result = self.call_provider(attempt_provider, text, action, prompt, is_image, attempt_model,
+                                            attempt_sink, image=image)
+                self.record_latency(attempt_provider, attempt_model, text, is_image,
+                                    time.perf_counter() - start, bool(result))
+                if stream is not None and stream.lost(index):
+                    # Die andere Anfrage streamt schon sichtbar, nur ihre Antwort darf gewinnen
+                    return ""
+                return result
+            return run
+
+        delay = hedge_delay(self.latency_tracker, provider, model, settings)
+        outcome = run_hedged(attempt(PRIMARY, provider, model), attempt(SECONDARY, backup_provider, backup_model),
+                             delay, cancel_event)
+        self.hedge_stats.record(outcome)
+        if outcome.winner is None:
+            # Die Fehler der Versuche stehen im Log ihrer Threads; hier für den Aufrufer (request_errors)
+            logger.error(f"[{action}] Abgesicherte Anfrage: {provider}/{model} und {backup_provider}/{backup_model} "
+                         f"ohne Ergebnis")
+        if outcome.hedged:
+            winner = f"{backup_provider}/{backup_model}" if outcome.winner == SECONDARY else f"{provider}/{model}"
+            logger.debug(f"[{action}] Abgesichert nach {delay:.2f} s, schneller: {winner}")
+        return outcome.result
+
+    def log_processed(self, combo, action, result, sink, cached=False):
+        """Protokolliert das Ergebnis; bei Streaming zusätzlich die Zeit bis zum ersten Fragment"""
+        extra = {"cached": cached}
+        if sink is not None:
+            extra.update(streamed=sink.logs_output, first_chunk=None if cached else sink.first_chunk_latency)
+        logger.info(f"[{combo}: {action}] Processed: {result}", extra={"action": action, **extra})
+
+    def input_image(self, action, image, settings, sink=None):
+        """Eingabebild (PIL-Bild oder Liste von Dateien/Ordnern), nach den Einstellungen "image" vorverarbeitet
+
+        Liefert (EncodedImage, TileSet oder FileBatch, Wahrnehmungs-Hash);
+        (None, None) ohne Bild. Läuft im Worker-Thread der Aktivierung, nicht
+        im Dispatcher.
+        """
+        hotkey = self.hotkey_registry.get(action)
+        if isinstance(image, list):
+            # Kopierte Dateien und Ordner: Stapel ohne gemeinsamen Hash (Cache pro Datei)
+            batch_settings = self.hotkey_settings("batch", BATCH_DEFAULTS, hotkey)
+            return collect_files(image, batch_settings), None
+        if not isinstance(image, Image.Image):
+            return None, None
+        if hotkey is not None and hotkey.get("execution") == TILED:
+            tiled = self.tile_image(hotkey, image, settings)
+            if tiled is not None:
+                return tiled
+        if not settings["enabled"]:
+            return EncodedImage.from_image(image), image_fingerprint(image, settings)
+        prepared = prepare_image(image, settings)
+        (width, height), (new_width, new_height) = prepared.original_size, prepared.size
+        quality = f" q{prepared.quality}" if prepared.quality else ""
+        logger.info(f"[{hotkey.combination if hotkey else ''}: {action}] Изображение {width}×{height} → "
+                    f"{new_width}×{new_height}, {format_bytes(len(prepared.data))} "
+                    f"{prepared.mime_type.split('/')[1].upper()}{quality} ({prepared.seconds * 1000:.0f} мс)",
+                    extra={"image_bytes": len(prepared.data)})
+        self.continue_stream_below(hotkey, sink)
+        return EncodedImage.from_prepared(prepared), prepared.fingerprint
+
+    def tile_image(self, hotkey, image, settings):
+        """Zerlegt ein großes Bild in Kacheln (Hotkey-Feld "execution": "tiled"); None, wenn eine Kachel reicht"""
+        tiling = self.hotkey_settings("tiling", TILING_DEFAULTS, hotkey)
+        image = crop_borders(image, settings)
+        if max(image.size) <= tiling["tile_size"]:
+            return None
+        tiles = split_tiles(image, tiling)
+        if len(tiles.tiles) < 2:
+            return None
+        return tiles, image_fingerprint(image, settings)
+
+    def _process_with_gemini(self, text, action, prompt, image, model, sink=None, timeout=None, max_tokens=2048):
+        """Process with Google Gemini; image: EncodedImage für Bild-Hotkeys, sonst None"""
+        if image is not None:
+            contents = [prompt, image.gemini_part()]
+        else:
+            contents = prompt + text
+        
+        generation_config = self.providers.generation_config(temperature=0.7, max_output_tokens=max_tokens)
+        # Wiederholungen übernimmt call_provider, nicht die Client-Bibliothek
+        request_options = {"timeout": timeout, "retry": None} if timeout else None
+        if sink is not None:
+            response = self.providers.gemini_model(model).generate_content(
+                contents=contents,
+                generation_config=generation_config,
+                stream=True,
+                request_options=request_options
+            )
+            return consume_stream(iter_gemini_chunks(response, sink), sink).strip()
+        response = self.providers.gemini_model(model).generate_content(
+            contents=contents,
+            generation_config=generation_config,
+            request_options=request_options
+        )
+        if not response or not response.text:
+            return ""
+        return mark_truncated(response.text.strip(), stopped_at_limit(response.candidates[0].finish_reason))
+
+    def _process_with_mistral(self, text, action, prompt, model, sink=None, timeout=None, max_tokens=2048,
+                              image=None):
+        """Process with Mistral; image: EncodedImage für Bild-Hotkeys (Vision-Modell, z.B. pixtral)"""
+        client = self.providers.mistral
+        if not client:
+            raise RuntimeError("Mistral client not initialized")
+        
+        params = dict(
+            model=model,
+            messages=[{"role": "user", "content": user_content(prompt, text, image)}],
+            temperature=0.7,
+            max_tokens=max_tokens,
+            timeout_ms=int(timeout * 1000) if timeout else None
+        )
+        if sink is not None:
+            stream = client.chat.stream(**params)
+            return consume_stream(iter_mistral_chunks(stream, sink), sink).strip()
+        response = client.chat.complete(**params)
+        if not response:
+            return ""
+        choice = response.choices[0]
+        return mark_truncated(choice.message.content.strip(), stopped_at_limit(choice.finish_reason))
+
+    def _process_with_groq(self, text, action, prompt, model, sink=None, timeout=None, max_tokens=2048,
+                           image=None):
+        """Process with Groq; image: EncodedImage für Bild-Hotkeys (Vision-Modell, z.B. llama-4-scout)"""
+        client = self.providers.groq
+        if not client:
+            raise RuntimeError("Groq client not initialized")
+        
+        params = dict(
+            model=model,
+            messages=[{"role": "user", "content": user_content(prompt, text, image)}],
+            temperature=0.7,
+            max_tokens=max_tokens,
+            timeout=timeout
+        )
+        if sink is not None:
+            stream = client.chat.completions.create(**params, stream=True)
+            return consume_stream(iter_openai_chunks(stream, sink), sink).strip()
+        response = client.chat.completions.create(**params)
+        if not response:
+            return ""
+        choice = response.choices[0]
+        return mark_truncated(choice.message.content.strip(), stopped_at_limit(choice.finish_reason))
+
+
+class HeadlessClipGen(ClipGenCore):
+    """ClipGen ohne Oberfläche und Zwischenablage (Kommandozeile ohne laufende Instanz)"""
+
+    def __init__(self, config):
+        self.config = config
+        self.init_core()
+
+    def describe(self):
+        return "im eigenen Prozess"
+
+    def hotkeys(self, name=None):
+        return self.rpc_hotkeys(name)
+
+    def close(self):
+        self.shutdown_core()
@@ -0,0 +1,63 @@
+"""
+In-Prozess-Ereigniskanal zwischen Hotkey-Listener, Buttons und Worker-Pool.
+
+Ersetzt die frühere multiprocessing.Queue: kein Pickling, keine Pipe, kein
+Feeder-Thread und kein Polling. Der Dispatcher-Thread schläft auf einer
+Condition-Variable, bis ein Ereignis eintrifft.
+"""
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger('ClipGen')
+
+
+class EventDispatcher:
+    """Reicht Ereignisse in Reihenfolge an einen Handler in einem eigenen Thread weiter"""
+
+    def __init__(self, handler, name="ClipGenEvents"):
+        self.handler = handler
+        self._cond = threading.Condition()
+        self._events = deque()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        # Anzahl der Aufwachvorgänge des Dispatcher-Threads (für Messungen)
+        self.wakeups = 0
+        self.dispatched = 0
+
+    def start(self):
+        self._thread.start()
+
+    def put(self, event):
+        """Stellt ein Ereignis zu; kehrt sofort zurück (auch aus dem pynput-Hook)"""
+        with self._cond:
+            if self._closed:
+                return
+            self._events.append(event)
+            self._cond.notify()
+
+    def close(self, timeout=None):
+        """Beendet den Dispatcher; bereits zugestellte Ereignisse werden noch verarbeitet"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if timeout is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._events and not self._closed:
+                    self._cond.wait()
+                    self.wakeups += 1
+                if not self._events:
+                    return
+                batch = list(self._events)
+                self._events.clear()
+
+            for event in batch:
+                try:
+                    self.handler(event)
+                except Exception as e:
+                    logger.error(f"Error processing event: {e}")
+                self.dispatched += 1
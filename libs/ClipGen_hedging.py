@@ -0,0 +1,217 @@
+"""
+Abgesicherte (hedged) Anfragen für latenzkritische Hotkeys.
+
+Antwortet der primäre Provider nicht innerhalb eines Perzentils seiner
+jüngsten Latenzen, geht derselbe Prompt zusätzlich an einen zweiten
+Provider. Die erste vollständige Antwort gewinnt, die andere Anfrage wird
+über ihr cancel_event abgebrochen. Wird die Antwort live getippt oder im Log
+gezeigt, gewinnt stattdessen die Anfrage, die zuerst Tokens liefert
+(HedgeStream).
+"""
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+
+from libs.ClipGen_jobs import CANCEL_POLL_INTERVAL
+from libs.ClipGen_streaming import StreamCancelled, StreamSink
+
+logger = logging.getLogger('ClipGen')
+
+HEDGE_DEFAULTS = {
+    # Perzentil der jüngsten Latenzen des primären Providers, ab dem abgesichert wird
+    "percentile": 90,
+    # Grenzen für die Wartezeit vor der zweiten Anfrage (Sekunden)
+    "min_delay": 0.2,
+    "max_delay": 5.0,
+    # Wartezeit, solange noch keine Messwerte vorliegen
+    "initial_delay": 1.0,
+    # Anzahl der gespeicherten Latenzen pro (Provider, Modell)
+    "window": 50,
+}
+
+HedgeOutcome = namedtuple("HedgeOutcome", "result winner hedged")
+
+PRIMARY = 0
+SECONDARY = 1
+
+
+class LatencyTracker:
+    """Gleitendes Fenster der letzten Antwortzeiten pro (Provider, Modell)"""
+
+    def __init__(self, window=HEDGE_DEFAULTS["window"]):
+        self.window = max(1, int(window))
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider, model, seconds):
+        with self._lock:
+            samples = self._samples.get((provider, model))
+            if samples is None or samples.maxlen != self.window:
+                samples = self._samples[(provider, model)] = deque(samples or (), maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, provider, model, p):
+        """p-tes Perzentil in Sekunden oder None ohne Messwerte"""
+        with self._lock:
+            samples = sorted(self._samples.get((provider, model), ()))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(p / 100 * len(samples))) - 1))
+        return samples[index]
+
+
+class HedgeStats:
+    """Zähler für Absicherungsquote und Gewinner"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedged = 0
+        self.primary_wins = 0
+        self.secondary_wins = 0
+        self.failures = 0
+
+    def record(self, outcome):
+        with self._lock:
+            self.requests += 1
+            self.hedged += outcome.hedged
+            if outcome.winner == PRIMARY:
+                self.primary_wins += 1
+            elif outcome.winner == SECONDARY:
+                self.secondary_wins += 1
+            else:
+                self.failures += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedged": self.hedged,
+                "hedge_rate": self.hedged / self.requests if self.requests else 0.0,
+                "primary_wins": self.primary_wins,
+                "secondary_wins": self.secondary_wins,
+                "failures": self.failures,
+            }
+
+
+class HedgeStream:
+    """Leitet die Fragmente der ersten Anfrage, die Tokens liefert, an die sichtbare Senke weiter
+
+    Die andere Anfrage bricht bei ihrem nächsten Fragment ab (lost() wird
+    wahr); ihre Antwort darf nicht mehr gewinnen, sonst stünde im Fenster ein
+    anderer Text als der gespeicherte.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.owner = None
+        self._lock = threading.Lock()
+
+    def claim(self, index):
+        with self._lock:
+            if self.owner is None:
+                self.owner = index
+            return self.owner == index
+
+    def lost(self, index):
+        with self._lock:
+            return self.owner is not None and self.owner != index
+
+    def attempt_sink(self, index, cancel_event):
+        return _AttemptSink(self, index, cancel_event)
+
+
+class _AttemptSink(StreamSink):
+    """Senke einer einzelnen Anfrage; übernimmt pastes_result/logs_output der sichtbaren Senke für can_resend"""
+
+    def __init__(self, stream, index, cancel_event):
+        super().__init__()
+        self.stream = stream
+        self.index = index
+        self.cancel_event = cancel_event
+        self.pastes_result = stream.sink.pastes_result
+        self.logs_output = stream.sink.logs_output
+
+    def on_chunk(self, chunk):
+        if not self.stream.claim(self.index):
+            raise StreamCancelled()
+        self.stream.sink.write(chunk)
+
+    def close(self):
+        if self.stream.owner == self.index:
+            self.stream.sink.truncated = self.truncated
+
+
+def hedge_delay(tracker, provider, model, settings):
+    """Wartezeit vor der zweiten Anfrage aus dem Perzentil der bisherigen Latenzen"""
+    latency = tracker.percentile(provider, model, settings["percentile"])
+    if latency is None:
+        latency = settings["initial_delay"]
+    return min(settings["max_delay"], max(settings["min_delay"], latency))
+
+
+def run_hedged(primary, secondary, delay, cancel_event=None):
+    """Führt primary aus und nach delay Sekunden zusätzlich secondary
+
+    Beide sind Funktionen cancel_event -> Ergebnistext ("" bei Fehler). Schlägt
+    primary vor Ablauf von delay fehl, startet secondary sofort. Liefert ein
+    HedgeOutcome; winner ist None, wenn beide fehlschlagen. Wird cancel_event
+    gesetzt, werden beide Anfragen abgebrochen (StreamCancelled).
+    """
+    cond = threading.Condition()
+    results = {}
+    cancels = {}
+
+    def start(index, func):
+        cancel = threading.Event()
+        cancels[index] = cancel
+
+        def run():
+            try:
+                result = func(cancel)
+            except StreamCancelled:
+                result = ""
+            except Exception as e:
+                logger.error(f"Fehler bei abgesicherter Anfrage: {e}")
+                result = ""
+            with cond:
+                results[index] = result
+                cond.notify_all()
+        threading.Thread(target=run, name=f"ClipGenHedge-{index}", daemon=True).start()
+
+    def wait(timeout=None):
+        # Aufrufer hält cond; bei Abbruch alle Anfragen beenden
+        if cancel_event is not None:
+            timeout = CANCEL_POLL_INTERVAL if timeout is None else min(timeout, CANCEL_POLL_INTERVAL)
+            if cancel_event.is_set():
+                for cancel in cancels.values():
+                    cancel.set()
+                raise StreamCancelled()
+        cond.wait(timeout)
+
+    deadline = time.monotonic() + delay
+    with cond:
+        start(PRIMARY, primary)
+        while PRIMARY not in results:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            wait(remaining)
+
+        hedged = not results.get(PRIMARY)
+        if hedged:
+            start(SECONDARY, secondary)
+
+        winner = None
+        while True:
+            winner = next((index for index in cancels if results.get(index)), None)
+            if winner is not None or len(results) == len(cancels):
+                break
+            wait()
+
+    # Verlierer abbrechen: das nächste empfangene Fragment beendet die Anfrage
+    for index, cancel in cancels.items():
+        if index != winner:
+            cancel.set()
+    return HedgeOutcome(results.get(winner, ""), winner, hedged)
@@ -0,0 +1,162 @@
+"""
+Vorkompilierte Hotkey-Registry.
+
+Die Hotkeys aus settings.json werden einmalig in eine unveränderliche
+Registry übersetzt: (Modifikator-Maske, Taste) -> Hotkey für den
+pynput-Listener sowie Name und Kombination -> Hotkey für alle übrigen
+Code-Pfade. Jede Aktivierung kostet damit nur Dictionary-Lookups,
+unabhängig von der Anzahl der Hotkeys.
+"""
+from types import MappingProxyType
+
+MOD_CTRL = 1
+MOD_ALT = 2
+MOD_SHIFT = 4
+
+# Namen der Modifikatortasten (pynput und settings.json) -> Bit der Maske
+MODIFIER_KEYS = {
+    "ctrl": MOD_CTRL, "ctrl_l": MOD_CTRL, "ctrl_r": MOD_CTRL,
+    "alt": MOD_ALT, "alt_l": MOD_ALT, "alt_r": MOD_ALT,
+    "shift": MOD_SHIFT, "shift_l": MOD_SHIFT, "shift_r": MOD_SHIFT,
+}
+
+DEFAULT_PROVIDER = "Gemini"
+DEFAULT_MODEL = "gemini-2.0-flash-exp"
+
+_KEY_CACHE_LIMIT = 512
+_key_cache = {}
+
+
+def normalize_key(key):
+    """Wandelt eine pynput-Taste in den Vergleichsstring um (z.B. Key.f1 -> 'f1')"""
+    try:
+        return _key_cache[key]
+    except KeyError:
+        pass
+    except TypeError:
+        # Nicht hashbare Objekte werden einfach jedes Mal umgewandelt
+        return str(key).lower().replace("key.", "").replace("'", "")
+
+    key_str = str(key).lower().replace("key.", "").replace("'", "")
+    if len(_key_cache) < _KEY_CACHE_LIMIT:
+        _key_cache[key] = key_str
+    return key_str
+
+
+def parse_combination(combination):
+    """Zerlegt 'Ctrl+Shift+F1' in (Maske, Taste); Einzeltasten liefern Maske None"""
+    combo = (combination or "").lower().strip()
+    if not combo:
+        return None
+    if "+" not in combo:
+        return None, combo
+
+    parts = [part.strip() for part in combo.split("+")]
+    mask = 0
+    for part in parts[:-1]:
+        mask |= MODIFIER_KEYS.get(part, 0)
+    return mask, parts[-1]
+
+
+class Hotkey:
+    """Unveränderlicher Schnappschuss eines Hotkeys aus settings.json"""
+    __slots__ = ("index", "name", "combination", "prompt", "provider", "model", "type",
+                 "log_color", "stream", "cache", "has_modifiers", "settings")
+
+    def __init__(self, index, settings, has_modifiers=False):
+        self.index = index
+        self.settings = MappingProxyType(dict(settings))
+        self.name = settings.get("name", "")
+        self.combination = settings.get("combination", "")
+        self.prompt = settings.get("prompt", "")
+        self.provider = settings.get("api_provider", DEFAULT_PROVIDER)
+        self.model = settings.get("model", DEFAULT_MODEL)
+        self.type = settings.get("type", "text")
+        self.log_color = settings.get("log_color", "#FFFFFF")
+        self.stream = settings.get("stream", "off")
+        self.cache = settings.get("cache", True)
+        self.has_modifiers = has_modifiers
+
+    @property
+    def is_image(self):
+        return self.type == "image"
+
+    @property
+    def label(self):
+        """Kopf der Log-Einträge, z.B. 'Ctrl+F1: Korrektur'"""
+        return f"{self.combination}: {self.name}"
+
+    def get(self, key, default=None):
+        """Zugriff auf weitere (optionale) Felder aus settings.json"""
+        return self.settings.get(key, default)
+
+    def __repr__(self):
+        return f"Hotkey({self.index}, {self.name!r}, {self.combination!r})"
+
+
+class HotkeyRegistry:
+    """Unveränderliche Lookup-Tabellen für Hotkey-Erkennung und Aktionen"""
+    __slots__ = ("_hotkeys", "_combos", "_single", "_by_name", "_by_label")
+
+    def __init__(self, hotkeys, combos, single):
+        self._hotkeys = tuple(hotkeys)
+        self._combos = MappingProxyType(combos)
+        self._single = MappingProxyType(single)
+        by_name = {}
+        by_label = {}
+        for hotkey in self._hotkeys:
+            # Wie bei der früheren Suche mit next(...) gewinnt der erste Eintrag
+            by_name.setdefault(hotkey.name, hotkey)
+            by_label.setdefault(hotkey.label, hotkey)
+        self._by_name = MappingProxyType(by_name)
+        self._by_label = MappingProxyType(by_label)
+
+    def lookup(self, mask, key_str):
+        """Liefert den Hotkey für die gedrückte Taste oder None"""
+        entry = self._combos.get((mask, key_str))
+        single = self._single.get(key_str)
+        # Wie bei der früheren linearen Suche gewinnt der Hotkey weiter oben in der Liste
+        if single is not None and (entry is None or single.index < entry.index):
+            return single
+        return entry
+
+    def get(self, name):
+        """Hotkey anhand des Aktionsnamens oder None"""
+        return self._by_name.get(name)
+
+    def by_combination(self, combination):
+        """Hotkey anhand der Kombination aus settings.json (z.B. 'Ctrl+F1') oder None"""
+        parsed = parse_combination(combination)
+        if parsed is None:
+            return None
+        mask, key = parsed
+        return self._single.get(key) if mask is None else self._combos.get((mask, key))
+
+    def by_label(self, label):
+        """Hotkey anhand des Log-Kopfs 'Kombination: Name' oder None"""
+        return self._by_label.get(label)
+
+    def __iter__(self):
+        return iter(self._hotkeys)
+
+    def __len__(self):
+        return len(self._hotkeys)
+
+
+def compile_hotkeys(hotkeys):
+    """Übersetzt die Hotkey-Liste aus der Konfiguration in eine HotkeyRegistry"""
+    entries = []
+    combos = {}
+    single = {}
+    for index, settings in enumerate(hotkeys):
+        parsed = parse_combination(settings.get("combination", ""))
+        hotkey = Hotkey(index, settings, parsed is not None and parsed[0] is not None)
+        entries.append(hotkey)
+        if parsed is None:
+            continue
+        mask, key = parsed
+        if mask is None:
+            single.setdefault(key, hotkey)
+        else:
+            combos.setdefault((mask, key), hotkey)
+    return HotkeyRegistry(entries, combos, single)
@@ -0,0 +1,431 @@
+"""
+Vorverarbeitung von Bildern aus der Zwischenablage vor Vision-Anfragen.
+
+Ein Screenshot über mehrere 4K-Monitore würde sonst als PNG mit mehreren
+Megabyte hochgeladen. Vor dem Senden werden einfarbige Ränder abgeschnitten
+(NumPy, vektorisiert über alle Pixel), das Bild auf die Auflösung verkleinert,
+die das Modell tatsächlich nutzt, für OCR-Prompts optional in Graustufen
+umgewandelt und als JPEG/WebP mit Qualitätsziel kodiert.
+
+Ein Wahrnehmungs-Hash (dHash oder pHash) des vorbereiteten Bildes dient als
+Schlüssel für den Bild-Cache: erneut kopierte oder minimal anders
+zugeschnittene Screenshots ergeben (fast) denselben Hash.
+
+Sehr große Bilder (lange Scroll-Aufnahmen, mehrere Monitore) können in
+Kacheln zerlegt werden, die parallel erkannt werden. Geschnitten wird
+bevorzugt in leeren Zeilen und Spalten; sonst überlappen die Kacheln, und
+doppelt erkannte Zeilen werden beim Zusammensetzen entfernt.
+
+Das kodierte Bild wird einmal in einem EncodedImage abgelegt und von allen
+Versuchen (Wiederholungen, Absicherung, Fallback) wiederverwendet; die
+Base64-Data-URL für Mistral und Groq entsteht beim ersten Bedarf und nur
+einmal.
+"""
+import base64
+import difflib
+import io
+import logging
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger('ClipGen')
+
+IMAGE_DEFAULTS = {
+    # False: Bild unverändert an den Provider übergeben
+    "enabled": True,
+    # Einfarbige Ränder (z.B. schwarze Flächen neben einem Fenster) abschneiden
+    "crop_borders": True,
+    # Maximale Abweichung pro Farbkanal, die noch als Randfarbe gilt
+    "border_tolerance": 10,
+    # Längste Seite nach dem Verkleinern (Gemini rechnet in Kacheln zu 768 px)
+    "max_side": 1536,
+    # Graustufen, z.B. für Texterkennung (OCR)
+    "grayscale": False,
+    # JPEG, WEBP oder PNG
+    "format": "JPEG",
+    # Startqualität für JPEG/WEBP
+    "quality": 85,
+    # Qualitätsziel: Qualität schrittweise senken, bis das Bild höchstens so groß ist (None = aus)
+    "max_bytes": 400_000,
+    # Untergrenze beim Senken der Qualität
+    "min_quality": 50,
+    # Wahrnehmungs-Hash für den Bild-Cache: phash (DCT) oder dhash (Helligkeitsverlauf);
+    # bei Text-Screenshots trennt phash neu zugeschnittene Bilder deutlicher von anderen Seiten
+    "hash": "phash",
+    # Kantenlänge des Hash-Rasters: 8 ergibt 64 Bit
+    "hash_size": 8,
+    # Höchstens so viele abweichende Bits gelten als dasselbe Bild (0 = nur identische Hashes)
+    "max_distance": 6,
+}
+
+HASH_METHODS = ("dhash", "phash")
+
+# Ausführungsart (Hotkey-Feld "execution") für Bild-Hotkeys: in Kacheln zerlegen
+TILED = "tiled"
+
+TILING_DEFAULTS = {
+    # Maximale Kantenlänge einer Kachel in Pixeln des Originals (passt zu max_side: keine Verkleinerung)
+    "tile_size": 1536,
+    # Überlappung, wenn im Suchbereich keine leere Zeile/Spalte liegt
+    "overlap": 64,
+    # Gleichzeitig laufende Kacheln pro Aktivierung
+    "max_parallel": 4,
+    # Maximaler Helligkeitsunterschied innerhalb einer Zeile/Spalte, die noch als leer gilt
+    "blank_tolerance": 8,
+}
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+# Schrittweite beim Senken der Qualität
+_QUALITY_STEP = 10
+# Zeilen/Spalten pro Block beim Suchen der Ränder
+_SCAN_BLOCK = 64
+# Rand, der beim Abschneiden stehen bleibt (Text direkt an der Bildkante erkennen Modelle schlechter)
+_CROP_PADDING = 4
+# Bis zu dieser Pixelzahl wird zusätzlich PNG probiert (kleine Screenshots mit Text sind als PNG oft kleiner)
+_PNG_CANDIDATE_PIXELS = 1_000_000
+# Luminanzgewichte nach ITU-R BT.601 (wie Image.convert("L"))
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+# box: (links, oben, rechts, unten) im Originalbild; overlaps: überlappt die vorherige Kachel derselben
+# Spalte; joiner: Text vor dem Ergebnis dieser Kachel beim Zusammensetzen
+Tile = namedtuple("Tile", "index box image overlaps joiner")
+# Ein in Kacheln zerlegtes Bild aus der Zwischenablage; size: Größe nach dem Abschneiden der Ränder
+TileSet = namedtuple("TileSet", "tiles size")
+
+# Höchstens so viele Zeilen am Kachelrand werden auf Wiederholungen geprüft
+_MAX_OVERLAP_LINES = 8
+# Ab dieser Ähnlichkeit (difflib) gelten zwei erkannte Zeilen als dieselbe
+_LINE_SIMILARITY = 0.8
+
+# data: kodierte Bytes; size/original_size: (Breite, Höhe); fingerprint: Wahrnehmungs-Hash;
+# seconds: Dauer der Vorverarbeitung
+PreparedImage = namedtuple("PreparedImage", "data mime_type size original_size quality fingerprint seconds")
+
+
+class EncodedImage:
+    """Einmal kodiertes Bild für alle Provider-Aufrufe einer Aktivierung
+
+    Gemini bekommt die Bytes direkt, Mistral und Groq eine Data-URL im
+    OpenAI-Format. Die Base64-Kodierung entsteht beim ersten Aufruf von
+    data_url() und wird danach von allen Threads geteilt.
+    """
+    __slots__ = ("data", "mime_type", "_data_url", "_lock")
+
+    def __init__(self, data, mime_type):
+        self.data = data
+        self.mime_type = mime_type
+        self._data_url = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_prepared(cls, prepared):
+        return cls(prepared.data, prepared.mime_type)
+
+    @classmethod
+    def from_image(cls, image):
+        """Unverändertes PIL-Bild verlustfrei als PNG (Vorverarbeitung ausgeschaltet)"""
+        return cls(_encode(_flatten(image), "PNG", None), MIME_TYPES["PNG"])
+
+    def gemini_part(self):
+        return {"mime_type": self.mime_type, "data": self.data}
+
+    def data_url(self):
+        if self._data_url is None:
+            with self._lock:
+                if self._data_url is None:
+                    self._data_url = f"data:{self.mime_type};base64,{base64.b64encode(self.data).decode('ascii')}"
+        return self._data_url
+
+    def openai_part(self):
+        """Inhaltsteil {"type": "image_url", ...} für Mistral und Groq"""
+        return {"type": "image_url", "image_url": {"url": self.data_url()}}
+
+
+def user_content(prompt, text, image=None):
+    """Inhalt der Benutzernachricht für Mistral und Groq: reiner Text oder Text plus Bild"""
+    if image is None:
+        return prompt + text
+    return [{"type": "text", "text": prompt + text}, image.openai_part()]
+
+
+def image_settings(config=None, hotkey_settings=None):
+    """Globale Einstellungen "image" aus settings.json, überschrieben durch das Hotkey-Feld "image" """
+    return {**IMAGE_DEFAULTS, **(config or {}), **(hotkey_settings or {})}
+
+
+def _edge(has_content, length, reverse=False):
+    """Erste (bzw. letzte) Zeile/Spalte mit Inhalt; has_content(slice) -> bool-Array je Zeile/Spalte
+
+    Geprüft wird blockweise vom Rand nach innen, damit bei Bildern ohne Rand
+    nur ein schmaler Streifen gelesen wird.
+    """
+    for offset in range(0, length, _SCAN_BLOCK):
+        if reverse:
+            stop = length - offset
+            begin = max(0, stop - _SCAN_BLOCK)
+            hits = np.flatnonzero(has_content(slice(begin, stop)))
+            if hits.size:
+                return begin + int(hits[-1])
+        else:
+            begin = offset
+            hits = np.flatnonzero(has_content(slice(begin, min(length, begin + _SCAN_BLOCK))))
+            if hits.size:
+                return begin + int(hits[0])
+    return None
+
+
+def crop_box(pixels, tolerance, padding=0):
+    """Begrenzungsrahmen (links, oben, rechts, unten) des Inhalts innerhalb einfarbiger Ränder
+
+    Randfarbe ist die Farbe der linken oberen Ecke; padding Pixel Rand
+    bleiben (soweit vorhanden) stehen. Liefert None, wenn das ganze Bild
+    diese Farbe hat.
+    """
+    background = pixels[0, 0].astype(np.int16)
+    low = np.clip(background - tolerance, 0, 255).astype(np.uint8)
+    span = (np.clip(background + tolerance, 0, 255) - low).astype(np.uint8)
+
+    def content(region):
+        # uint8-Subtraktion läuft unter low über und wird damit ebenfalls größer als span
+        return (region - low) > span
+
+    height, width = pixels.shape[:2]
+    top = _edge(lambda rows: content(pixels[rows]).reshape(rows.stop - rows.start, -1).any(axis=1), height)
+    if top is None:
+        return None
+    bottom = _edge(lambda rows: content(pixels[rows]).reshape(rows.stop - rows.start, -1).any(axis=1),
+                   height, reverse=True)
+    body = pixels[top:bottom + 1]
+
+    def columns(selection):
+        found = content(body[:, selection]).any(axis=0)
+        return found.any(axis=1) if found.ndim == 2 else found
+
+    left = _edge(columns, width)
+    right = _edge(columns, width, reverse=True)
+    return (max(0, left - padding), max(0, top - padding),
+            min(width, right + 1 + padding), min(height, bottom + 1 + padding))
+
+
+def to_grayscale(pixels):
+    """RGB-Array -> Graustufen-Array (uint8)"""
+    return np.rint(pixels[..., :3].astype(np.float32) @ _LUMA).clip(0, 255).astype(np.uint8)
+
+
+def dhash(image, hash_size=8):
+    """Differenz-Hash: ist ein Pixel des verkleinerten Graubilds heller als sein linker Nachbar?"""
+    pixels = np.asarray(image.convert("L").resize((hash_size + 1, hash_size), Image.BOX), dtype=np.int16)
+    return np.packbits(pixels[:, 1:] > pixels[:, :-1]).tobytes()
+
+
+def _dct_matrix(size):
+    # Orthonormale DCT-II-Basis; die 2D-DCT ist basis @ X @ basis.T
+    k = np.arange(size, dtype=np.float32)[:, None]
+    n = np.arange(size, dtype=np.float32)[None, :]
+    basis = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2.0 / size)
+    basis[0] /= np.sqrt(2.0)
+    return basis
+
+
+def phash(image, hash_size=8):
+    """DCT-Hash: niedrige Frequenzen des Graubilds über bzw. unter ihrem Median"""
+    size = hash_size * 4
+    pixels = np.asarray(image.convert("L").resize((size, size), Image.BOX), dtype=np.float32)
+    basis = _dct_matrix(size)
+    low = (basis @ pixels @ basis.T)[:hash_size, :hash_size]
+    # Der Gleichanteil (mittlere Helligkeit) würde den Median verzerren
+    return np.packbits(low > np.median(low.ravel()[1:])).tobytes()
+
+
+def image_fingerprint(image, settings=IMAGE_DEFAULTS):
+    """Wahrnehmungs-Hash nach settings["hash"] als bytes"""
+    method = settings["hash"]
+    if method not in HASH_METHODS:
+        logger.warning(f"Unbekanntes Hash-Verfahren '{method}', verwende dhash")
+        method = "dhash"
+    return (phash if method == "phash" else dhash)(image, int(settings["hash_size"]))
+
+
+def hamming_distances(fingerprints, fingerprint):
+    """Anzahl abweichender Bits zwischen fingerprint und jedem Eintrag von fingerprints (gleich lange bytes)"""
+    stack = np.frombuffer(b"".join(fingerprints), dtype=np.uint8).reshape(len(fingerprints), -1)
+    query = np.frombuffer(fingerprint, dtype=np.uint8)
+    return np.unpackbits(stack ^ query, axis=1).sum(axis=1)
+
+
+def _flatten(image):
+    """RGB bzw. L ohne Transparenz (transparente Flächen werden weiß)"""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        return Image.alpha_composite(background, image).convert("RGB")
+    if image.mode not in ("RGB", "L"):
+        return image.convert("RGB")
+    return image
+
+
+def _encode(image, image_format, quality):
+    buffer = io.BytesIO()
+    if image_format == "PNG":
+        image.save(buffer, format="PNG", optimize=False, compress_level=6)
+    elif image_format == "WEBP":
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def crop_borders(image, settings=IMAGE_DEFAULTS):
+    """Schneidet einfarbige Ränder ab, wenn settings["crop_borders"] gesetzt ist"""
+    if settings["crop_borders"]:
+        box = crop_box(np.asarray(image), settings["border_tolerance"], _CROP_PADDING)
+        if box is not None and box != (0, 0) + image.size:
+            return image.crop(box)
+    return image
+
+
+def prepare_image(image, settings=IMAGE_DEFAULTS):
+    """Schneidet, verkleinert und kodiert ein PIL-Bild; liefert PreparedImage"""
+    start = time.perf_counter()
+    original_size = image.size
+    image = _flatten(image)
+    image_format = str(settings["format"]).upper()
+    if image_format not in MIME_TYPES:
+        logger.warning(f"Unbekanntes Bildformat '{settings['format']}', verwende JPEG")
+        image_format = "JPEG"
+
+    image = crop_borders(image, settings)
+
+    max_side = settings["max_side"]
+    if max_side and max(image.size) > max_side:
+        scale = max_side / max(image.size)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        # reducing_gap: erst um den ganzzahligen Faktor per Box-Filter, dann den Rest mit Lanczos
+        # (bei 4K etwa halb so lange wie Lanczos allein, für Text kaum sichtbar)
+        image = image.resize(size, Image.LANCZOS, reducing_gap=1.0)
+    if settings["grayscale"] and image.mode != "L":
+        # Nach dem Verkleinern: weniger Pixel umzurechnen
+        image = Image.fromarray(to_grayscale(np.asarray(image)))
+
+    quality = int(settings["quality"])
+    data = _encode(image, image_format, quality)
+    max_bytes = settings["max_bytes"]
+    while (max_bytes and image_format != "PNG" and len(data) > max_bytes
+           and quality - _QUALITY_STEP >= settings["min_quality"]):
+        quality -= _QUALITY_STEP
+        data = _encode(image, image_format, quality)
+    if image_format != "PNG" and image.width * image.height <= _PNG_CANDIDATE_PIXELS:
+        lossless = _encode(image, "PNG", None)
+        if len(lossless) < len(data):
+            data, image_format = lossless, "PNG"
+    return PreparedImage(data, MIME_TYPES[image_format], image.size, original_size,
+                         quality if image_format != "PNG" else None, image_fingerprint(image, settings),
+                         time.perf_counter() - start)
+
+
+def _segments(blank, target, overlap):
+    """Zerlegt eine Länge in Abschnitte (Start, Ende, überlappt) von höchstens target
+
+    Geschnitten wird in der letzten leeren Zeile der zweiten Hälfte des
+    Fensters; gibt es dort keine, endet der Abschnitt hart und der nächste
+    beginnt overlap Pixel früher.
+    """
+    length = len(blank)
+    segments = []
+    start, overlaps = 0, False
+    while length - start > target:
+        end = start + target
+        candidates = np.flatnonzero(blank[start + target // 2:end])
+        if candidates.size:
+            cut = start + target // 2 + int(candidates[-1])
+            segments.append((start, cut, overlaps))
+            start, overlaps = cut, False
+        else:
+            segments.append((start, end, overlaps))
+            start, overlaps = end - overlap, True
+    segments.append((start, length, overlaps))
+    return segments
+
+
+def split_tiles(image, settings=TILING_DEFAULTS):
+    """Zerlegt ein Bild in Kacheln in Lesereihenfolge: Spalten von links nach rechts, darin von oben nach unten
+
+    Jede Spalte wird vorher auf ihren Inhalt zugeschnitten; einfarbige
+    Kacheln (z.B. ein Monitor ohne Fenster) entfallen.
+    """
+    gray = np.asarray(image.convert("L"))
+    tolerance = settings["blank_tolerance"]
+    size = max(64, int(settings["tile_size"]))
+    overlap = max(0, min(int(settings["overlap"]), size // 4))
+    # ptp: Helligkeitsspanne je Spalte bzw. Zeile; einfarbige Zeilen (leer oder Trennlinie) sind gute Schnitte
+    blank_columns = np.ptp(gray, axis=0) <= tolerance
+    tiles = []
+    for left, right, _ in _segments(blank_columns, size, overlap):
+        box = crop_box(gray[:, left:right], tolerance, _CROP_PADDING)
+        if box is None:
+            continue
+        left, top, right, bottom = left + box[0], box[1], left + box[2], box[3]
+        band = gray[top:bottom, left:right]
+        blank_rows = np.ptp(band, axis=1) <= tolerance
+        band_start = True
+        for start, stop, overlaps in _segments(blank_rows, size, overlap):
+            if crop_box(band[start:stop], tolerance) is None:
+                continue
+            tile_box = (left, top + start, right, top + stop)
+            joiner = "" if not tiles else "\n\n" if band_start else "\n"
+            tiles.append(Tile(len(tiles), tile_box, image.crop(tile_box), overlaps and not band_start, joiner))
+            band_start = False
+    return TileSet(tiles, image.size)
+
+
+def _normalize_line(line):
+    return " ".join(line.split()).casefold()
+
+
+def strip_overlap(previous, text):
+    """Entfernt Zeilen am Anfang von text, die (fast) gleich schon am Ende von previous stehen"""
+    before = [_normalize_line(line) for line in previous.splitlines() if line.strip()][-_MAX_OVERLAP_LINES:]
+    lines = text.splitlines()
+    content = [i for i, line in enumerate(lines) if line.strip()][:_MAX_OVERLAP_LINES]
+    for count in range(min(len(before), len(content)), 0, -1):
+        if all(difflib.SequenceMatcher(None, before[len(before) - count + i],
+                                       _normalize_line(lines[content[i]])).ratio() >= _LINE_SIMILARITY
+               for i in range(count)):
+            return "\n".join(lines[content[count - 1] + 1:]).lstrip("\n")
+    return text
+
+
+# Kachel ohne Text (leerer Bildbereich): gilt als erledigt, TileMerger fügt für sie nichts ein.
+# Ein leerer String wäre für run_chunks ein Fehler und verwürfe das ganze Bild.
+TILE_BLANK = object()
+
+
+class TileMerger:
+    """Setzt die erkannten Texte Kachel für Kachel in Lesereihenfolge zusammen"""
+
+    def __init__(self):
+        self.previous = ""
+        self.started = False
+
+    def add(self, tile, text):
+        """Liefert den neuen Textteil für diese Kachel (ohne doppelte Zeilen aus der Überlappung)"""
+        text = text.strip()
+        if tile.overlaps:
+            text = strip_overlap(self.previous, text)
+        if not text:
+            return ""
+        piece = (tile.joiner if self.started else "") + text
+        self.previous, self.started = text, True
+        return piece
+
+
+def format_bytes(count):
+    """Lesbare Größe, z.B. '2.4 MB' oder '96 KB'"""
+    if count >= 1_000_000:
+        return f"{count / 1_000_000:.1f} MB"
+    return f"{max(1, round(count / 1000))} KB"
@@ -0,0 +1,226 @@
+"""
+Lokale Schnittstelle zu einer laufenden ClipGen-Instanz.
+
+Die GUI öffnet beim Start einen Unix-Socket (unter Windows eine Named Pipe)
+und legt Adresse und Schlüssel in IPC_PATH neben settings.json ab. Die
+Kommandozeile und ein zweiter Start von ClipGen.py leiten ihre Anfragen
+dorthin weiter: die Provider-Clients, der Cache und die Ratenlimits sind dort
+schon warm, eine Anfrage kostet nur noch die Antwortzeit des Providers.
+
+Protokoll: multiprocessing.connection (mit Schlüssel-Handshake), jede
+Nachricht ist ein JSON-Objekt. Anfrage {"method": ..., "params": {...}},
+Antwort {"ok": true, "result": ...} oder {"ok": false, "error": ...}.
+Eine Methode "x" wird als target.rpc_x(**params) ausgeführt.
+
+Dieses Modul verwendet nur die Standardbibliothek und ist schnell importiert.
+"""
+import json
+import logging
+import os
+import secrets
+import sys
+import tempfile
+import threading
+from multiprocessing.connection import AuthenticationError, Client, Listener
+
+logger = logging.getLogger('ClipGen')
+
+IPC_PATH = "ipc_state.json"
+
+IPC_DEFAULTS = {
+    # Schnittstelle für Kommandozeile und zweiten Start öffnen
+    "enabled": True,
+}
+
+
+class IpcError(Exception):
+    """Die laufende Instanz hat die Anfrage abgelehnt oder ist nicht mehr erreichbar"""
+
+
+def _new_address():
+    """(Familie, Adresse) mit zufälligem Namen; Unix-Sockets im privaten Laufzeitordner, falls vorhanden"""
+    name = f"clipgen-{secrets.token_hex(8)}"
+    if sys.platform == "win32":
+        return "AF_PIPE", rf"\\.\pipe\{name}"
+    folder = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return "AF_UNIX", os.path.join(folder, f"{name}.sock")
+
+
+def _encode(message):
+    return json.dumps(message, ensure_ascii=False).encode("utf-8")
+
+
+def _decode(data):
+    return json.loads(data.decode("utf-8"))
+
+
+class IpcServer:
+    """Beantwortet Anfragen lokaler Clients mit den rpc_*-Methoden von target
+
+    Jede Verbindung bekommt einen eigenen Thread; Anfragen verschiedener
+    Clients laufen also gleichzeitig, die Ratenlimits gelten wie bei Hotkeys.
+    """
+
+    def __init__(self, target, path=IPC_PATH):
+        self.target = target
+        self.path = path
+        self.family, self.address = _new_address()
+        self.authkey = secrets.token_bytes(32)
+        self._listener = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        try:
+            self._listener = Listener(self.address, self.family, authkey=self.authkey)
+        except OSError as e:
+            logger.warning(f"IPC-Schnittstelle nicht verfügbar: {e}")
+            return False
+        if self.family == "AF_UNIX":
+            os.chmod(self.address, 0o600)
+        self._write_state()
+        self._thread = threading.Thread(target=self._accept_loop, name="ClipGenIpc", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        if self._listener is None or self._stopped.is_set():
+            return
+        self._stopped.set()
+        try:
+            # accept() blockiert: mit einer eigenen Verbindung aufwecken
+            Client(self.address, self.family, authkey=self.authkey).close()
+        except (OSError, AuthenticationError):
+            pass
+        self._listener.close()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        self._remove_state()
+
+    def _write_state(self):
+        state = {"pid": os.getpid(), "family": self.family, "address": self.address,
+                 "authkey": self.authkey.hex()}
+        temp_path = f"{self.path}.tmp"
+        try:
+            # Der Schlüssel erlaubt Anfragen auf Kosten des API-Kontingents: nur für den Benutzer lesbar
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.error(f"IPC-Zustand konnte nicht gespeichert werden ({self.path}): {e}")
+
+    def _remove_state(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                ours = json.load(f).get("address") == self.address
+            if ours:
+                os.remove(self.path)
+        except (OSError, ValueError):
+            pass
+
+    def _accept_loop(self):
+        while not self._stopped.is_set():
+            try:
+                conn = self._listener.accept()
+            except AuthenticationError:
+                logger.warning("IPC: Verbindung mit falschem Schlüssel abgewiesen")
+                continue
+            except OSError:
+                if self._stopped.is_set():
+                    return
+                continue
+            if self._stopped.is_set():
+                conn.close()
+                return
+            threading.Thread(target=self._serve, args=(conn,), name="ClipGenIpcClient", daemon=True).start()
+
+    def _serve(self, conn):
+        with conn:
+            while not self._stopped.is_set():
+                try:
+                    request = _decode(conn.recv_bytes())
+                except (EOFError, OSError):
+                    return
+                except ValueError as e:
+                    response = {"ok": False, "error": f"Ungültige Anfrage: {e}"}
+                else:
+                    response = self._dispatch(request)
+                try:
+                    conn.send_bytes(_encode(response))
+                except OSError:
+                    return
+
+    def _dispatch(self, request):
+        method = request.get("method") if isinstance(request, dict) else None
+        handler = getattr(self.target, f"rpc_{method}", None) if isinstance(method, str) else None
+        if handler is None:
+            return {"ok": False, "error": f"Unbekannte Methode: {method}"}
+        try:
+            return {"ok": True, "result": handler(**request.get("params", {}))}
+        except Exception as e:
+            logger.debug(f"IPC {method}: {e}")
+            return {"ok": False, "error": str(e)}
+
+
+class IpcClient:
+    """Verbindung zur laufenden Instanz; eine Verbindung pro Thread"""
+
+    def __init__(self, family, address, authkey):
+        self.family = family
+        self.address = address
+        self.authkey = authkey
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def connect(cls, path=IPC_PATH):
+        """IpcClient, wenn eine Instanz läuft und antwortet, sonst None"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            client = cls(state["family"], state["address"], bytes.fromhex(state["authkey"]))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        try:
+            client.call("ping")
+        except IpcError:
+            # Übrig gebliebener Zustand einer beendeten Instanz
+            client.close()
+            return None
+        return client
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            try:
+                conn = Client(self.address, self.family, authkey=self.authkey)
+            except (OSError, AuthenticationError, EOFError) as e:
+                raise IpcError(f"ClipGen nicht erreichbar: {e}") from e
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def call(self, method, **params):
+        """Führt rpc_<method>(**params) in der laufenden Instanz aus und liefert das Ergebnis"""
+        conn = self._connection()
+        try:
+            conn.send_bytes(_encode({"method": method, "params": params}))
+            response = _decode(conn.recv_bytes())
+        except (OSError, EOFError) as e:
+            self._local.conn = None
+            raise IpcError(f"Verbindung zu ClipGen unterbrochen: {e}") from e
+        if not response.get("ok"):
+            raise IpcError(response.get("error") or "Unbekannter Fehler")
+        return response.get("result")
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except OSError:
+                pass
@@ -0,0 +1,131 @@
+"""
+Abbrechbare Aktivierungen.
+
+Jede laufende Aktivierung ist ein ActivationJob mit eigenem cancel_event.
+Esc, ein erneuter Druck auf denselben Hotkey oder die Tray-Aktion setzen
+es: Streams brechen beim nächsten Fragment ab, Wartezeiten (Ratenlimit,
+Backoff) enden sofort, und Aufrufe ohne sichtbare Ausgabe werden über
+run_cancellable verlassen, damit der Worker sofort wieder frei ist. Sie
+laufen dabei als gesammelter Stream mit demselben cancel_event, der
+verlassene Aufruf endet also beim nächsten Fragment.
+"""
+import itertools
+import logging
+import threading
+import time
+
+from libs.ClipGen_streaming import StreamCancelled
+
+logger = logging.getLogger('ClipGen')
+
+CANCEL_DEFAULTS = {
+    # Esc bricht alle laufenden Aktivierungen ab
+    "escape": True,
+    # Ein erneuter Druck auf den Hotkey bricht dessen laufende Aktivierung ab
+    "repeat_hotkey": True,
+}
+
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+
+# Prüfintervall für cancel_event, solange auf etwas nicht Abbrechbares gewartet wird (Sekunden)
+CANCEL_POLL_INTERVAL = 0.1
+
+
+class ActivationJob:
+    """Zustand einer laufenden Aktivierung"""
+    __slots__ = ("id", "action", "combo", "cancel_event", "state", "started_at")
+
+    def __init__(self, job_id, action, combo):
+        self.id = job_id
+        self.action = action
+        self.combo = combo
+        self.cancel_event = threading.Event()
+        self.state = RUNNING
+        self.started_at = time.monotonic()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+
+class JobTracker:
+    """Verwaltet die laufenden Aktivierungen und bricht sie auf Wunsch ab"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self.cancelled = 0
+
+    def start(self, action, combo=""):
+        with self._lock:
+            job = ActivationJob(next(self._ids), action, combo)
+            self._jobs[job.id] = job
+            return job
+
+    def finish(self, job):
+        """Entfernt den Job; liefert seinen Endzustand (DONE oder CANCELLED)"""
+        with self._lock:
+            self._jobs.pop(job.id, None)
+            job.state = CANCELLED if job.cancelled else DONE
+            return job.state
+
+    def cancel(self, action=None):
+        """Bricht die laufenden Jobs von action (None = alle) ab; liefert die betroffenen Jobs"""
+        with self._lock:
+            jobs = [job for job in self._jobs.values()
+                    if (action is None or job.action == action) and not job.cancelled]
+            for job in jobs:
+                job.cancel_event.set()
+            self.cancelled += len(jobs)
+        return jobs
+
+    def running(self, action=None):
+        with self._lock:
+            return [job for job in self._jobs.values() if action is None or job.action == action]
+
+    def stats(self):
+        with self._lock:
+            return {"running": len(self._jobs), "cancelled": self.cancelled}
+
+
+def wait_cancellable(event, cancel_event=None):
+    """Wartet, bis event gesetzt ist; wirft StreamCancelled, sobald cancel_event gesetzt wird"""
+    if cancel_event is None:
+        event.wait()
+        return
+    while not event.wait(CANCEL_POLL_INTERVAL):
+        if cancel_event.is_set():
+            raise StreamCancelled()
+
+
+def run_cancellable(func, cancel_event, name="ClipGenCall"):
+    """Führt func() in einem Hilfsthread aus und kehrt bei Abbruch sofort zurück
+
+    Für blockierende SDK-Aufrufe: func läuft im Hintergrund weiter, bis es
+    selbst endet, sein Ergebnis wird verworfen. func sollte daher ebenfalls
+    cancel_event beachten (z.B. über CollectSink), sonst verbraucht der
+    verlassene Aufruf weiter Kontingent. Wirft StreamCancelled.
+    """
+    done = threading.Event()
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = func()
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            done.set()
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+    wait_cancellable(done, cancel_event)
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
@@ -0,0 +1,119 @@
+"""
+Registry der Provider-Clients und Modell-Handles.
+
+Clients (und damit ihre HTTP-Verbindungspools) werden einmal pro API-Schlüssel
+bzw. Endpunkt erstellt, Gemini-Modelle und GenerationConfigs einmal pro
+Modell bzw. Parametersatz. Ändern sich Schlüssel oder Endpunkte, wird der
+betroffene Provider neu aufgebaut.
+
+Die SDKs werden erst beim ersten Aufruf eines Providers importiert: zusammen
+dauert ihr Import über eine Sekunde, und die Kommandozeile braucht meist nur
+einen von ihnen.
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger('ClipGen')
+
+# Obergrenze für gecachte GenerationConfigs (verschiedene Token-Budgets)
+MAX_GENERATION_CONFIGS = 64
+
+
+class ProviderRegistry:
+    """Hält Clients und Modell-Handles aller Provider"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._settings = {}
+        self._clients = {}
+        self._gemini_models = {}
+        self._generation_configs = OrderedDict()
+
+    def configure(self, config):
+        """Übernimmt Schlüssel/Endpunkte; geänderte Provider werden beim nächsten Aufruf neu aufgebaut"""
+        settings = {
+            "Gemini": (config.get("gemini_api_key", ""), config.get("gemini_api_endpoint", "")),
+            "Mistral": (config.get("mistral_api_key", ""), config.get("mistral_server_url", "")),
+            "Groq": (config.get("groq_api_key", ""), config.get("groq_base_url", "")),
+        }
+        with self._lock:
+            changed = [name for name, value in settings.items() if self._settings.get(name) != value]
+            for name in changed:
+                self._clients.pop(name, None)
+                if name == "Gemini":
+                    # Alte Handles gehören zum alten Client
+                    self._gemini_models.clear()
+                self._settings[name] = settings[name]
+        if changed:
+            logger.debug(f"Provider neu initialisiert: {', '.join(changed)}")
+        return changed
+
+    def has_client(self, provider):
+        return bool(self._settings.get(provider, ("",))[0])
+
+    def client(self, provider):
+        """Client des Providers (für Gemini das konfigurierte Modul genai) oder None ohne API-Schlüssel"""
+        client = self._clients.get(provider)
+        if client is None and self.has_client(provider):
+            with self._lock:
+                client = self._clients.get(provider)
+                if client is None:
+                    api_key, endpoint = self._settings[provider]
+                    client = self._clients[provider] = self._create(provider, api_key, endpoint)
+        return client
+
+    @staticmethod
+    def _create(provider, api_key, endpoint):
+        if provider == "Gemini":
+            import google.generativeai as genai
+            if endpoint:
+                # Eigener Endpunkt (z.B. lokaler Test-Server) nur über REST erreichbar
+                genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": endpoint})
+            else:
+                genai.configure(api_key=api_key)
+            return genai
+        if provider == "Mistral":
+            from mistralai import Mistral
+            return Mistral(api_key=api_key, server_url=endpoint or None)
+        from groq import Groq
+        # Wiederholungen übernimmt ResilientCaller, nicht der Client
+        return Groq(api_key=api_key, base_url=endpoint or None, max_retries=0)
+
+    @property
+    def mistral(self):
+        return self.client("Mistral")
+
+    @property
+    def groq(self):
+        return self.client("Groq")
+
+    def gemini_model(self, model):
+        """Wiederverwendbares GenerativeModel (hält nach dem ersten Aufruf seinen Client)"""
+        handle = self._gemini_models.get(model)
+        if handle is None:
+            genai = self.client("Gemini")
+            if genai is None:
+                raise RuntimeError("Gemini API key not configured")
+            with self._lock:
+                handle = self._gemini_models.get(model)
+                if handle is None:
+                    handle = genai.GenerativeModel(model)
+                    self._gemini_models[model] = handle
+        return handle
+
+    def generation_config(self, temperature=0.7, max_output_tokens=2048):
+        """GenerationConfig pro Parametersatz, begrenzt auf MAX_GENERATION_CONFIGS Einträge"""
+        key = (temperature, max_output_tokens)
+        config = self._generation_configs.get(key)
+        if config is None:
+            from google.generativeai import GenerationConfig
+            with self._lock:
+                config = self._generation_configs.get(key)
+                if config is None:
+                    config = GenerationConfig(temperature=temperature, max_output_tokens=max_output_tokens)
+                    self._generation_configs[key] = config
+                    if len(self._generation_configs) > MAX_GENERATION_CONFIGS:
+                        # Älteste Einträge zuerst verwerfen
+                        self._generation_configs.popitem(last=False)
+        return config
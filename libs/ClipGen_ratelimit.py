@@ -0,0 +1,302 @@
+"""
+Ratenbegrenzung und Tageskontingent pro Provider.
+
+Anfragen pro Minute und Tokens pro Minute werden über Token-Buckets
+begrenzt: ist ein Bucket leer, wartet die Anfrage, statt beim Provider in
+einen 429-Fehler zu laufen. Die Anfragen pro Tag werden in einer JSON-Datei
+mitgezählt, damit das Kontingent auch über Neustarts hinweg stimmt. Die GUI
+und model_test_suite.py teilen sich die Datei: beim Speichern wird sie
+gesperrt und jeder Prozess addiert nur seine neuen Anfragen.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+from libs.ClipGen_jobs import CANCEL_POLL_INTERVAL
+from libs.ClipGen_resilience import NotSent
+
+logger = logging.getLogger('ClipGen')
+
+# Kostenlose Kontingente (Stand der README); None = keine Grenze
+RATE_LIMIT_DEFAULTS = {
+    "Gemini": {"requests_per_minute": 15, "tokens_per_minute": 1000000, "requests_per_day": 1000},
+    "Mistral": {"requests_per_minute": 60, "tokens_per_minute": 500000, "requests_per_day": None},
+    "Groq": {"requests_per_minute": 30, "tokens_per_minute": 6000, "requests_per_day": 14400},
+}
+
+QUOTA_PATH = "quota_state.json"
+
+# Mindestabstand zwischen zwei Schreibvorgängen der Kontingentdatei (Sekunden)
+_SAVE_INTERVAL = 10
+
+
+class QuotaExhausted(NotSent):
+    """Das Tageskontingent des Providers ist aufgebraucht"""
+
+
+def _capacity(bucket):
+    return None if bucket is None else bucket.capacity
+
+
+@contextmanager
+def _file_lock(path):
+    """Sperrt path.lock prozessübergreifend, solange der Block läuft"""
+    with open(f"{path}.lock", "a+b") as f:
+        if sys.platform == "win32":
+            f.seek(0)
+            # LK_LOCK versucht es etwa 10 s lang und wirft dann OSError
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if sys.platform == "win32":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class TokenBucket:
+    """Füllt sich kontinuierlich mit rate Einheiten pro Sekunde bis capacity"""
+    __slots__ = ("capacity", "rate", "level", "updated")
+
+    def __init__(self, capacity, per_seconds=60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / per_seconds
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Sekunden, bis amount Einheiten verfügbar sind (nach refill)"""
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+
+class ProviderQuota:
+    """Buckets und Tageszähler eines Providers"""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, requests_per_day=None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.requests_per_day = requests_per_day
+        self.day = date.today().isoformat()
+        self.used_today = 0
+        # Anfragen seit dem letzten Speichern; nur sie werden zur Datei addiert
+        self.unsaved = 0
+        self.waiting = 0
+
+    def roll_day(self):
+        today = date.today().isoformat()
+        if today != self.day:
+            self.day = today
+            self.used_today = 0
+            self.unsaved = 0
+
+    def day_exhausted(self):
+        self.roll_day()
+        return self.requests_per_day is not None and self.used_today >= self.requests_per_day
+
+    def wait_time(self, tokens, now):
+        wait = 0.0
+        for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+            if bucket is not None:
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_time(amount))
+        return wait
+
+    def take(self, tokens):
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+        self.used_today += 1
+        self.unsaved += 1
+
+
+class RateLimiter:
+    """Reiht Anfragen pro Provider ein, bis Minuten- und Tageslimits es erlauben"""
+
+    def __init__(self, limits=None, path=QUOTA_PATH, on_stats=None):
+        self.path = path
+        self.on_stats = on_stats
+        self._cond = threading.Condition()
+        self._quotas = {}
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self.configure(limits)
+        self._load()
+
+    def configure(self, limits=None):
+        """Übernimmt neue Limits; die Tageszähler bleiben erhalten"""
+        merged = {provider: dict(values) for provider, values in RATE_LIMIT_DEFAULTS.items()}
+        for provider, values in (limits or {}).items():
+            merged.setdefault(provider, {}).update(values or {})
+        with self._cond:
+            for provider, values in merged.items():
+                quota = ProviderQuota(values.get("requests_per_minute"), values.get("tokens_per_minute"),
+                                      values.get("requests_per_day"))
+                current = self._quotas.get(provider)
+                if current is None:
+                    self._quotas[provider] = quota
+                else:
+                    # Bestehendes Objekt anpassen: wartende Anfragen halten eine Referenz darauf
+                    # Buckets nur bei geänderter Grenze ersetzen, sonst bliebe der Füllstand nicht erhalten
+                    if _capacity(current.requests) != _capacity(quota.requests):
+                        current.requests = quota.requests
+                    if _capacity(current.tokens) != _capacity(quota.tokens):
+                        current.tokens = quota.tokens
+                    current.requests_per_day = quota.requests_per_day
+            self._cond.notify_all()
+
+    def acquire(self, provider, tokens=1, cancel_event=None, timeout=None):
+        """Wartet, bis die Anfrage erlaubt ist; False bei erschöpftem Tageskontingent, Abbruch oder Frist"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            quota = self._quotas.get(provider)
+            if quota is None:
+                return True
+            granted = self._take_turn(provider, quota, tokens, cancel_event, deadline, block=False)
+        if granted is None:
+            # Die Anfrage muss warten: Anzeige aktualisieren (außerhalb der Sperre)
+            self._publish()
+            with self._cond:
+                granted = self._take_turn(provider, quota, tokens, cancel_event, deadline, block=True)
+            self._publish()
+        if granted and time.monotonic() - self._saved_at > _SAVE_INTERVAL:
+            self.save()
+        return granted
+
+    def exhausted(self, provider):
+        """Ist das Tageskontingent des Providers aufgebraucht?"""
+        with self._cond:
+            quota = self._quotas.get(provider)
+            return quota is not None and quota.day_exhausted()
+
+    def _take_turn(self, provider, quota, tokens, cancel_event, deadline, block):
+        # Aufrufer hält self._cond; None = müsste warten (nur bei block=False)
+        quota.waiting += block
+        try:
+            while True:
+                if quota.day_exhausted():
+                    logger.warning(f"{provider}: Tageskontingent von {quota.requests_per_day} Anfragen erschöpft")
+                    return False
+                now = time.monotonic()
+                wait = quota.wait_time(tokens, now)
+                if wait <= 0:
+                    quota.take(tokens)
+                    self._dirty = True
+                    return True
+                if not block:
+                    return None
+                if cancel_event is not None and cancel_event.is_set():
+                    return False
+                if deadline is not None:
+                    if now >= deadline:
+                        return False
+                    wait = min(wait, deadline - now)
+                if cancel_event is not None:
+                    # Abbruch regelmäßig prüfen
+                    wait = min(wait, CANCEL_POLL_INTERVAL)
+                self._cond.wait(wait)
+        finally:
+            quota.waiting -= block
+            if block:
+                # Nächste wartende Anfrage neu rechnen lassen
+                self._cond.notify_all()
+
+    def _publish(self):
+        if self.on_stats:
+            try:
+                self.on_stats()
+            except Exception as e:
+                logger.error(f"Fehler beim Aktualisieren der Kontingent-Anzeige: {e}")
+
+    def remaining(self):
+        """{Provider: {"today": genutzt, "per_day": Limit oder None, "waiting": n}}"""
+        with self._cond:
+            result = {}
+            for provider, quota in self._quotas.items():
+                quota.roll_day()
+                result[provider] = {"today": quota.used_today, "per_day": quota.requests_per_day,
+                                    "waiting": quota.waiting}
+            return result
+
+    def save(self):
+        """Addiert die neuen Anfragen zur Datei und übernimmt dabei die Zählung anderer Prozesse"""
+        with self._cond:
+            if not self._dirty or not self.path:
+                return
+            added = {provider: (quota.day, quota.unsaved) for provider, quota in self._quotas.items()}
+            for quota in self._quotas.values():
+                quota.unsaved = 0
+            self._dirty = False
+            self._saved_at = time.monotonic()
+        try:
+            with _file_lock(self.path):
+                data = self._read()
+                for provider, (day, count) in added.items():
+                    entry = data.get(provider)
+                    used = int(entry.get("used", 0)) if isinstance(entry, dict) and entry.get("day") == day else 0
+                    data[provider] = {"day": day, "used": used + count}
+                temp_path = f"{self.path}.tmp"
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=1)
+                os.replace(temp_path, self.path)
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"Kontingent konnte nicht gespeichert werden ({self.path}): {e}")
+            with self._cond:
+                # Beim nächsten Speichern erneut addieren
+                for provider, (day, count) in added.items():
+                    quota = self._quotas.get(provider)
+                    if quota is not None and quota.day == day:
+                        quota.unsaved += count
+                self._dirty = True
+            return
+        self._apply(data)
+
+    def _read(self):
+        """Inhalt der Kontingentdatei; {} ohne Datei"""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except ValueError as e:
+            logger.error(f"Kontingent konnte nicht gelesen werden ({self.path}): {e}")
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _apply(self, data):
+        """Übernimmt die Tageszähler aus der Datei (plus eigene, noch nicht gespeicherte Anfragen)"""
+        with self._cond:
+            for provider, entry in data.items():
+                quota = self._quotas.get(provider)
+                if quota is not None and isinstance(entry, dict) and entry.get("day") == quota.day:
+                    quota.used_today = int(entry.get("used", 0)) + quota.unsaved
+
+    def _load(self):
+        if not self.path:
+            return
+        try:
+            self._apply(self._read())
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"Kontingent konnte nicht geladen werden ({self.path}): {e}")
@@ -0,0 +1,251 @@
+"""
+Wiederholungen, Fristen und Circuit Breaker für Provider-Aufrufe.
+
+Vorübergehende Fehler (429, 5xx, abgebrochene Verbindungen, Timeouts) werden
+mit exponentiellem Backoff und Zufallsanteil wiederholt, solange die Frist
+des Hotkeys reicht. Häufen sich solche Fehler bei einem Provider, öffnet
+sein Circuit Breaker: weitere Anfragen scheitern sofort, bis nach einer
+Pause eine einzelne Probeanfrage wieder durchgelassen wird. Jeder Schritt
+wird als ResilienceEvent gemeldet.
+"""
+import logging
+import random
+import threading
+import time
+from collections import namedtuple
+
+from libs.ClipGen_streaming import StreamCancelled
+
+logger = logging.getLogger('ClipGen')
+
+RESILIENCE_DEFAULTS = {
+    # Gesamtfrist pro Anfrage in Sekunden (pro Hotkey über das Feld "timeout")
+    "deadline": 60,
+    "max_retries": 3,
+    # Backoff: zufällig zwischen 0 und min(backoff_max, backoff_base * 2^Versuch)
+    "backoff_base": 0.5,
+    "backoff_max": 8.0,
+    # Aufeinanderfolgende vorübergehende Fehler, nach denen der Breaker öffnet
+    "failure_threshold": 5,
+    # Sekunden bis zur ersten Probeanfrage
+    "reset_timeout": 30,
+}
+
+# kind: "retry", "circuit_open", "circuit_rejected", "circuit_closed", "deadline", "failed"
+ResilienceEvent = namedtuple("ResilienceEvent", "kind provider attempt delay error")
+
+# Namensbestandteile vorübergehender Verbindungsfehler der SDKs
+_TRANSIENT_NAMES = ("Timeout", "Connect", "Protocol", "NoResponse", "Transport")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """Der Provider gilt als gestört; die Anfrage wurde nicht gesendet"""
+
+
+class DeadlineExceeded(Exception):
+    """Die Frist der Anfrage ist abgelaufen"""
+
+
+class NotSent(Exception):
+    """Die Anfrage wurde lokal zurückgehalten (Ratenlimit, Tageskontingent) und nie gesendet
+
+    Sagt nichts über den Zustand des Providers: zählt für den Circuit Breaker
+    weder als Erfolg noch als Fehler.
+    """
+
+
+def status_code(error):
+    """HTTP-Status eines SDK-Fehlers (Groq/Mistral: status_code, google.api_core: code) oder None"""
+    for attribute in ("status_code", "code"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_retryable(error):
+    """Lohnt sich eine Wiederholung? (429, 5xx, Verbindungsabbruch, Timeout)"""
+    status = status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    # httpx/SDK-Fehler ohne Status: APIConnectionError, APITimeoutError, ReadTimeout,
+    # RemoteProtocolError, NoResponseError, ...
+    names = [klass.__name__ for klass in type(error).__mro__]
+    return any(word in name for name in names for word in _TRANSIENT_NAMES)
+
+
+def retry_after(error):
+    """Wartezeit aus dem Retry-After-Header der Antwort (Sekunden) oder None"""
+    response = getattr(error, "response", None) or getattr(error, "raw_response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """Zustände closed -> open -> half_open (eine Probeanfrage) -> closed"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def available(self):
+        """Würde allow() jetzt durchlassen? (ohne eine Probe zu verbrauchen)"""
+        with self._lock:
+            if self.state == OPEN:
+                return time.monotonic() - self.opened_at >= self.reset_timeout
+            return self.state == CLOSED or not self._probing
+
+    def allow(self):
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+                return True
+            return self.state == CLOSED
+
+    def record_success(self):
+        """Liefert True, wenn der Breaker dadurch wieder schließt"""
+        with self._lock:
+            reopened = self.state != CLOSED
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+            return reopened
+
+    def record_failure(self):
+        """Liefert True, wenn der Breaker dadurch öffnet"""
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def release(self):
+        """Probeanfrage ohne Ergebnis (z.B. abgebrochen) freigeben"""
+        with self._lock:
+            self._probing = False
+
+
+class ResilientCaller:
+    """Führt Provider-Aufrufe mit Frist, Wiederholungen und Breaker pro Provider aus"""
+
+    def __init__(self, on_event=None, **settings):
+        self.on_event = on_event
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self.configure(**settings)
+
+    def configure(self, deadline=60, max_retries=3, backoff_base=0.5, backoff_max=8.0,
+                  failure_threshold=5, reset_timeout=30):
+        self.deadline = deadline
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        with self._lock:
+            self.failure_threshold = failure_threshold
+            self.reset_timeout = reset_timeout
+            for breaker in self._breakers.values():
+                breaker.failure_threshold = max(1, int(failure_threshold))
+                breaker.reset_timeout = reset_timeout
+
+    def breaker(self, provider):
+        with self._lock:
+            breaker = self._breakers.get(provider)
+            if breaker is None:
+                breaker = self._breakers[provider] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    def available(self, provider):
+        return self.breaker(provider).available()
+
+    def call(self, provider, attempt, deadline=None, can_retry=None, cancel_event=None, admit=None):
+        """Ruft attempt(Restzeit in Sekunden) auf, bis es gelingt oder Frist/Versuche erschöpft sind
+
+        can_retry() kann Wiederholungen verhindern, z.B. wenn schon Text getippt wurde.
+        admit() wird vor jedem Versuch aufgerufen (z.B. Warten auf das
+        Ratenlimit); die Zeit darin verlängert die Frist, zählt also nicht
+        gegen den Provider. Es darf NotSent werfen.
+        Wirft CircuitOpen, DeadlineExceeded oder den letzten Fehler des Providers.
+        """
+        deadline_at = time.monotonic() + (self.deadline if deadline is None else deadline)
+        breaker = self.breaker(provider)
+        for number in range(self.max_retries + 1):
+            if not breaker.allow():
+                self._emit("circuit_rejected", provider, number)
+                raise CircuitOpen(f"{provider} ist vorübergehend gesperrt (Circuit Breaker offen)")
+            if admit is not None:
+                queued_at = time.monotonic()
+                try:
+                    admit()
+                except BaseException:
+                    breaker.release()
+                    raise
+                deadline_at += time.monotonic() - queued_at
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                breaker.release()
+                self._emit("deadline", provider, number)
+                raise DeadlineExceeded(f"Frist für {provider} abgelaufen")
+            try:
+                result = attempt(remaining)
+            except (StreamCancelled, NotSent):
+                breaker.release()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    # Der Provider hat geantwortet (z.B. 400), ist also erreichbar
+                    if breaker.record_success():
+                        self._emit("circuit_closed", provider, number)
+                    self._emit("failed", provider, number, error=e)
+                    raise
+                if breaker.record_failure():
+                    self._emit("circuit_open", provider, number, error=e)
+                if number == self.max_retries or (can_retry is not None and not can_retry()):
+                    self._emit("failed", provider, number, error=e)
+                    raise
+                delay = retry_after(e)
+                if delay is None:
+                    delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** number))
+                if time.monotonic() + delay >= deadline_at:
+                    self._emit("deadline", provider, number, error=e)
+                    raise DeadlineExceeded(f"Frist für {provider} abgelaufen: {e}") from e
+                self._emit("retry", provider, number + 1, delay, e)
+                if cancel_event is not None:
+                    if cancel_event.wait(delay):
+                        raise StreamCancelled()
+                else:
+                    time.sleep(delay)
+                continue
+            if breaker.record_success():
+                self._emit("circuit_closed", provider, number)
+            return result
+
+    def _emit(self, kind, provider, attempt, delay=0.0, error=None):
+        if self.on_event:
+            try:
+                self.on_event(ResilienceEvent(kind, provider, attempt, delay, error))
+            except Exception as e:
+                logger.error(f"Fehler bei der Meldung eines Provider-Ereignisses: {e}")
@@ -0,0 +1,204 @@
+"""
+Latenzbasierte automatische Provider-Wahl ("api_provider": "auto").
+
+Pro (Provider, Modell, Eingabegröße) werden Antwortzeit und Fehlerquote als
+exponentiell gleitende Mittel (EWMA) geführt. Jede Anfrage geht an den
+derzeit schnellsten gesunden Kandidaten aus der Liste des Hotkeys. Die
+Statistik wird in einer JSON-Datei gespeichert und beim Start geladen.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger('ClipGen')
+
+AUTO_PROVIDER = "auto"
+
+ROUTING_DEFAULTS = {
+    # Gewicht neuer Messwerte im gleitenden Mittel
+    "alpha": 0.3,
+    # Grenzen der Eingabegröße in Zeichen
+    "size_buckets": [200, 1000, 4000],
+    # Ab dieser Fehlerquote gilt ein Kandidat als gestört ...
+    "max_error_rate": 0.5,
+    # ... bis der letzte Fehler so viele Sekunden zurückliegt
+    "retry_after": 60,
+    "path": "routing_stats.json",
+}
+
+# Provider mit eigenem Client und eigener Modellliste
+PROVIDERS = ("Gemini", "Mistral", "Groq")
+
+# Provider, die Bilder verarbeiten können (das Modell muss Vision unterstützen)
+VISION_PROVIDERS = ("Gemini", "Mistral", "Groq")
+
+# Mindestabstand zwischen zwei Schreibvorgängen der Statistikdatei (Sekunden)
+_SAVE_INTERVAL = 30
+
+
+def format_candidates(candidates):
+    """Kandidatenliste als 'Provider/Modell, ...' für das Eingabefeld der Einstellungen"""
+    return ", ".join(f"{c.get('api_provider', 'Gemini')}/{c.get('model', '')}" for c in candidates)
+
+
+def parse_candidates(text):
+    """Gegenstück zu format_candidates; ValueError bei unbekanntem Provider oder fehlendem Modell
+
+    Modellnamen dürfen selbst '/' enthalten (z.B. meta-llama/...), getrennt wird am ersten.
+    """
+    candidates = []
+    for entry in filter(None, (part.strip() for part in text.split(","))):
+        provider, _, model = entry.partition("/")
+        provider, model = provider.strip(), model.strip()
+        if provider not in PROVIDERS or not model:
+            raise ValueError(f"Ungültiger Kandidat '{entry}', erwartet Provider/Modell mit Provider aus {', '.join(PROVIDERS)}")
+        candidates.append({"api_provider": provider, "model": model})
+    return candidates
+
+
+def size_bucket(text_length, is_image=False, limits=ROUTING_DEFAULTS["size_buckets"]):
+    """Bezeichnung der Größenklasse, z.B. '<=200', '>4000' oder 'image'"""
+    if is_image:
+        return "image"
+    for limit in limits:
+        if text_length <= limit:
+            return f"<={limit}"
+    return f">{limits[-1]}" if limits else "all"
+
+
+class RouteStats:
+    """Gleitende Mittel für einen (Provider, Modell, Größenklasse)-Eintrag"""
+    __slots__ = ("latency", "error_rate", "samples", "last_error")
+
+    def __init__(self, latency=None, error_rate=0.0, samples=0, last_error=0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.samples = samples
+        self.last_error = last_error
+
+    def update(self, seconds, ok, alpha):
+        self.samples += 1
+        self.error_rate += alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            self.latency = seconds if self.latency is None else self.latency + alpha * (seconds - self.latency)
+        else:
+            self.last_error = time.time()
+
+    def to_dict(self):
+        return {"latency": self.latency, "error_rate": self.error_rate,
+                "samples": self.samples, "last_error": self.last_error}
+
+
+class Router:
+    """Wählt den schnellsten gesunden Kandidaten und lernt aus jeder Anfrage"""
+
+    def __init__(self, path=ROUTING_DEFAULTS["path"], alpha=0.3, size_buckets=None, max_error_rate=0.5,
+                 retry_after=60):
+        self.path = path
+        self.alpha = alpha
+        self.size_buckets = list(size_buckets or ROUTING_DEFAULTS["size_buckets"])
+        self.max_error_rate = max_error_rate
+        self.retry_after = retry_after
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self._load()
+
+    def bucket(self, text_length, is_image=False):
+        return size_bucket(text_length, is_image, self.size_buckets)
+
+    def choose(self, candidates, text_length, is_image=False):
+        """Liefert (Provider, Modell) aus candidates oder None, wenn keiner passt
+
+        Kandidaten ohne Messwerte werden zuerst ausprobiert (in Listenreihenfolge),
+        danach gewinnt die kleinste erwartete Antwortzeit.
+        """
+        if is_image:
+            candidates = [c for c in candidates if c[0] in VISION_PROVIDERS]
+        if not candidates:
+            return None
+        bucket = self.bucket(text_length, is_image)
+        now = time.time()
+        best = None
+        fallback = None
+        with self._lock:
+            for index, (provider, model) in enumerate(candidates):
+                stats = self._estimate(provider, model, bucket)
+                if stats is None:
+                    return provider, model
+                # Erwartete Zeit inklusive Wiederholungen wegen Fehlern
+                score = stats.latency / max(0.05, 1.0 - stats.error_rate) if stats.latency else float("inf")
+                healthy = stats.error_rate < self.max_error_rate or now - stats.last_error > self.retry_after
+                key = (score, index)
+                if healthy and (best is None or key < best[0]):
+                    best = (key, (provider, model))
+                if fallback is None or (stats.error_rate, index) < fallback[0]:
+                    fallback = ((stats.error_rate, index), (provider, model))
+        # Sind alle gestört, den mit der geringsten Fehlerquote nehmen
+        return (best or fallback)[1]
+
+    def record(self, provider, model, text_length, is_image, seconds, ok):
+        key = (provider, model, self.bucket(text_length, is_image))
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = RouteStats()
+            stats.update(seconds, ok, self.alpha)
+            self._dirty = True
+            due = time.monotonic() - self._saved_at > _SAVE_INTERVAL
+        if due:
+            self.save()
+
+    def stats(self):
+        """Momentaufnahme: {(Provider, Modell, Klasse): dict}"""
+        with self._lock:
+            return {key: stats.to_dict() for key, stats in self._stats.items()}
+
+    def save(self):
+        with self._lock:
+            if not self._dirty or not self.path:
+                return
+            data = {"version": 1, "stats": [
+                {"provider": p, "model": m, "bucket": b, **stats.to_dict()}
+                for (p, m, b), stats in self._stats.items()
+            ]}
+            self._dirty = False
+            self._saved_at = time.monotonic()
+        try:
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.error(f"Routing-Statistik konnte nicht gespeichert werden ({self.path}): {e}")
+
+    def _estimate(self, provider, model, bucket):
+        # Aufrufer hält self._lock; ohne Messwerte in dieser Klasse das Mittel der übrigen
+        stats = self._stats.get((provider, model, bucket))
+        if stats is not None and stats.latency is not None:
+            return stats
+        others = [s for (p, m, _), s in self._stats.items() if p == provider and m == model and s.latency is not None]
+        if not others:
+            return stats
+        return RouteStats(
+            latency=sum(s.latency for s in others) / len(others),
+            error_rate=max(s.error_rate for s in others),
+            samples=sum(s.samples for s in others),
+            last_error=max(s.last_error for s in others),
+        )
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for entry in data.get("stats", []):
+                key = (entry["provider"], entry["model"], entry["bucket"])
+                self._stats[key] = RouteStats(entry.get("latency"), entry.get("error_rate", 0.0),
+                                              entry.get("samples", 0), entry.get("last_error", 0.0))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"Routing-Statistik konnte nicht geladen werden ({self.path}): {e}")
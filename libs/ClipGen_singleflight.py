@@ -0,0 +1,108 @@
+"""
+Zusammenlegen identischer Anfragen, die gleichzeitig laufen (single flight).
+
+Wird ein Hotkey doppelt ausgelöst, während dieselbe Anfrage (Provider,
+Modell, Prompt, Eingabe) noch läuft, geht nur eine Anfrage ans Netz. Die
+zweite Aktivierung wartet je nach Richtlinie auf dasselbe Ergebnis ("join")
+oder wird verworfen ("drop").
+"""
+import logging
+import threading
+from collections import namedtuple
+
+from libs.ClipGen_jobs import wait_cancellable
+from libs.ClipGen_streaming import StreamCancelled
+
+logger = logging.getLogger('ClipGen')
+
+JOIN = "join"
+DROP = "drop"
+DUPLICATE_POLICIES = (JOIN, DROP)
+
+# role: LEADER (hat die Anfrage ausgeführt), JOINED (Ergebnis übernommen), DROPPED (nichts getan)
+Flight = namedtuple("Flight", "result role")
+
+LEADER = "leader"
+JOINED = "joined"
+DROPPED = "dropped"
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Führt pro Schlüssel höchstens einen Aufruf gleichzeitig aus"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.joined = 0
+        self.dropped = 0
+
+    def run(self, key, func, policy=JOIN, cancel_event=None):
+        """Ruft func() auf oder hängt sich an einen laufenden Aufruf mit demselben Schlüssel
+
+        Liefert ein Flight. Ein Fehler des laufenden Aufrufs wird auch an die
+        angehängten Aufrufer weitergereicht. Wird cancel_event eines angehängten
+        Aufrufers gesetzt, hört nur er auf zu warten (StreamCancelled). Wird
+        dagegen der laufende Aufruf abgebrochen, übernimmt einer der
+        angehängten Aufrufer und führt func() selbst aus.
+        """
+        if policy not in DUPLICATE_POLICIES:
+            logger.warning(f"Unbekannte Richtlinie für doppelte Anfragen '{policy}', verwende {DROP}")
+            policy = DROP
+        counted = False
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is None:
+                    call = self._calls[key] = _Call()
+                    leader = True
+                    if counted:
+                        # Übernommen: es wurde doch kein Aufruf eingespart
+                        self.joined -= 1
+                else:
+                    leader = False
+                    if not counted:
+                        if policy == DROP:
+                            self.dropped += 1
+                        else:
+                            self.joined += 1
+                        counted = True
+            if leader:
+                break
+            if policy == DROP:
+                return Flight(None, DROPPED)
+            wait_cancellable(call.done, cancel_event)
+            if isinstance(call.error, StreamCancelled):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise StreamCancelled()
+                logger.debug("Laufender Aufruf wurde abgebrochen, angehängte Aktivierung übernimmt")
+                continue
+            if call.error is not None:
+                raise call.error
+            return Flight(call.result, JOINED)
+        try:
+            call.result = func()
+            return Flight(call.result, LEADER)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        with self._lock:
+            return {"saved": self.joined + self.dropped, "joined": self.joined, "dropped": self.dropped}
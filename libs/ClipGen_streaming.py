@@ -0,0 +1,180 @@
+"""
+Streaming-Ausgabe der Provider-Antworten.
+
+Die Provider-SDKs liefern Antworten als Fragmente; diese werden hier in
+reinen Text übersetzt und an eine austauschbare Senke (Log, Tippen,
+Einfügen am Ende) weitergereicht.
+"""
+import logging
+import time
+
+from libs.ClipGen_budget import estimate_tokens, stopped_at_limit
+
+logger = logging.getLogger('ClipGen')
+
+STREAM_OFF = "off"
+STREAM_MODES = (STREAM_OFF, "log", "type", "paste")
+
+
+class StreamCancelled(Exception):
+    """Die Antwort wird nicht mehr gebraucht (z.B. verlorene Hedge-Anfrage)"""
+
+
+class StreamSink:
+    """Basisklasse: erhält Fragmente, während der Provider noch generiert"""
+    # Soll handle_text_operation das Ergebnis am Ende einfügen?
+    pastes_result = True
+    # Wurde das Ergebnis bereits live im Log angezeigt?
+    logs_output = False
+    # threading.Event; ist es gesetzt, bricht der nächste write() den Stream ab
+    cancel_event = None
+    # Geschätzte Tokens, nach denen consume_stream die Antwort beendet (None = unbegrenzt)
+    token_limit = None
+    truncated = False
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.first_chunk_latency = None
+        self.chunks = 0
+
+    def write(self, chunk):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise StreamCancelled()
+        if self.first_chunk_latency is None:
+            self.first_chunk_latency = time.perf_counter() - self.started_at
+        self.chunks += 1
+        self.on_chunk(chunk)
+
+    def on_chunk(self, chunk):
+        pass
+
+    def close(self):
+        pass
+
+
+class PasteSink(StreamSink):
+    """Sammelt nur; das Ergebnis wird wie bisher am Ende eingefügt"""
+
+
+class CollectSink(StreamSink):
+    """Sammelt still mit; abbrechbar über cancel_event"""
+
+    def __init__(self, cancel_event=None):
+        super().__init__()
+        self.cancel_event = cancel_event
+
+
+class LogSink(StreamSink):
+    """Zeigt die Antwort live im Log-Tab an und fügt am Ende ein"""
+    logs_output = True
+
+    def __init__(self, emit):
+        super().__init__()
+        self.emit = emit
+
+    def on_chunk(self, chunk):
+        self.emit(chunk)
+
+
+class TypingSink(StreamSink):
+    """Tippt die Antwort fragmentweise in das aktive Fenster"""
+    pastes_result = False
+
+    def __init__(self, type_text):
+        super().__init__()
+        self.type_text = type_text
+
+    def on_chunk(self, chunk):
+        self.type_text(chunk)
+
+
+def consume_stream(chunks, sink):
+    """Leitet alle Fragmente an die Senke weiter und liefert den Gesamttext
+
+    Überschreitet die Antwort sink.token_limit, wird der Stream vorzeitig
+    beendet und sink.truncated gesetzt.
+    """
+    parts = []
+    limit = sink.token_limit
+    tokens = 0
+    try:
+        for chunk in chunks:
+            if chunk:
+                parts.append(chunk)
+                sink.write(chunk)
+                if limit is not None:
+                    tokens += estimate_tokens(chunk)
+                    if tokens >= limit:
+                        sink.truncated = True
+                        break
+    finally:
+        # Bei Abbruch den Generator schließen, damit die HTTP-Verbindung sofort freigegeben wird
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+        sink.close()
+    return "".join(parts)
+
+
+def close_stream(stream):
+    """Schließt die HTTP-Antwort eines SDK-Streams (Groq: close(), Mistral: response.close())"""
+    close = getattr(stream, "close", None) or getattr(getattr(stream, "response", None), "close", None)
+    if close is not None:
+        close()
+
+
+def flag_length_stop(sink, finish_reason):
+    """Setzt sink.truncated, wenn der Provider den Stream wegen max_tokens beendet hat"""
+    if sink is not None and stopped_at_limit(finish_reason):
+        sink.truncated = True
+
+
+def iter_gemini_chunks(response, sink=None):
+    """Fragmente aus generate_content(..., stream=True); sink: erhält truncated bei MAX_TOKENS"""
+    for chunk in response:
+        candidates = getattr(chunk, "candidates", None)
+        if candidates:
+            flag_length_stop(sink, getattr(candidates[0], "finish_reason", None))
+        try:
+            text = chunk.text
+        except ValueError:
+            # Fragmente ohne Text (z.B. nur finish_reason) überspringen
+            continue
+        if text:
+            yield text
+
+
+def iter_openai_chunks(stream, sink=None):
+    """Fragmente aus einem OpenAI-kompatiblen Stream (Groq); sink: erhält truncated bei finish_reason length"""
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            flag_length_stop(sink, chunk.choices[0].finish_reason)
+            text = chunk.choices[0].delta.content
+            if text:
+                yield text
+    finally:
+        close_stream(stream)
+
+
+def iter_mistral_chunks(stream, sink=None):
+    """Fragmente aus mistral_client.chat.stream(...); sink: erhält truncated bei finish_reason length"""
+    try:
+        for event in stream:
+            choices = event.data.choices
+            if not choices:
+                continue
+            flag_length_stop(sink, choices[0].finish_reason)
+            content = choices[0].delta.content
+            if isinstance(content, str):
+                if content:
+                    yield content
+            elif content:
+                # Neuere SDK-Versionen liefern Listen von Text-Chunks
+                for part in content:
+                    text = getattr(part, "text", None)
+                    if text:
+                        yield text
+    finally:
+        close_stream(stream)
@@ -5,15 +5,17 @@ from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
                           QTextBrowser, QTabWidget, QLineEdit, QTextEdit, QLabel, QScrollArea,
                           QFrame, QDialog, QColorDialog, QComboBox, QKeySequenceEdit, QMessageBox,
-                          QSizeGrip, QSystemTrayIcon, QMenu)
+                          QSizeGrip, QSystemTrayIcon, QMenu, QCheckBox)
 from PyQt5.QtGui import QTextCursor, QColor, QIcon
 from PyQt5.QtCore import QTimer, Qt, pyqtSignal, QPoint, QSize
-
-import pyperclip
+from libs.ClipGen_routing import AUTO_PROVIDER, PROVIDERS, format_candidates, parse_candidates
 
 class ClipGenView(QMainWindow):
     log_signal = pyqtSignal(str, str)  # Сигнал для логирования: сообщение, цвет
+    stats_signal = pyqtSignal(str)  # Сигнал для строки статистики под логами
+    stream_signal = pyqtSignal(str, str)  # Сигнал для потокового вывода: фрагмент, цвет
     quit_signal = pyqtSignal()
+    show_signal = pyqtSignal()  # Сигнал для показа окна из другого потока (повторный запуск)
 
     def __init__(self):
         super().__init__()
@@ -63,8 +65,13 @@ class ClipGenView(QMainWindow):
         tray_menu = QMenu()
         show_action = tray_menu.addAction("Anzeigen")
         show_action.triggered.connect(self.showNormal)
+        self.cancel_action = tray_menu.addAction("Laufende Anfragen abbrechen")
+        self.cancel_action.triggered.connect(lambda: self.cancel_jobs() if hasattr(self, 'cancel_jobs') else None)
         quit_action = tray_menu.addAction("Beenden")
         quit_action.triggered.connect(self.quit_app)
+        # Abbrechen nur anbieten, wenn etwas läuft oder wartet
+        tray_menu.aboutToShow.connect(
+            lambda: self.cancel_action.setEnabled(self.has_jobs() if hasattr(self, 'has_jobs') else True))
         self.tray_icon.setContextMenu(tray_menu)
 
         self.tray_icon.activated.connect(self.on_tray_icon_activated)
@@ -83,6 +90,7 @@ class ClipGenView(QMainWindow):
         
         # Логи с цветами через сигналы
         self.log_signal.connect(self.append_log)
+        self.stream_signal.connect(self.append_stream)
         
         # Обновление кнопок при изменении размера
         self.resize_timer = QTimer()
@@ -304,7 +312,7 @@ class ClipGenView(QMainWindow):
         log_actions.addWidget(clear_logs)
 
         copy_logs = QPushButton("Копировать логи")
-        copy_logs.clicked.connect(lambda: pyperclip.copy(self.log_area.toPlainText()))
+        copy_logs.clicked.connect(lambda: self.clipboard.set_text(self.log_area.toPlainText()))
         copy_logs.setStyleSheet("""
             QPushButton {
                 background-color: #333333;
@@ -324,7 +332,13 @@ class ClipGenView(QMainWindow):
         log_actions.addWidget(copy_logs)
         log_actions.addStretch()
 
+        # Строка статистики (очередь, ожидание и т.д.)
+        self.stats_label = QLabel("")
+        self.stats_label.setStyleSheet("color: #888888; font-size: 11px; padding: 4px 2px;")
+        self.stats_label.setWordWrap(True)
+
         self.log_layout.addWidget(self.log_area)
+        self.log_layout.addWidget(self.stats_label)
         self.log_layout.addLayout(log_actions)
         self.tabs.addTab(self.log_tab, "Логи")
 
@@ -682,7 +696,8 @@ class ClipGenView(QMainWindow):
             provider_model_layout.setSpacing(8)
             
             provider_combo = QComboBox()
-            provider_combo.addItems(["Gemini", "Mistral", "Groq"])
+            # "auto": schnellster gesunder Eintrag aus dem Feld "candidates"
+            provider_combo.addItems([*PROVIDERS, AUTO_PROVIDER])
             provider_combo.setCurrentText(hotkey.get("api_provider", "Gemini"))
             provider_combo.setMaximumHeight(28)
             provider_combo.setMaximumWidth(120)
@@ -733,22 +748,41 @@ class ClipGenView(QMainWindow):
                 }
             """)
             
+            # "auto" hat keine eigenen Modelle, stattdessen die Kandidatenliste bearbeiten
+            candidates_input = QLineEdit(format_candidates(hotkey.get("candidates", [])))
+            candidates_input.setPlaceholderText("Groq/llama-3.1-8b-instant, Gemini/gemini-2.0-flash")
+            candidates_input.setToolTip("Kandidaten für 'auto': Provider/Modell, durch Kommas getrennt")
+            candidates_input.setMaximumHeight(28)
+            candidates_input.setStyleSheet(name_input.styleSheet())
+            model_label = QLabel("Modell:")
+            
             def update_models(provider_name, idx=i):
                 available = self.config.get("available_models", {})
                 models = available.get(provider_name, [])
                 self.model_combos[f"model_{idx}"].clear()
                 self.model_combos[f"model_{idx}"].addItems(models)
+                show_candidates(provider_name, idx)
+            
+            def show_candidates(provider_name, idx=i):
+                auto = provider_name == AUTO_PROVIDER
+                self.model_combos[f"model_{idx}"].setVisible(not auto)
+                self.hotkey_inputs[f"candidates_{idx}"].setVisible(auto)
+                self.hotkey_inputs[f"model_label_{idx}"].setText("Kandidaten:" if auto else "Modell:")
             
             provider_combo.currentTextChanged.connect(update_models)
             
             provider_model_layout.addWidget(QLabel("Provider:"), 0)
             provider_model_layout.addWidget(provider_combo, 0)
-            provider_model_layout.addWidget(QLabel("Modell:"), 0)
+            provider_model_layout.addWidget(model_label, 0)
             provider_model_layout.addWidget(model_combo, 1)
+            provider_model_layout.addWidget(candidates_input, 1)
             
             hotkey_layout.addLayout(provider_model_layout)
             self.provider_combos[f"provider_{i}"] = provider_combo
             self.model_combos[f"model_{i}"] = model_combo
+            self.hotkey_inputs[f"candidates_{i}"] = candidates_input
+            self.hotkey_inputs[f"model_label_{i}"] = model_label
+            show_candidates(provider_combo.currentText())
             
             # === PROMPT ===
             prompt_label = QLabel("Prompt:")
@@ -798,6 +832,20 @@ class ClipGenView(QMainWindow):
                 }
             """)
             
+            stream_combo = QComboBox()
+            stream_combo.addItems(["off", "log", "type", "paste"])
+            stream_combo.setCurrentText(hotkey.get("stream", "off"))
+            stream_combo.setToolTip("Streaming: off = aus, log = live im Log, type = direkt tippen, paste = am Ende einfügen")
+            stream_combo.setMaximumHeight(28)
+            stream_combo.setMaximumWidth(80)
+            stream_combo.wheelEvent = lambda event: None  # Deaktiviert das Mausrad
+            stream_combo.setStyleSheet(type_combo.styleSheet())
+            
+            cache_check = QCheckBox("Cache")
+            cache_check.setChecked(hotkey.get("cache", True))
+            cache_check.setToolTip("Antworten für gleichen Text wiederverwenden (für zufällige Prompts abschalten)")
+            cache_check.setStyleSheet("color: #CCCCCC; font-size: 11px;")
+            
             color_input = QLineEdit(hotkey.get("log_color", "#FFFFFF"))
             color_input.setMaximumHeight(28)
             color_input.setMaximumWidth(100)
@@ -846,6 +894,9 @@ class ClipGenView(QMainWindow):
             
             footer_layout.addWidget(QLabel("Typ:"), 0)
             footer_layout.addWidget(type_combo, 0)
+            footer_layout.addWidget(QLabel("Stream:"), 0)
+            footer_layout.addWidget(stream_combo, 0)
+            footer_layout.addWidget(cache_check, 0)
             footer_layout.addWidget(QLabel("Farbe:"), 0)
             footer_layout.addWidget(color_input, 0)
             footer_layout.addWidget(color_btn, 0)
@@ -871,6 +922,8 @@ class ClipGenView(QMainWindow):
             
             hotkey_layout.addLayout(footer_layout)
             self.hotkey_inputs[f"type_{i}"] = type_combo
+            self.hotkey_inputs[f"stream_{i}"] = stream_combo
+            self.hotkey_inputs[f"cache_{i}"] = cache_check
             self.hotkey_inputs[f"color_{i}"] = color_input
             
             # Add separator between hotkeys
@@ -993,13 +1046,7 @@ class ClipGenView(QMainWindow):
         # Перезагружаем настройки
         self.reload_settings_tab()
         
-        # Обновляем key_states для отслеживания новой комбинации
-        self.key_states = {key["combination"].lower(): False for key in self.config["hotkeys"]}
-        self.key_states["ctrl"] = False
-        self.key_states["alt"] = False
-        self.key_states["shift"] = False
-        
-        # Сохраняем настройки
+        # Сохраняем настройки (таблица горячих клавиш перекомпилируется при сохранении)
         self.save_settings()
         
         # Обновляем обработчик логов с новыми цветами
@@ -1077,11 +1124,7 @@ class ClipGenView(QMainWindow):
             self.update_buttons()
             self.reload_settings_tab()
             
-            # Key-Status aktualisieren
-            self.key_states = {key["combination"].lower(): False for key in self.config["hotkeys"]}
-            self.key_states.update({"ctrl": False, "alt": False, "shift": False})
-            
-            # Einstellungen speichern
+            # Einstellungen speichern (kompiliert auch die Hotkey-Tabelle neu)
             self.save_settings()
 
     def move_hotkey_up(self, idx):
@@ -1228,7 +1271,7 @@ class ClipGenView(QMainWindow):
             # Это сообщение о времени выполнения
             self.log_area.setTextColor(QColor("#888888"))
             self.log_area.append(f"    {msg}")
-        elif any(f"{hotkey['combination']}: {hotkey['name']}" in msg for hotkey in self.config["hotkeys"]):
+        elif self.hotkey_registry.by_label(msg.rsplit(" - ", 1)[0]) is not None:
             # Это заголовок действия
             self.log_area.setTextColor(QColor(color))
             
@@ -1259,6 +1302,13 @@ class ClipGenView(QMainWindow):
         # Прокрутка вниз
         self.log_area.ensureCursorVisible()
 
+    def append_stream(self, chunk, color):
+        # Фрагмент потокового ответа дописывается в текущую строку без перевода строки
+        self.log_area.moveCursor(QTextCursor.End)
+        self.log_area.setTextColor(QColor(color))
+        self.log_area.insertPlainText(chunk)
+        self.log_area.ensureCursorVisible()
+
     def toggle_maximize(self):
         if self.isMaximized():
             self.showNormal()
@@ -1413,6 +1463,11 @@ class ClipGenView(QMainWindow):
             self.showNormal()
             self.activateWindow()
 
+    def bring_to_front(self):
+        self.showNormal()
+        self.raise_()
+        self.activateWindow()
+
     def closeEvent(self, event):
         event.ignore()
         self.hide()
@@ -1425,30 +1480,42 @@ class ClipGenView(QMainWindow):
     def save_settings_from_ui(self):
         """Speichert die Einstellungen aus der UI in settings.json"""
         try:
-            # API-Keys speichern
-            self.config["gemini_api_key"] = self.gemini_input.text() if hasattr(self, 'gemini_input') else ""
-            self.config["mistral_api_key"] = self.mistral_input.text() if hasattr(self, 'mistral_input') else ""
-            self.config["groq_api_key"] = self.groq_input.text() if hasattr(self, 'groq_input') else ""
+            # API-Keys einlesen
+            api_keys = {
+                "gemini_api_key": self.gemini_input.text() if hasattr(self, 'gemini_input') else "",
+                "mistral_api_key": self.mistral_input.text() if hasattr(self, 'mistral_input') else "",
+                "groq_api_key": self.groq_input.text() if hasattr(self, 'groq_input') else "",
+            }
 
-            # Hotkeys speichern
-            self.config["hotkeys"] = []
+            # Hotkeys speichern (Felder ohne UI-Element bleiben erhalten)
+            old_hotkeys = self.config.get("hotkeys", [])
+            hotkeys = []
             i = 0
             while f"name_{i}" in self.hotkey_inputs:
-                hotkey = {
+                hotkey = dict(old_hotkeys[i]) if i < len(old_hotkeys) else {}
+                hotkey.update({
                     "name": self.hotkey_inputs[f"name_{i}"].text(),
                     "combination": self.hotkey_inputs[f"combination_{i}"].keySequence().toString(),
                     "prompt": self.hotkey_inputs[f"prompt_{i}"].toPlainText(),
                     "api_provider": self.provider_combos[f"provider_{i}"].currentText(),
                     "model": self.model_combos[f"model_{i}"].currentText(),
                     "type": self.hotkey_inputs[f"type_{i}"].currentText(),
+                    "stream": self.hotkey_inputs[f"stream_{i}"].currentText(),
+                    "cache": self.hotkey_inputs[f"cache_{i}"].isChecked(),
                     "log_color": self.hotkey_inputs[f"color_{i}"].text()
-                }
-                self.config["hotkeys"].append(hotkey)
+                })
+                if hotkey["api_provider"] == AUTO_PROVIDER:
+                    hotkey["candidates"] = parse_candidates(self.hotkey_inputs[f"candidates_{i}"].text())
+                    if not hotkey["candidates"]:
+                        raise ValueError(f"Hotkey '{hotkey['name']}': 'auto' braucht mindestens einen Kandidaten")
+                hotkeys.append(hotkey)
                 i += 1
+            # Erst nach erfolgreicher Prüfung aller Felder übernehmen, sonst bleibt die Konfiguration unverändert
+            self.config.update(api_keys)
+            self.config["hotkeys"] = hotkeys
 
-            # Einstellungen speichern
-            with open("settings.json", "w", encoding="utf-8") as f:
-                json.dump(self.config, f, ensure_ascii=False, indent=4)
+            # Einstellungen speichern und Hotkey-Tabelle neu kompilieren
+            self.save_settings()
 
             # API-Clients mit den neuen Einstellungen neu initialisieren
             if hasattr(self, 'init_api_clients'):
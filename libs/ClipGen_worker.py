@@ -0,0 +1,186 @@
+"""
+Begrenzter Worker-Pool für Hotkey-Aktivierungen.
+
+Ersetzt den früheren Thread pro Aktivierung: eine feste Anzahl Worker,
+optionale Limits pro Provider und eine begrenzte Warteschlange mit
+expliziter Überlaufstrategie.
+"""
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+
+logger = logging.getLogger('ClipGen')
+
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_REJECT = "reject"
+OVERFLOW_COALESCE = "coalesce"
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_REJECT, OVERFLOW_COALESCE)
+
+WORKER_POOL_DEFAULTS = {
+    "max_workers": 4,
+    "max_pending": 16,
+    "overflow_policy": OVERFLOW_DROP_OLDEST,
+    "provider_limits": {},
+}
+
+Job = namedtuple("Job", "key provider func args enqueued_at")
+
+
+class WorkerPool:
+    """Feste Anzahl Worker-Threads mit begrenzter Warteschlange"""
+
+    def __init__(self, max_workers=4, max_pending=16, overflow_policy=OVERFLOW_DROP_OLDEST,
+                 provider_limits=None, on_stats=None):
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._threads = []
+        self._active = {}
+        self._running = 0
+        self._stopped = False
+        self.on_stats = on_stats
+
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.coalesced = 0
+        self.cancelled = 0
+        self.max_depth = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+        self.configure(max_workers, max_pending, overflow_policy, provider_limits)
+
+    def configure(self, max_workers=4, max_pending=16, overflow_policy=OVERFLOW_DROP_OLDEST, provider_limits=None):
+        """Übernimmt neue Limits; bereits laufende Jobs werden nicht unterbrochen"""
+        if overflow_policy not in OVERFLOW_POLICIES:
+            logger.warning(f"Unbekannte Überlaufstrategie '{overflow_policy}', verwende {OVERFLOW_DROP_OLDEST}")
+            overflow_policy = OVERFLOW_DROP_OLDEST
+
+        with self._cond:
+            self.max_workers = max(1, int(max_workers))
+            self.max_pending = max(1, int(max_pending))
+            self.overflow_policy = overflow_policy
+            self.provider_limits = {k: max(1, int(v)) for k, v in (provider_limits or {}).items()}
+
+            # Threads werden nur ergänzt; das globale Limit prüft _next_job
+            while len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._run, name=f"ClipGenWorker-{len(self._threads)}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._cond.notify_all()
+
+    def submit(self, key, provider, func, *args):
+        """Reiht einen Job ein; liefert False, wenn er verworfen wurde"""
+        with self._cond:
+            if self._stopped:
+                return False
+            self.submitted += 1
+
+            if self.overflow_policy == OVERFLOW_COALESCE and any(job.key == key for job in self._pending):
+                self.coalesced += 1
+                logger.info(f"[{key}] Bereits in der Warteschlange, Aktivierung zusammengeführt")
+                accepted = False
+            elif len(self._pending) >= self.max_pending and self.overflow_policy == OVERFLOW_REJECT:
+                self.rejected += 1
+                logger.warning(f"[{key}] Очередь переполнена, активация отклонена")
+                accepted = False
+            else:
+                if len(self._pending) >= self.max_pending:
+                    dropped = self._pending.popleft()
+                    self.dropped += 1
+                    logger.warning(f"[{dropped.key}] Очередь переполнена, старая активация отброшена")
+                self._pending.append(Job(key, provider, func, args, time.monotonic()))
+                self.max_depth = max(self.max_depth, len(self._pending))
+                self._cond.notify()
+                accepted = True
+
+        self._publish()
+        return accepted
+
+    def stats(self):
+        """Momentaufnahme der Zähler"""
+        with self._cond:
+            started = self.completed + self._running
+            return {
+                "pending": len(self._pending),
+                "running": self._running,
+                "max_depth": self.max_depth,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "dropped": self.dropped,
+                "rejected": self.rejected,
+                "coalesced": self.coalesced,
+                "cancelled": self.cancelled,
+                "wait_avg_ms": (self.wait_total / started * 1000) if started else 0.0,
+                "wait_max_ms": self.wait_max * 1000,
+            }
+
+    def cancel(self, key=None):
+        """Entfernt wartende Jobs mit diesem Schlüssel (None = alle); liefert ihre Anzahl"""
+        with self._cond:
+            kept = deque(job for job in self._pending if key is not None and job.key != key)
+            removed = len(self._pending) - len(kept)
+            self._pending = kept
+            self.cancelled += removed
+        if removed:
+            self._publish()
+        return removed
+
+    def shutdown(self, wait=False, timeout=1.0):
+        """Beendet die Worker; wartende Jobs werden verworfen"""
+        with self._cond:
+            self._stopped = True
+            self._pending.clear()
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join(timeout)
+
+    def _next_job(self):
+        # Aufrufer hält self._cond
+        if self._running >= self.max_workers:
+            return None
+        for i, job in enumerate(self._pending):
+            limit = self.provider_limits.get(job.provider)
+            if limit is None or self._active.get(job.provider, 0) < limit:
+                del self._pending[i]
+                return job
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                job = self._next_job() if not self._stopped else None
+                while job is None and not self._stopped:
+                    self._cond.wait()
+                    job = self._next_job()
+                if self._stopped:
+                    return
+                self._running += 1
+                self._active[job.provider] = self._active.get(job.provider, 0) + 1
+                waited = time.monotonic() - job.enqueued_at
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+            self._publish()
+            try:
+                job.func(*job.args)
+            except Exception as e:
+                logger.error(f"[{job.key}] Fehler im Worker: {e}")
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    self._active[job.provider] -= 1
+                    self.completed += 1
+                    # Ein freier Platz kann Jobs anderer Provider freigeben
+                    self._cond.notify_all()
+                self._publish()
+
+    def _publish(self):
+        if self.on_stats:
+            try:
+                self.on_stats()
+            except Exception as e:
+                logger.error(f"Fehler beim Aktualisieren der Statistik: {e}")
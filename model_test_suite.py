@@ -8,13 +8,16 @@ import google.generativeai as genai
 from mistralai import Mistral
 from groq import Groq
 from PIL import Image
+from libs.ClipGen_budget import estimate_tokens
+from libs.ClipGen_ratelimit import QUOTA_PATH, RateLimiter
 
 # --- Konfiguration ---
 SETTINGS_FILE = "settings.json"
 IMAGE_PATH = "test_images/image.png"
 PROMPT = "Extrahiere den gesamten Text aus diesem Bild. Gib ausschließlich den transkribierten Text zurück, ohne zusätzliche Kommentare oder Formatierungen."
 CSV_OUTPUT_FILE = "model_test_results.csv"
-REQUEST_PAUSE_SECONDS = 20
+# Grobe Token-Schätzung für ein Bild (zählt gegen das Tokens-pro-Minute-Limit)
+IMAGE_TOKEN_ESTIMATE = 1000
 
 # --- Hilfsfunktionen ---
 
@@ -49,6 +52,26 @@ def write_to_csv(writer, provider, model, prompt, response):
     writer.writerow([timestamp, provider, model, full_prompt, cleaned_response])
     print(f"  - Ergebnis für {model} gespeichert.")
 
+def create_rate_limiter():
+    """Erstellt den Ratenbegrenzer mit den Limits aus der Einstellungsdatei (wie in ClipGen)."""
+    try:
+        with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
+            limits = json.load(f).get("rate_limits")
+    except (FileNotFoundError, ValueError):
+        limits = None
+    return RateLimiter(limits, QUOTA_PATH)
+
+def wait_for_quota(limiter, provider):
+    """Wartet, bis das Minutenlimit die nächste Anfrage erlaubt; False bei erschöpftem Tageskontingent."""
+    start = time.perf_counter()
+    allowed = limiter.acquire(provider, estimate_tokens(PROMPT) + IMAGE_TOKEN_ESTIMATE)
+    waited = time.perf_counter() - start
+    if waited >= 1:
+        print(f"  - {waited:.0f} Sekunden auf das Ratenlimit gewartet.")
+    if not allowed:
+        print(f"  - Tageskontingent für {provider} erschöpft, überspringe die restlichen Modelle.")
+    return allowed
+
 # --- Intelligente Filterfunktionen ---
 
 def get_gemini_models(client):
@@ -119,6 +142,8 @@ def main():
     print("-" * 40)
 
 
+    limiter = create_rate_limiter()
+
     with open(CSV_OUTPUT_FILE, 'w', newline='', encoding='utf-8') as csvfile:
         csv_writer = csv.writer(csvfile)
         csv_writer.writerow(["Zeitstempel", "Anbieter", "Modell", "Prompt", "Antwort"])
@@ -130,6 +155,8 @@ def main():
                 image = Image.open(IMAGE_PATH)
                 for model_name in all_models_to_test["Gemini"]:
                     print(f"Teste Modell: {model_name}...")
+                    if not wait_for_quota(limiter, "Gemini"):
+                        break
                     try:
                         model = genai.GenerativeModel(model_name)
                         response = model.generate_content([PROMPT, image])
@@ -137,8 +164,6 @@ def main():
                     except Exception as e:
                         result = f"FEHLER: {e}"
                     write_to_csv(csv_writer, "Gemini", model_name, PROMPT, result)
-                    print(f"Warte {REQUEST_PAUSE_SECONDS} Sekunden...")
-                    time.sleep(REQUEST_PAUSE_SECONDS)
             except Exception as e:
                 print(f"FEHLER während der Gemini-Tests: {e}")
 
@@ -150,6 +175,8 @@ def main():
                 base64_image = encode_image_to_base64(IMAGE_PATH)
                 for model_name in all_models_to_test["Mistral"]:
                     print(f"Teste Modell: {model_name}...")
+                    if not wait_for_quota(limiter, "Mistral"):
+                        break
                     try:
                         messages = [{"role": "user", "content": [{"type": "text", "text": PROMPT}, {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_image}"}}]}]
                         response = mistral_client.chat.complete(model=model_name, messages=messages)
@@ -157,8 +184,6 @@ def main():
                     except Exception as e:
                         result = f"FEHLER: {e}"
                     write_to_csv(csv_writer, "Mistral", model_name, PROMPT, result)
-                    print(f"Warte {REQUEST_PAUSE_SECONDS} Sekunden...")
-                    time.sleep(REQUEST_PAUSE_SECONDS)
             except Exception as e:
                 print(f"FEHLER während der Mistral-Tests: {e}")
 
@@ -170,17 +195,18 @@ def main():
                 base64_image = encode_image_to_base64(IMAGE_PATH)
                 for model_name in all_models_to_test["Groq"]:
                     print(f"Teste Modell: {model_name}...")
+                    if not wait_for_quota(limiter, "Groq"):
+                        break
                     try:
                         chat_completion = groq_client.chat.completions.create(messages=[{"role": "user", "content": [{"type": "text", "text": PROMPT}, {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{base64_image}"}}]}], model=model_name)
                         result = chat_completion.choices[0].message.content.strip()
                     except Exception as e:
                         result = f"FEHLER: {e}"
                     write_to_csv(csv_writer, "Groq", model_name, PROMPT, result)
-                    print(f"Warte {REQUEST_PAUSE_SECONDS} Sekunden...")
-                    time.sleep(REQUEST_PAUSE_SECONDS)
             except Exception as e:
                 print(f"FEHLER während der Groq-Tests: {e}")
 
+    limiter.save()
     print(f"\nTest-Suite abgeschlossen. Ergebnisse wurden in '{CSV_OUTPUT_FILE}' gespeichert.")
 
 if __name__ == "__main__":